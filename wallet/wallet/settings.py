@@ -54,41 +54,176 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'walletstatus.middleware.UserProfileMiddleware',
+    'walletstatus.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'wallet.urls'
 
+# Compiled templates are kept in memory outside of DEBUG
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'walletstatus.context_processors.currency',
             ],
         },
     },
 ]
 
+# A cache shared by every worker process: redis://host:6379/0 (needs redis),
+# memcached://host:11211 (needs pymemcache) or db://<table> (run createcachetable).
+# Without one, each process keeps its own in-memory cache.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }}
+elif CACHE_URL.startswith('db://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': CACHE_URL.removeprefix('db://') or 'wallet_cache',
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHE = bool(CACHE_URL)
+
+# Sessions are read from the cache and only fall back to the database on a miss.
+# A per-process cache would keep serving a session another worker logged out,
+# so without a shared cache they stay in the database.
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db',
+)
+
+# request.profile is cached this long and dropped whenever the profile is saved (see walletstatus.profiles);
+# 0, the default without a shared cache, reads it once per request instead
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', 60 * 60 if SHARED_CACHE else 0))
+
+# Per-user dashboard panel fragments, keyed on data versions (see walletstatus.fragments)
+TEMPLATE_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('TEMPLATE_FRAGMENT_CACHE_TIMEOUT', 60 * 60))
+
 WSGI_APPLICATION = 'wallet.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DATABASE_ENGINE selects the backend ('sqlite' or 'postgresql'). Connections are
+# kept open for DATABASE_CONN_MAX_AGE seconds and health-checked before reuse.
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', '60'))
+
+# Applied on every new SQLite connection: WAL lets readers run alongside the
+# single writer, synchronous=NORMAL is durable under WAL with far fewer fsyncs,
+# mmap_size serves reads from the page cache, and busy_timeout makes writers
+# wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
 }
 
+if DATABASE_ENGINE == 'postgresql':
+    DATABASE_POOL = os.getenv('DATABASE_POOL', 'true').lower() == 'true'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'wallet'),
+            'USER': os.getenv('DATABASE_USER', 'wallet'),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', 'localhost'),
+            'PORT': os.getenv('DATABASE_PORT', '5432'),
+            # The psycopg pool manages connection reuse itself, which Django
+            # requires to be combined with CONN_MAX_AGE = 0.
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', '10')),
+                    'timeout': int(os.getenv('DATABASE_POOL_TIMEOUT', '10')),
+                },
+            } if DATABASE_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {key}={value}' for key, value in SQLITE_PRAGMAS.items()),
+                # Take the write lock at BEGIN so busy_timeout applies, rather than
+                # failing when a read transaction later tries to upgrade.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Optional read replica for reporting views (analytics, dashboard aggregates,
+# admin changelists). Set DATABASE_REPLICA_NAME (SQLite file) or
+# DATABASE_REPLICA_HOST (PostgreSQL) to enable it. For SQLite,
+# `manage.py sync_replica` copies the primary into the replica file.
+DATABASE_REPLICA_NAME = os.getenv('DATABASE_REPLICA_NAME')
+DATABASE_REPLICA_HOST = os.getenv('DATABASE_REPLICA_HOST')
+if DATABASE_REPLICA_NAME or DATABASE_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DATABASE_REPLICA_NAME or DATABASES['default']['NAME'],
+        'HOST': DATABASE_REPLICA_HOST or DATABASES['default'].get('HOST', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Transactions can be partitioned by user across several databases (see
+# walletstatus.shards). DATABASE_SHARDS adds that many shard databases, named
+# shard0, shard1, ... (SQLite files next to the default one, or PostgreSQL
+# databases with the suffix); migrate each with `manage.py migrate --database`.
+# TRANSACTION_SHARDS lists the databases on the hash ring, all shards by default.
+DATABASE_SHARDS = int(os.getenv('DATABASE_SHARDS', '0'))
+SHARD_ALIASES = [f'shard{index}' for index in range(DATABASE_SHARDS)]
+for alias in SHARD_ALIASES:
+    if DATABASE_ENGINE == 'postgresql':
+        shard_name = f"{DATABASES['default']['NAME']}_{alias}"
+    else:
+        shard_name = f"{os.path.splitext(DATABASES['default']['NAME'])[0]}_{alias}.sqlite3"
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': shard_name}
+TRANSACTION_SHARDS = os.getenv('TRANSACTION_SHARDS', ','.join(SHARD_ALIASES) or 'default').split(',')
+# Threads fanning cross-shard queries out (0 runs them one after another)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '8'))
+# Pins set by rebalance_shards are cached this long. Every worker has to see a
+# pin as soon as it changes, so without a shared cache (CACHE_URL) they are read
+# from the database each time (0).
+SHARD_PLACEMENT_CACHE_TIMEOUT = int(os.getenv('SHARD_PLACEMENT_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0))
+
+DATABASE_ROUTERS = ['walletstatus.shards.ShardRouter', 'walletstatus.routers.ReadReplicaRouter']
+
+# After a write, keep the user's reads on the primary for this many seconds
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,14 +260,71 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Hashed file names (see walletstatus.storage); run `manage.py collectstatic` on deploy
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'walletstatus.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Compressed variants written next to each hashed text asset; 'br' needs brotli
+STATIC_PRECOMPRESSION = os.getenv('STATIC_PRECOMPRESSION', 'gzip').split(',')
+
+# Serve STATIC_ROOT from Django (precompressed, far-future cached) when no front-end server does
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'false').lower() == 'true'
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', str(365 * 24 * 60 * 60)))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Currency used when a user has no profile; FX rates are loaded with `manage.py load_fx_rates`
+DEFAULT_CURRENCY = 'USD'
+
+# Months of history used to project savings goals, see walletstatus/projections.py
+SAVINGS_PROJECTION_LOOKBACK_MONTHS = 3
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+# Point at a local stand-in (e.g. `manage.py fake_openai`) for load testing
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Advisor job queue, see walletstatus/advisor.py
+AI_ADVISOR_JOB_MAX_ATTEMPTS = int(os.getenv('AI_ADVISOR_JOB_MAX_ATTEMPTS', '4'))
+AI_ADVISOR_JOB_BACKOFF = float(os.getenv('AI_ADVISOR_JOB_BACKOFF', '2'))  # seconds, doubled per retry
+AI_ADVISOR_JOB_LEASE = int(os.getenv('AI_ADVISOR_JOB_LEASE', '300'))  # seconds before a running job is reclaimed
+
+# Conversation history sent with each advisor prompt, see walletstatus/conversation.py
+AI_ADVISOR_HISTORY_TURNS = int(os.getenv('AI_ADVISOR_HISTORY_TURNS', '10'))
+AI_ADVISOR_PROMPT_TOKEN_BUDGET = int(os.getenv('AI_ADVISOR_PROMPT_TOKEN_BUDGET', '3000'))
+AI_ADVISOR_SUMMARY_TOKENS = int(os.getenv('AI_ADVISOR_SUMMARY_TOKENS', '300'))
+
+# AIConversation retention, see walletstatus/retention.py and
+# `manage.py archive_conversations`. Days of inactivity after which a
+# conversation is moved to compressed archive rows, per conversation type.
+AI_CONVERSATION_RETENTION_DAYS = {
+    'default': int(os.getenv('AI_CONVERSATION_RETENTION_DAYS', '90')),
+    'general': int(os.getenv('AI_CONVERSATION_RETENTION_DAYS_GENERAL', '30')),
+}
+AI_CONVERSATION_ARCHIVE_CHUNK_SIZE = 500  # conversations per transaction
+AI_CONVERSATION_ARCHIVE_COMPRESSION = os.getenv('AI_CONVERSATION_ARCHIVE_COMPRESSION', 'gzip')  # or 'zstd' (needs zstandard)
+
+# Per-endpoint throttles, see walletstatus/throttling.py
+THROTTLES = {
+    'ai_advisor': {
+        'capacity': int(os.getenv('AI_ADVISOR_BURST', '5')),
+        'refill_per_second': float(os.getenv('AI_ADVISOR_REQUESTS_PER_MINUTE', '10')) / 60,
+        'max_concurrent_per_user': int(os.getenv('AI_ADVISOR_MAX_CONCURRENT_PER_USER', '1')),
+        'max_concurrent_global': int(os.getenv('AI_ADVISOR_MAX_CONCURRENT', '8')),
+        'slot_ttl': 120,
+    },
+}
 
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
@@ -147,6 +339,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ]
 }
+# Seconds before an Idempotency-Key claimed by a request that never finished may be claimed again
+IDEMPOTENCY_CLAIM_TIMEOUT = int(os.getenv('IDEMPOTENCY_CLAIM_TIMEOUT', '300'))
 
 # Media files
 MEDIA_URL = '/media/'
@@ -156,4 +350,36 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
-LOGIN_REDIRECT_URL = '/dashboard/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/dashboard/'
+# Uploads are streamed to a temporary file in chunks instead of being held in memory
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+# Receipt images, processed off the request by `manage.py process_receipts`
+RECEIPT_MAX_UPLOAD_BYTES = int(os.getenv('RECEIPT_MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+RECEIPT_MAX_DIMENSION = int(os.getenv('RECEIPT_MAX_DIMENSION', '2048'))  # px, longest edge of the stored copy
+RECEIPT_THUMBNAIL_SIZES = [int(size) for size in os.getenv('RECEIPT_THUMBNAIL_SIZES', '160,640').split(',')]
+RECEIPT_JPEG_QUALITY = int(os.getenv('RECEIPT_JPEG_QUALITY', '82'))
+RECEIPT_WORKERS = int(os.getenv('RECEIPT_WORKERS', str(min(4, os.cpu_count() or 1))))
+RECEIPT_MAX_ATTEMPTS = int(os.getenv('RECEIPT_MAX_ATTEMPTS', '3'))
+RECEIPT_RETRY_BACKOFF = float(os.getenv('RECEIPT_RETRY_BACKOFF', '5'))  # seconds, doubled per retry
+RECEIPT_LEASE = int(os.getenv('RECEIPT_LEASE', '120'))  # seconds before a processing receipt is reclaimed
+
+# In-memory category suggestions (walletstatus/categorizer.py)
+CATEGORIZER_MIN_CONFIDENCE = float(os.getenv('CATEGORIZER_MIN_CONFIDENCE', '0.8'))  # to auto-fill imported rows
+CATEGORIZER_USER_WEIGHT = float(os.getenv('CATEGORIZER_USER_WEIGHT', '5'))  # a user's own history vs everyone's
+CATEGORIZER_MAX_USERS = int(os.getenv('CATEGORIZER_MAX_USERS', '256'))  # per-user models kept per worker
+# The model of everyone's history, written by `manage.py train_categorizer`
+CATEGORIZER_MODEL_PATH = os.getenv('CATEGORIZER_MODEL_PATH', str(BASE_DIR / 'categorizer.npz'))
+CATEGORIZER_GLOBAL_REFRESH = int(os.getenv('CATEGORIZER_GLOBAL_REFRESH', '60'))  # seconds between checks for a newer one
+
+# Streaming detection of unusual spending (walletstatus/anomalies.py)
+ANOMALY_Z_THRESHOLD = float(os.getenv('ANOMALY_Z_THRESHOLD', '3'))  # standard deviations above the recent average
+ANOMALY_MIN_COUNT = int(os.getenv('ANOMALY_MIN_COUNT', '5'))  # earlier expenses in a category before flagging
+ANOMALY_EWMA_ALPHA = float(os.getenv('ANOMALY_EWMA_ALPHA', '0.1'))  # weight of the newest expense in the average
+
+# Monthly statements written by `manage.py generate_statements` (walletstatus/statements.py)
+STATEMENT_WORKERS = int(os.getenv('STATEMENT_WORKERS', str(os.cpu_count() or 1)))  # processes; 0 runs in-process
+STATEMENT_CHUNK_SIZE = int(os.getenv('STATEMENT_CHUNK_SIZE', '200'))  # users per task and grouped query
+
+# Threads for the concurrent reads of async views (walletstatus/aio.py); 0 runs them one after another
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', '8'))
@@ -1,10 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.utils.html import format_html
 from .models import (
-    UserProfile, Category, Transaction, Budget, SavingsGoal,
-    JobOpportunity, UserJobApplication, AIConversation
+    UserProfile, Category, Transaction, Budget, SavingsGoal, GoalContribution,
+    JobOpportunity, UserJobApplication, AIConversation, AdvisorJob, ConversationArchive,
+    ExchangeRate, Receipt, ShardPlacement, SpendingStats, SpendingAnomaly, Statement
 )
+from . import shards
+from .retention import decode_turns, decompress, full_contexts
+from .routers import use_replica
 
 # Unregister the default User admin and register our custom one
 admin.site.unregister(User)
@@ -25,9 +30,26 @@ class CustomUserAdmin(UserAdmin):
         except UserProfile.DoesNotExist:
             return "No Profile"
     get_user_type.short_description = 'User Type'
+    
+    def get_inline_instances(self, request, obj=None):
+        # a new user's profile is created by the post_save signal; edit it afterwards
+        return super().get_inline_instances(request, obj) if obj is not None else []
 
 admin.site.register(User, CustomUserAdmin)
 
+class ReplicaChangelistMixin:
+    """Serve changelist page loads from the read replica"""
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET' or getattr(request, 'use_primary', True):
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            # Render inside the block; TemplateResponse would otherwise run the
+            # result-list queries after routing has been reset
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'user_type', 'monthly_income', 'currency', 'preferred_savings_percentage', 'created_at')
@@ -65,27 +87,30 @@ class CategoryAdmin(admin.ModelAdmin):
     )
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'description', 'amount', 'transaction_type', 'category', 'date', 'created_at')
-    list_filter = ('transaction_type', 'category', 'date', 'is_recurring', 'created_at')
-    search_fields = ('user__username', 'description', 'notes', 'location')
+class TransactionAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'description', 'amount', 'currency', 'transaction_type', 'category', 'date', 'created_at')
+    list_filter = ('transaction_type', 'currency', 'category', 'category_auto', 'date', 'is_recurring', 'created_at')
+    # no joins: rows may sit on shards while users and categories stay on default
+    list_select_related = ()
+    search_fields = ('description', 'notes', 'location')
     date_hierarchy = 'date'
     ordering = ('-date', '-created_at')
-    readonly_fields = ('transaction_id', 'created_at', 'updated_at')
+    readonly_fields = ('transaction_id', 'fingerprint', 'created_at', 'updated_at')
+    raw_id_fields = ('receipt',)
     
     fieldsets = (
         ('Transaction Details', {
-            'fields': ('user', 'amount', 'transaction_type', 'category', 'description', 'date')
+            'fields': ('user', 'amount', 'currency', 'transaction_type', 'category', 'category_auto', 'description', 'date')
         }),
         ('Additional Information', {
-            'fields': ('location', 'notes', 'receipt_image')
+            'fields': ('location', 'notes', 'receipt', 'receipt_image')
         }),
         ('Recurring Settings', {
             'fields': ('is_recurring', 'recurring_frequency'),
             'classes': ('collapse',)
         }),
         ('System Information', {
-            'fields': ('transaction_id', 'created_at', 'updated_at'),
+            'fields': ('transaction_id', 'fingerprint', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         })
     )
@@ -94,9 +119,29 @@ class TransactionAdmin(admin.ModelAdmin):
         if obj:  # editing an existing object
             return self.readonly_fields + ('user',)
         return self.readonly_fields
+    
+    def get_queryset(self, request):
+        # the changelist, lookups by id and bulk actions gather from every shard in parallel
+        return super().get_queryset(request).across_shards().prefetch_related('user', 'category')
+    
+    def get_list_display(self, request):
+        if shards.enabled():
+            return self.list_display + ('shard',)
+        return self.list_display
+    
+    def get_search_results(self, request, queryset, search_term):
+        matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # match usernames on default instead of joining auth_user
+        user_ids = list(User.objects.filter(username__icontains=search_term).values_list('pk', flat=True)) if search_term else []
+        if user_ids:
+            matches = matches | queryset.filter(user_id__in=user_ids)
+        return matches, may_have_duplicates
+    
+    def shard(self, obj):
+        return obj._state.db
 
 @admin.register(Budget)
-class BudgetAdmin(admin.ModelAdmin):
+class BudgetAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'category', 'amount', 'period', 'start_date', 'end_date', 'is_active', 'get_usage_percentage')
     list_filter = ('period', 'is_active', 'category', 'start_date')
     search_fields = ('user__username', 'category__name')
@@ -129,8 +174,8 @@ class BudgetAdmin(admin.ModelAdmin):
     get_usage_percentage.short_description = 'Usage %'
 
 @admin.register(SavingsGoal)
-class SavingsGoalAdmin(admin.ModelAdmin):
-    list_display = ('user', 'name', 'target_amount', 'current_amount', 'target_date', 'status', 'priority', 'get_progress_percentage')
+class SavingsGoalAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'name', 'target_amount', 'current_amount', 'target_date', 'status', 'priority', 'get_progress_percentage', 'get_monthly_target')
     list_filter = ('status', 'priority', 'target_date', 'created_at')
     search_fields = ('user__username', 'name', 'description')
     date_hierarchy = 'target_date'
@@ -156,6 +201,29 @@ class SavingsGoalAdmin(admin.ModelAdmin):
     def get_progress_percentage(self, obj):
         return f"{obj.get_progress_percentage()}%"
     get_progress_percentage.short_description = 'Progress %'
+    
+    def get_monthly_target(self, obj):
+        # Served from the per-user batch projection cache, not recomputed per row
+        return obj.get_monthly_target()
+    get_monthly_target.short_description = 'Monthly target'
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj:  # existing goals change current_amount through contributions only
+            return self.readonly_fields + ('current_amount',)
+        return self.readonly_fields
+
+@admin.register(GoalContribution)
+class GoalContributionAdmin(admin.ModelAdmin):
+    list_display = ('goal', 'amount', 'date', 'note', 'created_at')
+    list_filter = ('date',)
+    search_fields = ('goal__name', 'goal__user__username', 'note')
+    date_hierarchy = 'date'
+    ordering = ('-date', '-pk')
+    readonly_fields = ('goal', 'amount', 'date', 'created_at')
+    
+    def has_add_permission(self, request):
+        # Contributions must go through SavingsGoal.add_contribution to keep current_amount in sync
+        return False
 
 @admin.register(JobOpportunity)
 class JobOpportunityAdmin(admin.ModelAdmin):
@@ -219,18 +287,28 @@ class UserJobApplicationAdmin(admin.ModelAdmin):
     )
 
 @admin.register(AIConversation)
-class AIConversationAdmin(admin.ModelAdmin):
+class AIConversationAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'conversation_type', 'truncated_message', 'created_at')
     list_filter = ('conversation_type', 'created_at')
     search_fields = ('user__username', 'user_message', 'ai_response')
     date_hierarchy = 'created_at'
     ordering = ('-created_at',)
-    readonly_fields = ('conversation_id', 'created_at')
+    readonly_fields = ('conversation_id', 'created_at', 'context_data', 'full_context')
     
     def truncated_message(self, obj):
         return obj.user_message[:50] + "..." if len(obj.user_message) > 50 else obj.user_message
     truncated_message.short_description = 'User Message'
     
+    def full_context(self, obj):
+        # rows store only what changed since the previous turn
+        if obj.pk is None:
+            return obj.context_data
+        turns = AIConversation.objects.filter(
+            user_id=obj.user_id, conversation_id=obj.conversation_id, created_at__lte=obj.created_at,
+        ).order_by('created_at').values_list('context_data', flat=True)
+        return full_contexts(turns)[-1]
+    full_context.short_description = 'Full context'
+    
     fieldsets = (
         ('Conversation Details', {
             'fields': ('user', 'conversation_type', 'conversation_id')
@@ -239,7 +317,7 @@ class AIConversationAdmin(admin.ModelAdmin):
             'fields': ('user_message', 'ai_response')
         }),
         ('Context Data', {
-            'fields': ('context_data',),
+            'fields': ('full_context', 'context_data'),
             'classes': ('collapse',)
         }),
         ('Timestamp', {
@@ -248,6 +326,106 @@ class AIConversationAdmin(admin.ModelAdmin):
         })
     )
 
+@admin.register(AdvisorJob)
+class AdvisorJobAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'conversation_type', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'conversation_type', 'created_at')
+    search_fields = ('user__username', 'user_message')
+    ordering = ('-created_at',)
+    readonly_fields = ('job_id', 'conversation_id', 'created_at', 'updated_at')
+
+@admin.register(ConversationArchive)
+class ConversationArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'conversation_id', 'turn_count', 'compression', 'first_message_at', 'last_message_at')
+    list_filter = ('compression', 'last_message_at')
+    search_fields = ('user__username', 'conversation_id')
+    ordering = ('-last_message_at',)
+    exclude = ('payload',)
+    readonly_fields = ('user', 'conversation_id', 'turn_count', 'compression', 'first_message_at', 'last_message_at', 'created_at', 'archived_turns')
+    
+    def archived_turns(self, obj):
+        turns = decode_turns(decompress(bytes(obj.payload), obj.compression))
+        return "\n\n".join(f"[{t['created_at']:%Y-%m-%d %H:%M}] {t['user_message']}\n→ {t['ai_response']}" for t in turns)
+    archived_turns.short_description = 'Turns'
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('date', 'currency', 'per_usd')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+    ordering = ('-date', 'currency')
+
+@admin.register(Receipt)
+class ReceiptAdmin(admin.ModelAdmin):
+    list_display = ('thumbnail', 'sha256', 'status', 'width', 'height', 'upload_bytes', 'stored_bytes', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('sha256',)
+    ordering = ('-created_at',)
+    readonly_fields = (
+        'thumbnail', 'sha256', 'upload', 'image', 'thumbnails', 'width', 'height',
+        'upload_bytes', 'stored_bytes', 'attempts', 'error', 'created_at', 'updated_at'
+    )
+    
+    def thumbnail(self, obj):
+        if not obj.thumbnail_url:
+            return '-'
+        return format_html('<img src="{}" alt="" height="48">', obj.thumbnail_url)
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ShardPlacement)
+class ShardPlacementAdmin(admin.ModelAdmin):
+    list_display = ('user', 'alias', 'moved_at')
+    list_filter = ('alias',)
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'alias', 'moved_at')
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(SpendingStats)
+class SpendingStatsAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'category', 'currency', 'count', 'mean', 'std', 'ewma', 'updated_at')
+    list_filter = ('currency',)
+    search_fields = ('user__username', 'category__name')
+    list_select_related = ('user', 'category')
+    readonly_fields = ('user', 'category', 'currency', 'count', 'mean', 'm2', 'ewma', 'updated_at')
+    
+    def std(self, obj):
+        return round((obj.m2 / (obj.count - 1)) ** 0.5, 1) if obj.count > 1 else None
+    std.short_description = 'Std dev'
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(SpendingAnomaly)
+class SpendingAnomalyAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'description', 'amount', 'expected', 'currency', 'score', 'category', 'date')
+    list_filter = ('currency', 'date')
+    search_fields = ('user__username', 'description')
+    list_select_related = ('user', 'category')
+    date_hierarchy = 'date'
+    readonly_fields = (
+        'user', 'transaction_id', 'category', 'description', 'amount_minor', 'currency',
+        'expected_minor', 'score', 'date', 'created_at'
+    )
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Statement)
+class StatementAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'month', 'transaction_count', 'csv_file', 'pdf_file', 'generated_at')
+    list_filter = ('month',)
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    date_hierarchy = 'month'
+    readonly_fields = ('user', 'month', 'signature', 'transaction_count', 'csv_file', 'pdf_file', 'generated_at')
+    
+    def has_add_permission(self, request):
+        return False
+
 # Customize admin site
 admin.site.site_header = "FinanceAI Administration"
 admin.site.site_title = "FinanceAI Admin"
@@ -0,0 +1,169 @@
+"""AI financial advisor: prompt building, model calls and the job queue worker.
+
+The advisor view only enqueues an AdvisorJob; `manage.py run_advisor_worker`
+claims pending jobs, calls the model with retries and exponential backoff,
+and stores the answer as an AIConversation. The concurrency caps of
+THROTTLES['ai_advisor'] are applied around the model calls here, however
+many workers run; the view's own slots only cover enqueueing.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import llm, retention
+from .throttling import call_slots
+from .conversation import build_messages
+from .models import (
+    Transaction, Budget, SavingsGoal, AIConversation, AdvisorJob
+)
+from .profiles import get_profile
+
+logger = logging.getLogger(__name__)
+
+
+def build_financial_context(user):
+    """Gather the user's financial context and the system prompt built from it"""
+    user_profile = get_profile(user.pk)
+    
+    recent_transactions_count = Transaction.objects.filter(user=user)[:10].count()
+    active_budgets_count = Budget.objects.filter(user=user, is_active=True).count()
+    savings_goals_count = SavingsGoal.objects.filter(user=user, status='active').count()
+    
+    financial_context = {
+        'user_type': user_profile.user_type,
+        'monthly_income': float(user_profile.monthly_income),
+        'currency': user_profile.currency,
+        'savings_percentage': user_profile.preferred_savings_percentage,
+        'recent_transactions_count': recent_transactions_count,
+        'active_budgets_count': active_budgets_count,
+        'savings_goals_count': savings_goals_count,
+    }
+    
+    system_prompt = f"""You are a helpful financial advisor AI. The user is a {user_profile.get_user_type_display()} 
+    with a monthly income of {user_profile.monthly_income} {user_profile.currency}. 
+    They prefer to save {user_profile.preferred_savings_percentage}% of their income.
+    
+    They have {recent_transactions_count} recent transactions, {active_budgets_count} active budgets, 
+    and {savings_goals_count} savings goals.
+    
+    Provide practical, personalized financial advice. Be concise but helpful. 
+    If they're a student, also consider recommending ways to increase income through part-time work or skills development."""
+    
+    return financial_context, system_prompt
+
+
+def get_completion(messages):
+    """Call the chat model and return the reply text"""
+    response = llm.client().chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=messages,
+        max_tokens=500,
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+
+def enqueue(user, user_message, conversation_type='general', conversation_id=None):
+    """Queue an advisor request, continuing ``conversation_id`` when given, and return the job"""
+    job = AdvisorJob(
+        user=user,
+        user_message=user_message,
+        conversation_type=conversation_type,
+    )
+    if conversation_id:
+        job.conversation_id = conversation_id
+    job.save()
+    return job
+
+
+def claim_next_job(user_ids=None):
+    """Atomically claim the oldest runnable job (of ``user_ids`` only, when given), or return None.
+    
+    Jobs left 'running' past AI_ADVISOR_JOB_LEASE seconds belong to a worker
+    that died and are claimed again. The claim is a conditional UPDATE, so
+    several workers can poll the same table safely on any database.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.AI_ADVISOR_JOB_LEASE)
+    runnable = AdvisorJob.objects.filter(
+        Q(status='pending', run_after__lte=now) | Q(status='running', updated_at__lt=stale)
+    )
+    if user_ids is not None:
+        runnable = runnable.filter(user_id__in=user_ids)
+    for job in runnable.order_by('run_after')[:5]:
+        claimed = AdvisorJob.objects.filter(
+            pk=job.pk, status=job.status, updated_at=job.updated_at
+        ).update(status='running', attempts=job.attempts + 1, updated_at=now)
+        if claimed:
+            job.status = 'running'
+            job.attempts += 1
+            job.updated_at = now
+            return job
+    return None
+
+
+def process_job(job):
+    """Run one claimed job, rescheduling it with backoff when the model call fails.
+    
+    A job whose user, or the service as a whole, already has as many model
+    calls in flight as THROTTLES['ai_advisor'] allows goes back to the queue
+    for a second without using up an attempt.
+    """
+    with call_slots('ai_advisor', job.user_id) as held:
+        if not held:
+            job.status = 'pending'
+            job.attempts -= 1
+            job.run_after = timezone.now() + timedelta(seconds=1)
+            job.save(update_fields=['status', 'attempts', 'run_after', 'updated_at'])
+            return job
+        try:
+            financial_context, system_prompt = build_financial_context(job.user)
+            messages = build_messages(
+                job.user, job.conversation_id, system_prompt, job.user_message, complete=get_completion
+            )
+            ai_response = get_completion(messages)
+        except Exception as e:
+            logger.warning('Advisor job %s attempt %s failed: %s', job.job_id, job.attempts, e)
+            job.error = f'Error getting AI response: {str(e)}'
+            if job.attempts >= settings.AI_ADVISOR_JOB_MAX_ATTEMPTS:
+                job.status = 'failed'
+            else:
+                delay = settings.AI_ADVISOR_JOB_BACKOFF * (2 ** (job.attempts - 1))
+                job.status = 'pending'
+                job.run_after = timezone.now() + timedelta(seconds=delay * random.uniform(1, 1.5))
+            job.save(update_fields=['status', 'error', 'run_after', 'updated_at'])
+            return job
+    
+    AIConversation.objects.create(
+        user=job.user,
+        conversation_id=job.conversation_id,
+        conversation_type=job.conversation_type,
+        user_message=job.user_message,
+        ai_response=ai_response,
+        # only what changed since the conversation's previous turn; see retention.full_contexts
+        context_data=retention.context_delta(
+            retention.conversation_context(job.user_id, job.conversation_id), financial_context,
+        ),
+    )
+    job.status = 'done'
+    job.ai_response = ai_response
+    job.error = ''
+    job.save(update_fields=['status', 'ai_response', 'error', 'updated_at'])
+    return job
+
+
+def run_worker(poll_interval=1.0, once=False, user_ids=None):
+    """Process jobs until interrupted (or until the queue is empty when ``once``); see claim_next_job for ``user_ids``"""
+    while True:
+        job = claim_next_job(user_ids)
+        if job is not None:
+            process_job(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
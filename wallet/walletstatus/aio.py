@@ -0,0 +1,46 @@
+"""Concurrent database reads for async views.
+
+Django's async ORM runs every query through the request's single
+thread-sensitive executor, so queries awaited together with asyncio.gather
+still execute one after another. ``read`` runs a function on a small shared
+pool instead; each pool thread holds its own connection, reused and
+health-checked like a request's (CONN_MAX_AGE), so independent queries of one
+request overlap. Context variables such as replica routing are carried over.
+
+Pool threads use their own connections, so they do not see rows the caller
+has not committed yet (tests inside a transaction). With ASYNC_READ_WORKERS
+= 0, ``read`` falls back to plain sync_to_async on the caller's connection.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_READ_WORKERS, thread_name_prefix='reads')
+    return _executor
+
+
+def _managed(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def read(func, *args, **kwargs):
+    """Await sync ``func(*args, **kwargs)`` run on the read pool, concurrently with other reads"""
+    if not settings.ASYNC_READ_WORKERS:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await sync_to_async(_managed, thread_sensitive=False, executor=executor())(func, args, kwargs)
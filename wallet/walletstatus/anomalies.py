@@ -0,0 +1,221 @@
+"""Streaming detection of unusual spending.
+
+Every expense updates the running statistics of its user, category and
+currency (``SpendingStats``) in O(1): Welford's count, mean and sum of
+squared deviations, and an exponentially weighted moving average (EWMA) that
+follows recent spending. Before it is added, an expense is scored in
+standard deviations above the EWMA and flagged (``SpendingAnomaly``) past
+``ANOMALY_Z_THRESHOLD`` once ``ANOMALY_MIN_COUNT`` earlier expenses are
+recorded. Amounts stay in their own currency, so no exchange rates are read.
+
+Edits and deletes take the old amount back out of the count, mean and
+variance; an EWMA cannot be unwound, so it simply carries on. Queryset
+``update()``/``delete()`` and ``bulk_create()`` send no signals, so
+``manage.py backfill_spending_stats`` rebuilds the statistics from history
+in one vectorized pass.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import router, transaction as db_transaction
+
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+
+# The spread is never taken as narrower than this fraction of the mean, so a
+# subscription whose price barely moves does not flag its first small change
+MIN_RELATIVE_SPREAD = 0.1
+COUNTED_FIELDS = ('user', 'category', 'currency', 'transaction_type', 'amount_minor', 'transaction_id')
+
+
+def key(transaction):
+    return transaction.user_id, transaction.category_id, transaction.currency
+
+
+def counted(transaction):
+    """What of ``transaction`` the statistics depend on; None if it is not an expense"""
+    if transaction.transaction_type != 'expense':
+        return None
+    return key(transaction), transaction.amount_minor
+
+
+def group(transactions):
+    groups = defaultdict(list)
+    for t in transactions:
+        if t.transaction_type == 'expense':
+            groups[key(t)].append(t)
+    return groups
+
+
+def score(stats, value):
+    """Standard deviations ``value`` lies above the recent average, or None with too little history"""
+    if stats.count < max(settings.ANOMALY_MIN_COUNT, 2):
+        return None
+    spread = max(math.sqrt(stats.m2 / (stats.count - 1)), abs(stats.mean) * MIN_RELATIVE_SPREAD, 1.0)
+    return (value - stats.ewma) / spread
+
+
+def add(stats, value):
+    stats.count += 1
+    delta = value - stats.mean
+    stats.mean += delta / stats.count
+    stats.m2 += delta * (value - stats.mean)
+    alpha = settings.ANOMALY_EWMA_ALPHA
+    stats.ewma = value if stats.count == 1 else alpha * value + (1 - alpha) * stats.ewma
+
+
+def remove(stats, value):
+    if stats.count <= 1:
+        stats.count, stats.mean, stats.m2, stats.ewma = 0, 0.0, 0.0, 0.0
+        return
+    mean = (stats.count * stats.mean - value) / (stats.count - 1)
+    stats.m2 = max(stats.m2 - (value - mean) * (value - stats.mean), 0.0)
+    stats.mean = mean
+    stats.count -= 1
+
+
+def merge(stats, other):
+    """Combine ``other``'s expenses into ``stats`` (Chan et al.); the EWMAs are averaged by count"""
+    if not other.count:
+        return
+    count = stats.count + other.count
+    delta = other.mean - stats.mean
+    stats.m2 += other.m2 + delta * delta * stats.count * other.count / count
+    stats.mean += delta * other.count / count
+    stats.ewma = (stats.ewma * stats.count + other.ewma * other.count) / count
+    stats.count = count
+
+
+def observe(transactions):
+    """Score ``transactions`` against their statistics, add them, and flag the unusual ones"""
+    from .models import SpendingAnomaly, SpendingStats
+    groups, flagged = group(transactions), []
+    if not groups:
+        return flagged
+    with db_transaction.atomic(using=router.db_for_write(SpendingStats)):
+        for (user_id, category_id, currency), expenses in groups.items():
+            stats, _ = SpendingStats.objects.select_for_update().get_or_create(
+                user_id=user_id, category_id=category_id, currency=currency,
+            )
+            for t in sorted(expenses, key=lambda t: t.date):
+                z = score(stats, t.amount_minor)
+                if z is not None and z > settings.ANOMALY_Z_THRESHOLD:
+                    flagged.append(SpendingAnomaly(
+                        user_id=user_id, transaction_id=t.transaction_id, category_id=category_id,
+                        description=t.description, amount_minor=t.amount_minor, currency=currency,
+                        expected_minor=round(stats.ewma), score=z, date=t.date,
+                    ))
+                add(stats, t.amount_minor)
+            stats.save()
+        SpendingAnomaly.objects.bulk_create(flagged, ignore_conflicts=True)
+    return flagged
+
+
+def forget(transactions):
+    """Take ``transactions`` back out of their statistics and drop their flags"""
+    from .models import SpendingAnomaly, SpendingStats
+    groups = group(transactions)
+    if not groups:
+        return
+    with db_transaction.atomic(using=router.db_for_write(SpendingStats)):
+        SpendingAnomaly.objects.filter(
+            transaction_id__in=[t.transaction_id for expenses in groups.values() for t in expenses],
+        ).delete()
+        for (user_id, category_id, currency), expenses in groups.items():
+            stats = SpendingStats.objects.select_for_update().filter(
+                user_id=user_id, category_id=category_id, currency=currency,
+            ).first()
+            if stats is not None:
+                for t in expenses:
+                    remove(stats, t.amount_minor)
+                stats.save()
+
+
+def uncategorize(category):
+    """Fold the statistics of ``category``, about to be deleted, into its users' uncategorized ones"""
+    from .models import SpendingStats
+    with db_transaction.atomic(using=router.db_for_write(SpendingStats)):
+        for stats in SpendingStats.objects.select_for_update().filter(category=category):
+            target, _ = SpendingStats.objects.select_for_update().get_or_create(
+                user_id=stats.user_id, category_id=None, currency=stats.currency,
+            )
+            merge(target, stats)
+            target.save()
+            stats.delete()
+
+
+def stored(transaction):
+    """The saved version of ``transaction``, before an edit overwrites it"""
+    from .models import Transaction
+    return Transaction.objects.filter(pk=transaction.pk, user_id=transaction.user_id).only(*COUNTED_FIELDS).first()
+
+
+def attach(transactions):
+    """Populate ``t.anomaly`` (or None) on ``transactions`` with one query"""
+    from .models import SpendingAnomaly
+    by_id = SpendingAnomaly.objects.in_bulk(
+        [t.transaction_id for t in transactions if t.transaction_type == 'expense'], field_name='transaction_id',
+    )
+    for t in transactions:
+        t.anomaly = by_id.get(t.transaction_id)
+    return transactions
+
+
+def backfill(user_ids=None, batch_size=1000):
+    """Rebuild the statistics of ``user_ids`` (default everyone) from their recorded expenses.
+
+    Expenses are loaded once, sorted into (user, category, currency) runs by
+    date, and every run's count, mean, squared deviations and EWMA are
+    computed with array reductions. Returns (statistics written, expenses read).
+    """
+    from .models import SpendingStats, Transaction
+    queryset = Transaction.objects.across_shards().filter(transaction_type='expense')
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    rows = list(queryset.values_list(
+        'user_id', 'category_id', 'currency', 'date', 'created_at', 'amount_minor',
+    ).iterator(chunk_size=10000))
+
+    stats = []
+    if rows:
+        users, categories, currencies, dates, created, amounts = zip(*rows)
+        user = np.array(users, dtype=np.int64)
+        category = np.array([c or 0 for c in categories], dtype=np.int64)  # 0: uncategorized
+        codes, currency = np.unique(np.array(currencies), return_inverse=True)
+        day = np.array([d.toordinal() for d in dates], dtype=np.int64)
+        stamp = np.array([c.timestamp() for c in created], dtype=np.float64)
+        value = np.array(amounts, dtype=np.float64)
+
+        order = np.lexsort((stamp, day, currency, category, user))
+        user, category, currency, value = user[order], category[order], currency[order], value[order]
+        first = np.ones(len(value), dtype=bool)
+        first[1:] = (user[1:] != user[:-1]) | (category[1:] != category[:-1]) | (currency[1:] != currency[:-1])
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(value)))
+
+        mean = np.add.reduceat(value, starts) / counts
+        m2 = np.add.reduceat((value - np.repeat(mean, counts)) ** 2, starts)
+        # the k-th newest of a run weighs alpha (1 - alpha)^k, its oldest (1 - alpha)^(n - 1)
+        alpha = settings.ANOMALY_EWMA_ALPHA
+        age = np.repeat(starts + counts, counts) - 1 - np.arange(len(value))
+        weights = alpha * (1 - alpha) ** age
+        weights[starts] = (1 - alpha) ** age[starts]
+        ewma = np.add.reduceat(weights * value, starts)
+
+        stats = [
+            SpendingStats(
+                user_id=int(user[i]), category_id=int(category[i]) or None, currency=str(codes[currency[i]]),
+                count=int(n), mean=float(mu), m2=float(sq), ewma=float(ew),
+            )
+            for i, n, mu, sq, ew in zip(starts, counts, mean, m2, ewma)
+        ]
+
+    existing = SpendingStats.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    with db_transaction.atomic(using=router.db_for_write(SpendingStats)):
+        existing.delete()
+        SpendingStats.objects.bulk_create(stats, batch_size=batch_size)
+    return len(stats), len(rows)
@@ -0,0 +1,191 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Transaction, IdempotencyKey
+from . import anomalies, fragments, heatmap, projections, shards
+from .categorizer import categorizer
+from .duplicates import find_duplicates, fingerprint
+from .fx import home_currency
+from .money import to_minor
+from .registry import categories
+from .serializers import TransactionWriteSerializer
+
+BULK_BATCH_SIZE = 500
+MAX_BULK_ROWS = 10000
+
+
+def bulk_create_transactions(user, rows, skip_duplicates=False, before_commit=None):
+    """Insert validated transaction rows in a single atomic bulk_create.
+
+    Rows sent without a category get one from the categorizer when it is
+    confident enough; those rows are marked ``category_auto``. With
+    ``skip_duplicates``, rows already recorded for the user are left out.
+    ``before_commit(objects)`` is called inside the transaction, once the
+    rows are written.
+    """
+    default_currency = home_currency(user.pk)
+    uncategorized = [row for row in rows if row['category'] is None]
+    for row, category_id in zip(uncategorized, categorizer.classify(user.pk, uncategorized)):
+        row['category'], row['category_auto'] = category_id, category_id is not None
+    objects = [
+        Transaction(
+            user=user,
+            amount=row['amount'],
+            amount_minor=to_minor(row['amount']),
+            currency=row.get('currency') or default_currency,
+            fingerprint=fingerprint(
+                row['date'], row['amount'], row.get('currency') or default_currency, row['description']
+            ),
+            transaction_type=row['transaction_type'],
+            category_id=row['category'],
+            category_auto=row.get('category_auto', False),
+            description=row['description'],
+            date=row['date'],
+            location=row['location'],
+            notes=row['notes'],
+        )
+        for row in rows
+    ]
+    using = shards.shard_for(user.pk)
+    with db_transaction.atomic(using=using):
+        if skip_duplicates:
+            objects = [t for t, duplicate in zip(objects, find_duplicates(user, objects)) if not duplicate]
+        Transaction.objects.bulk_create(objects, batch_size=BULK_BATCH_SIZE)
+        if before_commit is not None:
+            before_commit(objects)
+        # bulk_create sends no post_save signals; catch up once the rows are committed,
+        # without failing a request whose rows are already in
+        db_transaction.on_commit(partial(rows_added, user.pk, objects), using=using, robust=True)
+    return objects
+
+
+def rows_added(user_id, objects):
+    anomalies.observe(objects)
+    projections.invalidate(user_id)
+    heatmap.invalidate(user_id)
+    fragments.bump('budgets', user_id)
+    categorizer.note_added(user_id)
+
+
+def claim_key(user, key):
+    """Reserve ``key`` for this request before any row is written.
+
+    Returns None once claimed, or the ``IdempotencyKey`` of the request that
+    holds it (its ``response`` is None while that request is still running).
+    A claim left by a request that died is taken over after
+    ``IDEMPOTENCY_CLAIM_TIMEOUT``.
+    """
+    try:
+        with db_transaction.atomic():
+            IdempotencyKey.objects.create(user=user, key=key, response=None)
+        return None
+    except IntegrityError:
+        previous = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if previous is None:
+        return claim_key(user, key)
+    expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TIMEOUT)
+    if previous.response is None and previous.created_at < expired:
+        # only one of several concurrent retries wins the takeover
+        if IdempotencyKey.objects.filter(
+            pk=previous.pk, response__isnull=True, created_at=previous.created_at,
+        ).update(created_at=timezone.now()):
+            return None
+    return previous
+
+
+def result(submitted, created):
+    return {
+        'created': len(created),
+        'skipped_duplicates': submitted - len(created),
+        'transaction_ids': [str(t.transaction_id) for t in created],
+    }
+
+
+def replay(previous):
+    if previous.response is None:
+        response = Response(
+            {'error': 'A request with this Idempotency-Key is still being processed.'},
+            status=status.HTTP_409_CONFLICT,
+        )
+        response['Retry-After'] = '1'
+        return response
+    return Response(previous.response, status=status.HTTP_200_OK)
+
+
+class BulkTransactionView(APIView):
+    """Create many transactions in one request.
+    
+    Accepts either a JSON array of transactions or {"transactions": [...]}.
+    Clients may send an Idempotency-Key header; a retry with the same key
+    returns the original response instead of inserting the rows again.
+    Rows matching transactions already recorded (same date, amount, currency
+    and description) are skipped unless ?allow_duplicates=true is passed.
+
+    The response is stored with the key before the rows commit. On the
+    default database the two commit together; when the user's rows live on
+    another shard, a crash between the two commits leaves a stored response
+    for rows that were never written, which a retry replays rather than
+    inserting the rows twice.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            previous = IdempotencyKey.objects.filter(user=request.user, key=idempotency_key).first()
+            if previous and previous.response is not None:
+                return replay(previous)
+        
+        payload = request.data
+        if isinstance(payload, dict):
+            payload = payload.get('transactions')
+        if not isinstance(payload, list) or not payload:
+            return Response(
+                {'error': 'Expected a non-empty list of transactions.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(payload) > MAX_BULK_ROWS:
+            return Response(
+                {'error': f'At most {MAX_BULK_ROWS} transactions per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = TransactionWriteSerializer(
+            data=payload, many=True, context={'category_ids': categories.ids()}
+        )
+        serializer.is_valid(raise_exception=True)
+        
+        # The rows may live on a shard, so they cannot commit together with the
+        # key: claim it first, so a concurrent retry waits instead of inserting
+        if idempotency_key:
+            previous = claim_key(request.user, idempotency_key)
+            if previous:
+                return replay(previous)
+        submitted = len(serializer.validated_data)
+        
+        def store_response(objects):
+            IdempotencyKey.objects.filter(user=request.user, key=idempotency_key).update(
+                response=result(submitted, objects)
+            )
+        
+        try:
+            created = bulk_create_transactions(
+                request.user, serializer.validated_data,
+                skip_duplicates=request.query_params.get('allow_duplicates') != 'true',
+                before_commit=store_response if idempotency_key else None,
+            )
+        except Exception:
+            # the rows were not committed, so neither the claim nor a response stored for them stands
+            if idempotency_key:
+                IdempotencyKey.objects.filter(user=request.user, key=idempotency_key).delete()
+            raise
+        
+        return Response(result(submitted, created), status=status.HTTP_201_CREATED)
@@ -0,0 +1,1022 @@
+"""Micro-benchmarks for the hot paths of the wallet app.
+
+Run with ``python manage.py benchmark [name ...]``. Scenarios run inside a
+transaction that is rolled back, so they are safe against a dev DB. Scenarios
+registered with ``atomic=False`` drive the app from several threads (which
+need committed data) and clean up after themselves instead.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections, transaction as db_transaction
+from django.test import Client
+
+from .models import Transaction, UserProfile, AdvisorJob
+
+BENCHMARKS = {}
+
+
+class Rollback(Exception):
+    pass
+
+
+def benchmark(name, atomic=True):
+    """Register a benchmark function under ``name``"""
+    def decorator(func):
+        func.atomic = atomic
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def run(name, **options):
+    """Run one benchmark, inside a rolled-back transaction unless registered otherwise"""
+    if not BENCHMARKS[name].atomic:
+        return BENCHMARKS[name](**options)
+    results = {}
+    try:
+        with db_transaction.atomic():
+            results = BENCHMARKS[name](**options)
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+def make_user(username='benchmark-user'):
+    return User.objects.create(username=username)
+
+
+def sample_rows(count):
+    """Build ``count`` validated-looking transaction rows"""
+    start = date.today() - timedelta(days=365)
+    return [
+        {
+            'amount': Decimal(f'{(i % 500) + 1}.{i % 100:02d}'),
+            'transaction_type': 'expense' if i % 4 else 'income',
+            'category': None,
+            'description': f'Benchmark row {i}',
+            'date': start + timedelta(days=i % 365),
+            'location': '',
+            'notes': '',
+        }
+        for i in range(count)
+    ]
+
+
+@benchmark('bulk_insert')
+def bench_bulk_insert(rows=5000, **options):
+    """Compare per-row save() against the bulk write API path, in rows per second"""
+    from .api import bulk_create_transactions
+    
+    user = make_user()
+    data = sample_rows(rows)
+    
+    started = time.perf_counter()
+    for row in data:
+        Transaction(
+            user=user,
+            amount=row['amount'],
+            transaction_type=row['transaction_type'],
+            description=row['description'],
+            date=row['date'],
+        ).save()
+    single = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    bulk_create_transactions(user, data)
+    bulk = time.perf_counter() - started
+    
+    return {
+        'rows': rows,
+        'save_rows_per_sec': round(rows / single),
+        'bulk_rows_per_sec': round(rows / bulk),
+    }
+
+
+def close_connection(alias, barrier):
+    barrier.wait()
+    connections[alias].close()
+
+
+def sqlite_write_load(alias, threads, operations):
+    """Hammer the database ``alias`` from several threads, each doing write-then-read operations.
+    
+    Every operation goes through Django's connection for ``alias`` and ends
+    the way a request does, so CONN_MAX_AGE, the init_command pragmas and the
+    transaction mode of its settings all apply.
+    """
+    errors = []
+    
+    def operation(i):
+        try:
+            with db_transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                cursor.execute('INSERT INTO load (amount, description) VALUES (%s, %s)', [i, f'row {i}'])
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT COUNT(*), SUM(amount) FROM load')
+                cursor.fetchone()
+        except OperationalError as e:
+            errors.append(str(e))
+        finally:
+            connections[alias].close_if_unusable_or_obsolete()
+    
+    with connections[alias].cursor() as cursor:
+        cursor.execute('CREATE TABLE load (id INTEGER PRIMARY KEY, amount INTEGER, description TEXT)')
+    connections[alias].close()
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(operation, range(operations)))
+        elapsed = time.perf_counter() - started
+        # connections are per thread; hold every pool thread at the barrier so each closes its own
+        barrier = threading.Barrier(threads)
+        list(pool.map(close_connection, [alias] * threads, [barrier] * threads))
+    return round((operations - len(errors)) / elapsed), len(errors)
+
+
+@benchmark('sqlite_concurrency', atomic=False)
+def bench_sqlite_concurrency(rows=5000, threads=8, **options):
+    """Concurrent write/read load against scratch copies of the configured SQLite database, before and after tuning
+    
+    The tuned run uses the DATABASES['default'] settings unchanged; the
+    default run drops its OPTIONS and connection reuse, as the old settings had.
+    """
+    configured = settings.DATABASES['default']
+    if configured['ENGINE'] != 'django.db.backends.sqlite3':
+        return {'skipped': 'the default database is not SQLite'}
+    results = {'threads': threads, 'operations': rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, overrides in (('default', {'CONN_MAX_AGE': 0, 'OPTIONS': {}}), ('tuned', {})):
+            alias = f'benchmark_sqlite_{label}'
+            settings.DATABASES[alias] = {**configured, 'NAME': os.path.join(tmp, f'{label}.sqlite3'), **overrides}
+            try:
+                ops_per_sec, errors = sqlite_write_load(alias, threads, rows)
+            finally:
+                connections[alias].close()
+                del connections[alias]
+                del settings.DATABASES[alias]
+            results[f'{label}_ops_per_sec'] = ops_per_sec
+            results[f'{label}_locked_errors'] = errors
+    return results
+
+
+@benchmark('ai_advisor_load', atomic=False)
+def bench_ai_advisor_load(rows=200, users=10, threads=20, delay=0.2, **options):
+    """Fire concurrent advisor requests, then drain the queue against a fake OpenAI server"""
+    from django.test import override_settings
+    from .fake_openai import start_in_thread
+    from .advisor import run_worker
+    from .throttling import METRIC_NAMES, forget_user, get_metrics
+    
+    server = start_in_thread(delay=delay)
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    fake_openai = override_settings(OPENAI_BASE_URL=server.base_url)
+    fake_openai.enable()
+    accounts = []
+    for i in range(users):
+        accounts.append(make_user(f'benchmark-ai-{i}'))
+    
+    statuses = {}
+    replies = {}
+    latencies = []
+    lock = threading.Lock()
+    
+    def fire(i):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(accounts[i % users])
+        started = time.perf_counter()
+        response = client.post('/ai-advisor/', '{"message": "How can I save more?"}', content_type='application/json')
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 202:
+                success = response.json().get('success')
+                replies[success] = replies.get(success, 0) + 1
+        connection.close()
+    
+    try:
+        # the counters are cumulative, so report this run's share
+        before = get_metrics('ai_advisor')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(fire, range(rows)))
+        elapsed = time.perf_counter() - started
+        metrics = get_metrics('ai_advisor')
+        metrics.update({name: metrics[name] - before[name] for name in METRIC_NAMES})
+        
+        started = time.perf_counter()
+        # only this run's jobs: other users' queued requests must not get fake replies
+        run_worker(once=True, user_ids=[account.pk for account in accounts])
+        drain = time.perf_counter() - started
+        answered = AdvisorJob.objects.filter(user__in=accounts, status='done').count()
+    finally:
+        request_logger.setLevel(previous_level)
+        fake_openai.disable()
+        server.shutdown()
+        for account in accounts:
+            forget_user('ai_advisor', account.pk)
+        User.objects.filter(pk__in=[u.pk for u in accounts]).delete()
+    
+    latencies.sort()
+    return {
+        'requests': rows,
+        'elapsed_sec': round(elapsed, 2),
+        'status_counts': dict(sorted(statuses.items())),
+        'enqueued': replies.get(True, 0),
+        'throttle_metrics': metrics,
+        'answered_by_worker': answered,
+        'worker_drain_sec': round(drain, 2),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000),
+    }
+
+
+@benchmark('advisor_history')
+def bench_advisor_history(rows=200, delay=0.05, per_token_delay=0.0001, **options):
+    """Prompt size and end-to-end latency of an advisor call, full history vs windowed.
+    
+    Uses ``min(rows, 500)`` history turns so the full-history call stays bounded.
+    """
+    turns = min(rows, 500)
+    from django.test import override_settings
+    from . import llm
+    from .advisor import build_financial_context, enqueue, claim_next_job, process_job
+    from .conversation import build_messages, estimate_tokens
+    from .fake_openai import start_in_thread
+    from .models import AIConversation
+    
+    user = make_user()
+    first = AIConversation.objects.create(
+        user=user, user_message='How should I budget?', ai_response='Start with 50/30/20. ' * 20
+    )
+    AIConversation.objects.bulk_create(
+        AIConversation(
+            user=user, conversation_id=first.conversation_id,
+            user_message=f'Follow-up question {i} about my savings plan?',
+            ai_response=f'Answer {i}: ' + 'Keep tracking your expenses and automate savings. ' * 10,
+        )
+        for i in range(turns)
+    )
+    
+    server = start_in_thread(delay=delay, per_token_delay=per_token_delay)
+    fake_openai = override_settings(OPENAI_BASE_URL=server.base_url)
+    fake_openai.enable()
+    try:
+        _, system_prompt = build_financial_context(user)
+        history = AIConversation.objects.filter(user=user, conversation_id=first.conversation_id).order_by('created_at')
+        full = [{"role": "system", "content": system_prompt}]
+        for turn in history:
+            full += [{"role": "user", "content": turn.user_message}, {"role": "assistant", "content": turn.ai_response}]
+        full.append({"role": "user", "content": 'What next?'})
+        windowed = build_messages(user, first.conversation_id, system_prompt, 'What next?')
+        
+        started = time.perf_counter()
+        llm.client().chat.completions.create(model='fake', messages=full)
+        full_latency = time.perf_counter() - started
+        
+        timings = []
+        for _ in range(3):
+            enqueue(user, 'What next?', conversation_id=first.conversation_id)
+            started = time.perf_counter()
+            process_job(claim_next_job([user.pk]))
+            timings.append(time.perf_counter() - started)
+    finally:
+        fake_openai.disable()
+        server.shutdown()
+    
+    return {
+        'history_turns': turns + 1,
+        'full_prompt_tokens': sum(estimate_tokens(m['content']) for m in full),
+        'windowed_prompt_tokens': sum(estimate_tokens(m['content']) for m in windowed),
+        'full_history_call_ms': round(full_latency * 1000),
+        'windowed_job_ms_first': round(timings[0] * 1000),
+        'windowed_job_ms_next': round(min(timings[1:]) * 1000),
+    }
+
+
+@benchmark('money_aggregation')
+def bench_money_aggregation(rows=5000, **options):
+    """Decimal sums in Python vs integer-cent SQL aggregates, checking they agree to the cent"""
+    from .api import bulk_create_transactions
+    from .models import Budget, Category
+    from .money import minor_sum, from_minor
+    
+    user = make_user()
+    data = sample_rows(rows)
+    bulk_create_transactions(user, data)
+    category = Category.objects.create(name='Benchmark', category_type='expense')
+    Transaction.objects.filter(user=user).update(category=category)
+    budget = Budget.objects.create(
+        user=user, category=category, amount=Decimal('100000.00'),
+        start_date=date.today() - timedelta(days=365), end_date=date.today()
+    )
+    
+    started = time.perf_counter()
+    decimal_total = sum(t.amount for t in Transaction.objects.filter(user=user, transaction_type='expense'))
+    decimal_usage = round((decimal_total / budget.amount) * 100, 2)
+    decimal_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    minor_total = Transaction.objects.filter(user=user).aggregate(total=minor_sum(transaction_type='expense'))['total']
+    minor_usage = budget.get_usage_percentage()
+    minor_time = time.perf_counter() - started
+    
+    expected = sum((row['amount'] for row in data if row['transaction_type'] == 'expense'), Decimal('0'))
+    return {
+        'rows': rows,
+        'decimal_python_ms': round(decimal_time * 1000, 1),
+        'minor_sql_ms': round(minor_time * 1000, 1),
+        'totals_match': decimal_total == from_minor(minor_total) == expected == budget.get_spent_amount(),
+        'usage_match': decimal_usage == minor_usage,
+    }
+
+
+def make_dashboard_user(rows, username='benchmark-user'):
+    """A student with ``rows`` transactions, budgets, goals and job recommendations"""
+    from .api import bulk_create_transactions
+    from .models import Budget, Category, SavingsGoal, JobOpportunity
+    
+    user = make_user(username)
+    UserProfile.objects.filter(user=user).update(user_type='student')
+    bulk_create_transactions(user, sample_rows(rows))
+    categories = [Category.objects.create(name=f'Benchmark {i}', category_type='expense') for i in range(8)]
+    expense_ids = list(Transaction.objects.filter(user=user, transaction_type='expense').values_list('pk', flat=True))
+    for i, category in enumerate(categories):
+        Transaction.objects.filter(pk__in=expense_ids[i::len(categories)]).update(category=category)
+        Budget.objects.create(
+            user=user, category=category, amount=Decimal('5000.00'),
+            start_date=date.today() - timedelta(days=365), end_date=date.today()
+        )
+        SavingsGoal.objects.create(
+            user=user, name=f'Goal {i}', target_amount=Decimal('10000.00'),
+            current_amount=Decimal(i * 500), target_date=date.today() + timedelta(days=365)
+        )
+    jobs = [
+        JobOpportunity.objects.create(
+            title=f'Remote role {i}', company='Benchmark Inc', description='', requirements='',
+            employment_type='part_time', experience_level='entry', is_remote=True, is_student_friendly=True,
+            application_url='https://example.com/apply', posted_date=date.today()
+        )
+        for i in range(5)
+    ]
+    # the shared rows made for this user, for drop_dashboard_user()
+    user.benchmark_rows = [*categories, *jobs]
+    return user
+
+
+def drop_dashboard_user(user):
+    """Delete a make_dashboard_user() user and the categories and jobs made with it"""
+    User.objects.filter(pk=user.pk).delete()
+    for row in user.benchmark_rows:
+        type(row).objects.filter(pk=row.pk).delete()
+
+
+def drop_cached(user_id):
+    """Invalidate what is cached for ``user_id`` alone, for cold measurements that leave other users' entries be"""
+    from django.core.cache import cache
+    from . import fragments, heatmap, profiles, projections
+    from .fx import HOME_CURRENCY_CACHE_KEY
+    for panel in (*fragments.CACHED_PANELS, 'applications'):
+        fragments.bump(panel, user_id)
+    projections.invalidate(user_id)
+    heatmap.invalidate(user_id)
+    profiles.invalidate(user_id)
+    cache.delete(HOME_CURRENCY_CACHE_KEY.format(user_id))
+
+
+@benchmark('dashboard_render')
+def bench_dashboard_render(rows=5000, requests=20, **options):
+    """Dashboard response time and query count with cold vs warm panel fragments"""
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    
+    user = make_dashboard_user(rows)
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(user)
+    # the rows are uncommitted, so read on this connection instead of the read pool
+    sequential_reads = override_settings(ASYNC_READ_WORKERS=0)
+    sequential_reads.enable()
+    
+    def measure(clear):
+        elapsed, queries = 0.0, 0
+        for _ in range(requests):
+            if clear:
+                drop_cached(user.pk)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get('/')
+                elapsed += time.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+            queries += len(captured)
+        return round(elapsed / requests * 1000, 2), queries // requests
+    
+    try:
+        cold_ms, cold_queries = measure(clear=True)
+        warm_ms, warm_queries = measure(clear=False)
+    finally:
+        sequential_reads.disable()
+    return {
+        'rows': rows,
+        'requests': requests,
+        'cold_ms_per_request': cold_ms,
+        'cold_queries_per_request': cold_queries,
+        'warm_ms_per_request': warm_ms,
+        'warm_queries_per_request': warm_queries,
+        'speedup': round(cold_ms / warm_ms, 2) if warm_ms else None,
+    }
+
+
+@benchmark('auth_fast_path')
+def bench_auth_fast_path(rows=5000, requests=20, **options):
+    """Queries per authenticated page with database sessions vs cached_db sessions and the profile cache"""
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from . import profiles
+    
+    user = make_dashboard_user(min(rows, 500))
+    pages = {'dashboard': '/', 'profile': '/profile/', 'jobs': '/jobs/', 'transactions': '/transactions/'}
+    results = {'requests': requests}
+    for engine in ('db', 'cached_db'):
+        # the database-session run also reloads the profile on every request, as the views used to
+        with override_settings(
+            SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}', PROFILE_CACHE_TIMEOUT=60 * 60,
+            ASYNC_READ_WORKERS=0,
+        ):
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            for page, url in pages.items():
+                client.get(url)
+                elapsed, queries = 0.0, 0
+                for _ in range(requests):
+                    if engine == 'db':
+                        profiles.invalidate(user.pk)
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        elapsed += time.perf_counter() - started
+                    assert response.status_code == 200, (url, response.status_code)
+                    queries += len(captured)
+                results[f'{page}_{engine}_queries'] = queries // requests
+                results[f'{page}_{engine}_ms'] = round(elapsed / requests * 1000, 2)
+    return results
+
+
+@benchmark('sharding', atomic=False)
+def bench_sharding(rows=5000, shard_count=4, threads=8, **options):
+    """Concurrent per-user inserts on one SQLite file vs spread over shard files, cross-shard reads and a rebalance.
+    
+    Without shards configured, re-runs itself against scratch SQLite files
+    with DATABASE_SHARDS set.
+    """
+    import io
+    import subprocess
+    import sys
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import override_settings
+    from . import shards
+    
+    if not shards.enabled():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'DATABASE_NAME': os.path.join(tmp, 'db.sqlite3'), 'DATABASE_SHARDS': str(shard_count)}
+            manage = [sys.executable, 'manage.py']
+            for alias in ['default'] + [f'shard{index}' for index in range(shard_count)]:
+                subprocess.run(manage + ['migrate', '--database', alias, '-v0'], cwd=settings.BASE_DIR, env=env, check=True)
+            output = subprocess.run(
+                manage + ['benchmark', 'sharding', '--rows', str(rows)],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        return dict(line.strip().split(': ', 1) for line in output.splitlines() if line.startswith('  '))
+    
+    users = [make_user(f'benchmark-shard-{i}') for i in range(threads)]
+    per_user = rows // threads
+    
+    def insert(user):
+        try:
+            for i in range(per_user):
+                Transaction.objects.create(
+                    user=user, amount=Decimal(f'{i % 500 + 1}.00'), transaction_type='expense',
+                    description=f'Benchmark row {i}', date=date.today() - timedelta(days=i % 365),
+                )
+        finally:
+            connections.close_all()
+    
+    def write_load():
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(insert, users))
+        return round(per_user * threads / (time.perf_counter() - started))
+    
+    results = {'shards': len(settings.SHARD_ALIASES), 'threads': threads, 'rows': per_user * threads}
+    with override_settings(TRANSACTION_SHARDS=['default']):
+        results['one_file_rows_per_sec'] = write_load()
+    results['sharded_rows_per_sec'] = write_load()
+    results['users_per_shard'] = ', '.join(
+        f'{alias} {len(user_ids)}' for alias, user_ids in shards.locate_users().items() if alias != 'default'
+    )
+    
+    def admin_page(repeat=5):
+        # best of several, so pool threads have their connections open
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = Transaction.objects.across_shards()
+            total, page = queryset.count(), list(queryset[:100])
+            timings.append(time.perf_counter() - started)
+            assert len(page) == 100 and total == 2 * per_user * threads
+        return round(min(timings) * 1000, 1)
+    
+    results['scatter_page_ms'] = admin_page()
+    with override_settings(SHARD_WORKERS=0):
+        results['sequential_page_ms'] = admin_page()
+    
+    # the users left on default by the one-file run, then a shard leaving the ring
+    for ring in (settings.TRANSACTION_SHARDS, settings.TRANSACTION_SHARDS[:-1]):
+        out = io.StringIO()
+        started = time.perf_counter()
+        call_command('rebalance_shards', ring=','.join(ring), stdout=out)
+        label = 'rebalance_from_default' if ring == settings.TRANSACTION_SHARDS else 'rebalance_drop_shard'
+        results[f'{label}_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        results[label] = out.getvalue().strip()
+    return results
+
+
+@benchmark('heatmap')
+def bench_heatmap(rows=5000, **options):
+    """Three-year spending calendar: an aggregate per day vs one grouped query vs the cached bins"""
+    import json
+    from django.test.utils import CaptureQueriesContext
+    from . import heatmap
+    from .api import bulk_create_transactions
+    from .money import minor_sum
+    
+    user = make_user()
+    data = sample_rows(rows)
+    for i, row in enumerate(data):
+        row['date'] -= timedelta(days=365 * (i % 3))
+    bulk_create_transactions(user, data)
+    end = date.today()
+    start = end.replace(year=end.year - 2, month=1, day=1)
+    
+    started = time.perf_counter()
+    day, per_day = start, []
+    while day <= end:
+        per_day.append(Transaction.objects.filter(user=user, date=day).aggregate(
+            expenses=minor_sum(transaction_type='expense'), income=minor_sum(transaction_type='income'),
+        ))
+        day += timedelta(days=1)
+    per_day_time = time.perf_counter() - started
+    
+    heatmap.invalidate(user.pk)
+    with CaptureQueriesContext(connection) as cold_queries:
+        started = time.perf_counter()
+        payload = heatmap.spending_calendar(user.pk, start, end)
+        cold_time = time.perf_counter() - started
+    with CaptureQueriesContext(connection) as warm_queries:
+        started = time.perf_counter()
+        heatmap.spending_calendar(user.pk, start, end)
+        warm_time = time.perf_counter() - started
+    
+    expenses = [value for year in payload['years'] for value in year['expenses_minor']]
+    return {
+        'rows': rows,
+        'days': len(per_day),
+        'per_day_queries': len(per_day),
+        'per_day_ms': round(per_day_time * 1000, 1),
+        'grouped_queries': len(cold_queries),
+        'grouped_ms': round(cold_time * 1000, 1),
+        'cached_queries': len(warm_queries),
+        'cached_ms': round(warm_time * 1000, 2),
+        'payload_bytes': len(json.dumps(payload)),
+        'totals_match': sum(expenses) == sum(day['expenses'] for day in per_day),
+    }
+
+
+@benchmark('anomaly_detection')
+def bench_anomaly_detection(rows=5000, **options):
+    """Scoring a new expense from running statistics vs rescanning its history, and the backfill"""
+    from django.db.models import Avg, Count, F
+    from django.test.utils import CaptureQueriesContext
+    from . import anomalies
+    from .api import bulk_create_transactions
+    from .models import SpendingStats
+    
+    user = make_user()
+    # the import updates the statistics on commit, which never comes inside a benchmark
+    anomalies.observe(bulk_create_transactions(user, sample_rows(rows)))
+    fields = ('category_id', 'currency', 'count', 'mean', 'm2', 'ewma')
+    streamed = {(s[0], s[1]): s[2:] for s in SpendingStats.objects.filter(user=user).values_list(*fields)}
+    
+    started = time.perf_counter()
+    stats, expenses = anomalies.backfill([user.pk])
+    backfill_time = time.perf_counter() - started
+    backfilled = {(s[0], s[1]): s[2:] for s in SpendingStats.objects.filter(user=user).values_list(*fields)}
+    drift = max(
+        abs(a - b) / max(abs(b), 1.0)
+        for key, values in backfilled.items() for a, b in zip(streamed[key], values)
+    )
+    
+    # new expenses, every 25th far above the usual amount
+    saves = min(rows, 200)
+    incoming = [
+        Transaction(
+            user=user, amount=Decimal('25000.00' if i % 25 == 0 else f'{(i % 500) + 1}.00'), amount_minor=0,
+            transaction_type='expense', description='Incoming', date=date.today(),
+        )
+        for i in range(saves)
+    ]
+    for t in incoming:
+        t.amount_minor = int(t.amount * 100)
+    
+    started = time.perf_counter()
+    for t in incoming:
+        history = Transaction.objects.filter(
+            user=user, category=None, currency=t.currency, transaction_type='expense',
+        ).aggregate(count=Count('pk'), mean=Avg('amount_minor'), square=Avg(F('amount_minor') * F('amount_minor')))
+    rescan_time = time.perf_counter() - started
+    
+    flagged = 0
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for t in incoming:
+            flagged += len(anomalies.observe([t]))
+        streaming_time = time.perf_counter() - started
+    
+    return {
+        'rows': rows,
+        'expenses': expenses,
+        'statistics': stats,
+        'backfill_ms': round(backfill_time * 1000, 1),
+        'backfill_rows_per_s': round(expenses / backfill_time),
+        'streamed_vs_backfilled_max_rel_diff': float(f'{drift:.2e}'),
+        'rescan_ms_per_expense': round(rescan_time * 1000 / saves, 3),
+        'streaming_ms_per_expense': round(streaming_time * 1000 / saves, 3),
+        'streaming_queries_per_expense': round(len(queries) / saves, 1),
+        'flagged': f'{flagged}/{saves // 25}',
+    }
+
+
+@benchmark('statements', atomic=False)
+def bench_statements(rows=5000, workers=None, **options):
+    """Monthly statements: per-user queries vs grouped chunks, in-process vs the process pool, then an unchanged re-run"""
+    from django.db.models import Count, Sum
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from . import statements
+    from .api import bulk_create_transactions
+    from .models import Statement
+    
+    month = statements.last_month()
+    first, last = statements.month_bounds(month)
+    users = [make_user(f'benchmark-statements-{i}') for i in range(max(rows // 100, 2))]
+    user_ids = [user.pk for user in users]
+    workers = workers or max(settings.STATEMENT_WORKERS, 2)
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        try:
+            for user in users:
+                data = sample_rows(100)
+                for i, row in enumerate(data):
+                    row['date'] = first + timedelta(days=i % last.day)
+                bulk_create_transactions(user, data)
+            
+            # what rendering on request costs: every aggregate and the rows, per user
+            with CaptureQueriesContext(connection) as per_user_queries:
+                started = time.perf_counter()
+                for user in users:
+                    month_rows = Transaction.objects.filter(user=user, date__range=(first, last))
+                    groups = list(month_rows.values('category_id', 'currency', 'transaction_type').annotate(
+                        total_minor=Sum('amount_minor'), count=Count('pk'),
+                    ).order_by())
+                    lines = list(month_rows.order_by('date', 'created_at').values(*statements.LINE_FIELDS))
+                    for render in statements.RENDERERS.values():
+                        render(user.username, month, groups, lines)
+                per_user_time = time.perf_counter() - started
+            
+            with CaptureQueriesContext(connection) as chunked_queries:
+                started = time.perf_counter()
+                written, _ = statements.generate(month, user_ids=user_ids, workers=0)
+                chunked_time = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            statements.generate(month, user_ids=user_ids, workers=workers, force=True)
+            pool_time = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            rerun_written, skipped = statements.generate(month, user_ids=user_ids, workers=0)
+            rerun_time = time.perf_counter() - started
+        finally:
+            Statement.objects.filter(user_id__in=user_ids).delete()
+            Transaction.objects.across_shards().filter(user_id__in=user_ids).delete()
+            User.objects.filter(pk__in=user_ids).delete()
+    
+    return {
+        'users': len(users),
+        'rows': len(users) * 100,
+        'per_user_queries': len(per_user_queries),
+        'per_user_ms': round(per_user_time * 1000, 1),
+        'chunked_queries': len(chunked_queries),
+        'chunked_ms': round(chunked_time * 1000, 1),
+        'written': written,
+        f'pool_{workers}_workers_ms': round(pool_time * 1000, 1),
+        'unchanged_rerun_ms': round(rerun_time * 1000, 1),
+        'unchanged_rerun_written': rerun_written,
+        'unchanged_rerun_skipped': skipped,
+    }
+
+
+@benchmark('receipt_processing', atomic=False)
+def bench_receipt_processing(rows=5000, workers=None, **options):
+    """Receipt thumbnailing on one thread vs the worker pool, plus storage saved and dedupe"""
+    import io
+    import numpy as np
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import override_settings
+    from PIL import Image
+    from .models import Receipt
+    from .receipts import store_upload, run_worker
+    
+    count = min(rows, 16)
+    workers = workers or settings.RECEIPT_WORKERS
+    rng = np.random.default_rng(0)
+    photos = []
+    for i in range(count):
+        # a noisy 12 MP "phone photo" with an EXIF orientation tag
+        pixels = (np.linspace(0, 255, 4000)[None, :, None] + rng.normal(0, 40, (3000, 4000, 1))).clip(0, 255)
+        image = Image.fromarray(np.repeat(pixels, 3, axis=2).astype(np.uint8))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = f'Benchmark Phone {i}'
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=92, exif=exif)
+        photos.append(buffer.getvalue())
+    
+    results = {'receipts': count, 'workers': workers}
+    receipts = []
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        try:
+            for i, data in enumerate(photos):
+                receipts.append(store_upload(SimpleUploadedFile(f'receipt-{i}.jpg', data, 'image/jpeg')))
+            duplicate = store_upload(SimpleUploadedFile('again.jpg', photos[0], 'image/jpeg'))
+            results['duplicate_deduped'] = duplicate.pk == receipts[0].pk
+            
+            for label, pool_size in (('single_thread', 1), ('pool', workers)):
+                # the worker deletes processed uploads; restore them for each round
+                for receipt, data in zip(receipts, photos):
+                    if not default_storage.exists(receipt.upload.name):
+                        default_storage.save(receipt.upload.name, ContentFile(data))
+                    Receipt.objects.filter(pk=receipt.pk).update(upload=receipt.upload.name, status='pending', attempts=0)
+                started = time.perf_counter()
+                run_worker(workers=pool_size, once=True)
+                results[f'{label}_ms_per_receipt'] = round((time.perf_counter() - started) / count * 1000, 1)
+            
+            processed = list(Receipt.objects.filter(pk__in=[receipt.pk for receipt in receipts]))
+            with Image.open(processed[0].image.path) as stored:
+                results['exif_stripped'] = not stored.getexif()
+                results['stored_size'] = stored.size
+            results['ready'] = sum(receipt.status == 'ready' for receipt in processed)
+            results['upload_mb'] = round(sum(len(data) for data in photos) / 1e6, 1)
+            results['stored_mb'] = round(sum(receipt.stored_bytes for receipt in processed) / 1e6, 1)
+        finally:
+            Receipt.objects.filter(pk__in=[receipt.pk for receipt in receipts]).delete()
+    return results
+
+
+@benchmark('categorizer')
+def bench_categorizer(rows=5000, **options):
+    """Categorizer training time, import classification speed and accuracy on held-out rows"""
+    import random
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from .api import bulk_create_transactions
+    from .categorizer import Categorizer
+    from .models import Category
+    
+    merchants = {
+        'Groceries': ['whole foods market', 'trader joes', 'safeway grocery', 'aldi supermarket'],
+        'Dining': ['starbucks coffee', 'chipotle grill', 'pizza hut', 'local cafe brunch'],
+        'Transport': ['uber trip', 'lyft ride', 'shell fuel', 'metro card reload'],
+        'Utilities': ['electric bill', 'water utility', 'comcast internet', 'mobile phone plan'],
+        'Entertainment': ['netflix subscription', 'spotify premium', 'cinema tickets', 'steam games'],
+        'Health': ['cvs pharmacy', 'dental clinic', 'gym membership', 'walgreens pharmacy'],
+    }
+    categories = {name: Category.objects.create(name=f'Benchmark {name}', category_type='expense') for name in merchants}
+    rng = random.Random(0)
+    
+    def labelled(count):
+        data = []
+        for row in sample_rows(count):
+            name = rng.choice(list(merchants))
+            row.update(
+                transaction_type='expense',
+                description=f'{rng.choice(merchants[name])} #{rng.randint(100, 999)}',
+                location=rng.choice(['Seattle WA', 'Austin TX', 'Online']),
+                category=categories[name].pk,
+            )
+            data.append(row)
+        return data
+    
+    user = make_user()
+    bulk_create_transactions(user, labelled(rows))
+    held_out = labelled(min(rows, 2000))
+    expected = [row['category'] for row in held_out]
+    for row in held_out:
+        row['category'] = None
+    
+    with tempfile.TemporaryDirectory() as directory, \
+            override_settings(CATEGORIZER_MODEL_PATH=os.path.join(directory, 'categorizer.npz')):
+        # what `manage.py train_categorizer` does
+        trainer = Categorizer()
+        started = time.perf_counter()
+        trainer.save(trainer.train_global())
+        train_time = time.perf_counter() - started
+        
+        # a worker's first suggestion loads the saved model and trains the user's own one
+        model = Categorizer()
+        started = time.perf_counter()
+        model.predict(user.pk, [('warm up', '', 'expense')])
+        load_time = time.perf_counter() - started
+        
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            predicted = model.classify(user.pk, held_out)
+            classify_time = time.perf_counter() - started
+            started = time.perf_counter()
+            suggestion = model.suggest(user.pk, 'starbucks coffee', 'Seattle WA', 'expense')
+            suggest_time = time.perf_counter() - started
+    
+    filled = [(p, e) for p, e in zip(predicted, expected) if p is not None]
+    return {
+        'rows': rows,
+        'train_ms': round(train_time * 1000, 1),
+        'first_suggestion_ms': round(load_time * 1000, 1),
+        'classify_rows': len(held_out),
+        'classify_ms': round(classify_time * 1000, 2),
+        'suggest_ms': round(suggest_time * 1000, 2),
+        'queries_when_warm': len(captured),
+        'auto_filled': len(filled),
+        'accuracy': round(sum(p == e for p, e in filled) / len(filled), 3) if filled else None,
+        'suggestion_correct': suggestion[0] == categories['Dining'].pk,
+    }
+
+
+@benchmark('duplicate_detection')
+def bench_duplicate_detection(rows=100000, **options):
+    """Re-importing a statement: one fingerprint pass vs an exists() query per row"""
+    from django.test.utils import CaptureQueriesContext
+    from .api import bulk_create_transactions
+    from .duplicates import find_duplicates, fingerprint
+    
+    user = make_user()
+    data = sample_rows(rows)
+    bulk_create_transactions(user, data)
+    incoming = [
+        Transaction(user=user, date=row['date'], amount=row['amount'], currency='USD', description=row['description'].upper(),
+                    fingerprint=fingerprint(row['date'], row['amount'], 'USD', row['description'].upper()))
+        for row in data
+    ]
+    
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        flags = find_duplicates(user, incoming)
+        batch_time = time.perf_counter() - started
+    
+    sample = incoming[:min(rows, 2000)]
+    started = time.perf_counter()
+    for t in sample:
+        Transaction.objects.filter(user=user, fingerprint=t.fingerprint).exists()
+    per_row_time = (time.perf_counter() - started) / len(sample) * rows
+    
+    with_new = incoming + [
+        Transaction(user=user, date=data[0]['date'], amount=data[0]['amount'], currency='USD', description=data[0]['description'],
+                    fingerprint=incoming[0].fingerprint)
+    ]
+    return {
+        'rows': rows,
+        'batch_ms': round(batch_time * 1000, 1),
+        'batch_queries': len(captured),
+        'per_row_query_ms_estimate': round(per_row_time * 1000, 1),
+        'all_flagged': all(flags),
+        'repeat_beyond_recorded_is_new': not find_duplicates(user, with_new)[-1],
+    }
+
+
+@benchmark('async_dashboard', atomic=False)
+def bench_async_dashboard(rows=5000, requests=20, concurrency=10, latency=0.002, **options):
+    """Dashboard and analytics served through WSGI vs ASGI, one at a time and concurrently.
+    
+    ``latency`` seconds are added to every query to stand in for a database
+    across the network; the ASGI path overlaps them, the WSGI path cannot.
+    """
+    import asyncio
+    from django.db.backends.signals import connection_created
+    from django.test import AsyncClient, override_settings
+    
+    def slow_query(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+    
+    def add_latency(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow_query)
+    
+    user = make_dashboard_user(rows, username='benchmark-async-user')
+    client = Client()
+    client.force_login(user)
+    async_client = AsyncClient()
+    async_client.force_login(user)
+    
+    def wsgi(path, count, threads):
+        def get(_):
+            response = client.get(path)
+            assert response.status_code == 200, response.status_code
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(get, range(count)))
+        return time.perf_counter() - started
+    
+    def asgi(path, count, threads):
+        async def get():
+            response = await async_client.get(path)
+            assert response.status_code == 200, response.status_code
+        async def batch():
+            for start in range(0, count, threads):
+                await asyncio.gather(*[get() for _ in range(min(threads, count - start))])
+        started = time.perf_counter()
+        asyncio.run(batch())
+        return time.perf_counter() - started
+    
+    results = {'rows': rows, 'requests': requests, 'concurrency': concurrency, 'query_latency_ms': latency * 1000}
+    connection_created.connect(add_latency)
+    connection.close()
+    # the test clients send Host: testserver
+    hosts = override_settings(ALLOWED_HOSTS=['testserver'])
+    hosts.enable()
+    try:
+        for path, label in (('/', 'dashboard'), ('/analytics/', 'analytics')):
+            for handler_name, handler in (('wsgi', wsgi), ('asgi', asgi)):
+                drop_cached(user.pk)
+                results[f'{label}_{handler_name}_cold_ms'] = round(handler(path, 1, 1) * 1000, 1)
+                results[f'{label}_{handler_name}_warm_ms'] = round(handler(path, requests, 1) / requests * 1000, 1)
+            with override_settings(ASYNC_READ_WORKERS=0):
+                results[f'{label}_asgi_sequential_reads_ms'] = round(asgi(path, requests, 1) / requests * 1000, 1)
+            for handler_name, handler in (('wsgi', wsgi), ('asgi', asgi)):
+                total = requests * concurrency
+                results[f'{label}_{handler_name}_concurrent_rps'] = round(total / handler(path, total, concurrency), 1)
+    finally:
+        hosts.disable()
+        connection_created.disconnect(add_latency)
+        connection.close()
+        drop_dashboard_user(user)
+    return results
+
+
+IMPORT_SCENARIOS = {
+    'setup': 'import django; django.setup()',
+    'web_worker': 'import wallet.asgi, wallet.urls',
+    'advisor_worker': 'import django; django.setup(); from walletstatus import advisor, llm; llm.client()',
+}
+
+
+@benchmark('import_time', atomic=False)
+def bench_import_time(rows=5000, repeat=3, **options):
+    """Cold-start import cost (python -X importtime) of a bare setup, a web worker and the advisor worker"""
+    import statistics
+    import subprocess
+    import sys
+    
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'wallet.settings'}
+    results = {}
+    for scenario, code in IMPORT_SCENARIOS.items():
+        totals, wall = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            stderr = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', code],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stderr
+            wall.append(time.perf_counter() - started)
+            # "import time: self [us] | cumulative | imported package"
+            timings = [line[len('import time:'):].split('|') for line in stderr.splitlines() if line.startswith('import time:')]
+            # nesting is shown by indenting the name beyond its single leading space
+            timings = [(name[1:], int(cumulative)) for _, cumulative, name in timings if cumulative.strip().isdigit()]
+            totals.append(sum(us for name, us in timings if not name.startswith(' ')))
+        top_level = sorted(
+            ((name, us) for name, us in timings if not name.startswith(' ')), key=lambda item: -item[1]
+        )
+        loaded = {name.strip() for name, _ in timings}
+        results[f'{scenario}_import_ms'] = round(statistics.median(totals) / 1000, 1)
+        results[f'{scenario}_process_ms'] = round(statistics.median(wall) * 1000, 1)
+        results[f'{scenario}_heaviest'] = ', '.join(f'{name} {us // 1000}ms' for name, us in top_level[:3])
+        results[f'{scenario}_loads'] = ', '.join(name for name in ('openai', 'numpy', 'PIL', 'requests') if name in loaded) or 'none'
+    return results
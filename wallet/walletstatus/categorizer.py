@@ -0,0 +1,256 @@
+"""Category suggestions from a multinomial Naive Bayes model kept in memory.
+
+Tokens of a transaction's description, location and type are hashed into a
+fixed feature space, so each model is just a (categories x features) count
+matrix. Every worker keeps one model trained on all users' history plus one
+per recently active user; a suggestion scores the global counts plus the
+user's own counts weighted by CATEGORIZER_USER_WEIGHT.
+
+The global model reads every transaction on every shard, so it is never
+trained on a request: `manage.py train_categorizer` (e.g. hourly from cron)
+saves it to CATEGORIZER_MODEL_PATH, and workers load the file when it
+changes. Until it first runs, suggestions come from users' own history.
+
+User models are refreshed incrementally: a stamp in the Django cache is bumped
+when a user adds transactions (train on the new rows only) or edits/deletes
+them (rebuild that user's model). When nothing changed, a suggestion runs no
+queries. Rows categorized by the model itself are never trained on.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import shards
+from .lazy import LazyModule
+from .registry import categories as category_registry
+
+np = LazyModule('numpy')
+
+N_FEATURES = 1 << 12
+ALPHA = 0.1
+GLOBAL = 'global'
+STAMP_CACHE_KEY = 'walletstatus:categorizer:{}:{}'
+WORD = re.compile(r'[a-z]{2,}')
+
+
+def tokens(description, location='', transaction_type=''):
+    words = WORD.findall(description.lower())
+    words += ['@' + word for word in WORD.findall((location or '').lower())]
+    if transaction_type:
+        words.append('type:' + transaction_type)
+    return words
+
+
+def featurize(rows):
+    """Hashed features of (description, location, type) rows as flat (row index, feature) arrays"""
+    doc_idx, feature_idx = [], []
+    for i, (description, location, transaction_type) in enumerate(rows):
+        for token in tokens(description, location, transaction_type):
+            doc_idx.append(i)
+            feature_idx.append(zlib.crc32(token.encode()) % N_FEATURES)
+    return np.array(doc_idx, dtype=np.int64), np.array(feature_idx, dtype=np.int64)
+
+
+def stamp(key, kind):
+    value = cache.get(STAMP_CACHE_KEY.format(kind, key))
+    if value is None:
+        cache.add(STAMP_CACHE_KEY.format(kind, key), uuid.uuid4().hex, None)
+        value = cache.get(STAMP_CACHE_KEY.format(kind, key))
+    return value
+
+
+class Model:
+    """Token counts per category row (rows follow the Categorizer's category index)"""
+
+    def __init__(self):
+        self.counts = np.zeros((0, N_FEATURES), dtype=np.float32)
+        self.docs = np.zeros(0, dtype=np.float32)
+        # highest pk trained on, per database (ids only increase within one)
+        self.last_pk = {}
+        self.added = None
+        # what the model was built from: the user's rebuild stamp, or the saved file's mtime for the global one
+        self.epoch = None
+        self.refreshed_at = 0.0
+
+    def resize(self, rows):
+        if rows > len(self.docs):
+            extra = rows - len(self.docs)
+            self.counts = np.vstack([self.counts, np.zeros((extra, N_FEATURES), dtype=np.float32)])
+            self.docs = np.concatenate([self.docs, np.zeros(extra, dtype=np.float32)])
+
+    def train(self, labels, rows):
+        """Add ``rows`` labelled with category row indexes ``labels``"""
+        if not rows:
+            return
+        labels = np.asarray(labels, dtype=np.int64)
+        self.resize(int(labels.max()) + 1)
+        doc_idx, feature_idx = featurize(rows)
+        np.add.at(self.counts, (labels[doc_idx], feature_idx), 1)
+        self.docs += np.bincount(labels, minlength=len(self.docs)).astype(np.float32)
+
+
+class Categorizer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._ids = []
+        self._models = OrderedDict()
+
+    def _row(self, category_id):
+        if category_id not in self._rows:
+            self._rows[category_id] = len(self._ids)
+            self._ids.append(category_id)
+        return self._rows[category_id]
+
+    def _train(self, model, user_id=None):
+        from .models import Transaction
+        fields = ('pk', 'category_id', 'description', 'location', 'transaction_type')
+        for alias in shards.aliases() if user_id is None else [shards.shard_for(user_id)]:
+            queryset = Transaction.objects.using(alias).filter(
+                category__isnull=False, category_auto=False, pk__gt=model.last_pk.get(alias, 0)
+            ).order_by('pk')
+            if user_id is not None:
+                queryset = queryset.filter(user_id=user_id)
+            batch = []
+            for row in queryset.values_list(*fields).iterator(chunk_size=5000):
+                batch.append(row)
+                if len(batch) == 5000:
+                    self._train_batch(model, alias, batch)
+                    batch = []
+            self._train_batch(model, alias, batch)
+
+    def _train_batch(self, model, alias, batch):
+        if batch:
+            model.train([self._row(row[1]) for row in batch], [row[2:] for row in batch])
+            model.last_pk[alias] = batch[-1][0]
+
+    def train_global(self):
+        """A model of every user's labelled rows on every database; slow, see `manage.py train_categorizer`"""
+        model = Model()
+        self._train(model)
+        return model
+
+    def save(self, model, path=None):
+        """Write a global model where workers load it from"""
+        path = path or settings.CATEGORIZER_MODEL_PATH
+        partial = f'{path}.partial'
+        with open(partial, 'wb') as f:
+            np.savez_compressed(
+                f, ids=np.array(self._ids[:len(model.docs)], dtype=np.int64), counts=model.counts, docs=model.docs,
+            )
+        # workers never read a half-written file
+        os.replace(partial, path)
+
+    def _load_global(self):
+        """The saved global model, checked for a newer file every CATEGORIZER_GLOBAL_REFRESH seconds"""
+        now = time.monotonic()
+        model = self._models.get(GLOBAL)
+        if model is not None and now - model.refreshed_at < settings.CATEGORIZER_GLOBAL_REFRESH:
+            return model
+        path = settings.CATEGORIZER_MODEL_PATH
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            modified = None
+        if model is None or model.epoch != modified:
+            model = Model()
+            model.epoch = modified
+            if modified is not None:
+                with np.load(path) as saved:
+                    # the file's category order is the trainer's; map it onto this worker's rows
+                    rows = [self._row(int(category_id)) for category_id in saved['ids']]
+                    if rows:
+                        model.resize(max(rows) + 1)
+                        model.counts[rows] = saved['counts']
+                        model.docs[rows] = saved['docs']
+        model.refreshed_at = now
+        self._models[GLOBAL] = model
+        return model
+
+    def _refresh(self, key):
+        """Return the up-to-date model for ``key`` (a user id or GLOBAL), training only what changed"""
+        if key == GLOBAL:
+            return self._load_global()
+        model = self._models.get(key)
+        added, epoch = stamp(key, 'added'), stamp(key, 'epoch')
+        if model is None or model.epoch != epoch:
+            model = Model()
+            model.epoch = epoch
+        if model.added != added:
+            self._train(model, user_id=key)
+            model.added = added
+        self._models[key] = model
+        self._models.move_to_end(key)
+        while len(self._models) > settings.CATEGORIZER_MAX_USERS + 1:
+            oldest = next(k for k in self._models if k != GLOBAL)
+            del self._models[oldest]
+        return model
+
+    def predict(self, user_id, rows):
+        """Best category id and its probability for each (description, location, type) row"""
+        with self._lock:
+            global_model = self._refresh(GLOBAL)
+            user_model = self._refresh(user_id)
+            ids = list(self._ids)
+        if not ids or not rows:
+            return [(None, 0.0)] * len(rows)
+
+        counts = np.zeros((len(ids), N_FEATURES), dtype=np.float64)
+        docs = np.zeros(len(ids), dtype=np.float64)
+        for model, weight in ((global_model, 1.0), (user_model, settings.CATEGORIZER_USER_WEIGHT)):
+            counts[:len(model.docs)] += weight * model.counts
+            docs[:len(model.docs)] += weight * model.docs
+
+        # a known category with training rows, of the row's type when it has one
+        types = {c.id: c.category_type for c in category_registry.all()}
+        category_types = np.array([types.get(cid, '') for cid in ids], dtype=object)
+        row_types = np.array([row[2] or '' for row in rows], dtype=object)[:, None]
+        usable = np.array([cid in types for cid in ids]) & (docs > 0)
+        allowed = usable[None, :] & ((row_types == '') | (row_types == category_types[None, :]))
+
+        doc_idx, feature_idx = featurize(rows)
+        log_likelihood = np.log(counts[:, feature_idx] + ALPHA) - np.log(counts.sum(axis=1) + ALPHA * N_FEATURES)[:, None]
+        scores = np.empty((len(rows), len(ids)))
+        for c in range(len(ids)):
+            scores[:, c] = np.bincount(doc_idx, weights=log_likelihood[c], minlength=len(rows))
+        scores += np.log(docs + 1) - np.log(docs.sum() + len(ids))
+        scores[~allowed] = -np.inf
+
+        best = scores.argmax(axis=1)
+        with np.errstate(invalid='ignore'):
+            probabilities = np.exp(scores - scores[np.arange(len(rows)), best][:, None])
+            confidence = 1 / probabilities.sum(axis=1)
+        return [
+            (ids[b], float(p)) if allowed[i, b] else (None, 0.0)
+            for i, (b, p) in enumerate(zip(best, confidence))
+        ]
+
+    def suggest(self, user_id, description, location='', transaction_type=''):
+        """(category_id, confidence) for one transaction"""
+        return self.predict(user_id, [(description, location, transaction_type)])[0]
+
+    def classify(self, user_id, rows):
+        """Category ids for import rows (dicts), None where the model is not confident enough"""
+        predictions = self.predict(user_id, [
+            (row['description'], row.get('location', ''), row['transaction_type']) for row in rows
+        ])
+        minimum = settings.CATEGORIZER_MIN_CONFIDENCE
+        return [category_id if confidence >= minimum else None for category_id, confidence in predictions]
+
+    def note_added(self, user_id):
+        """New labelled rows for ``user_id``: train on them at the next suggestion"""
+        cache.set(STAMP_CACHE_KEY.format('added', user_id), uuid.uuid4().hex, None)
+
+    def invalidate(self, user_id):
+        """Rows of ``user_id`` were edited or deleted: rebuild that user's model"""
+        cache.set(STAMP_CACHE_KEY.format('epoch', user_id), uuid.uuid4().hex, None)
+
+
+categorizer = Categorizer()
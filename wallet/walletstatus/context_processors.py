@@ -0,0 +1,9 @@
+from .fx import home_currency, symbol
+
+
+def currency(request):
+    """Expose the user's home currency and its symbol to every template"""
+    if not request.user.is_authenticated:
+        return {}
+    code = home_currency(request.user.pk)
+    return {'home_currency': code, 'currency_symbol': symbol(code)}
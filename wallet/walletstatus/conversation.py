@@ -0,0 +1,97 @@
+"""Conversation history windowing for advisor prompts.
+
+The prompt carries the most recent turns of a conversation that fit in
+settings.AI_ADVISOR_PROMPT_TOKEN_BUDGET. Older turns are folded, once, into
+a ConversationSummary that is reused on every later call, so prompt size
+stays bounded however long the conversation gets.
+"""
+from django.conf import settings
+
+from .models import AIConversation, ConversationSummary
+
+# Rough chat-token estimate; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Keep the tail of ``text`` so it fits in ``max_tokens``"""
+    max_chars = max(0, (max_tokens - MESSAGE_OVERHEAD_TOKENS) * CHARS_PER_TOKEN)
+    return text if len(text) <= max_chars else '…' + text[-max_chars:]
+
+
+def format_turns(turns):
+    return '\n'.join(f"User: {t.user_message}\nAdvisor: {t.ai_response}" for t in turns)
+
+
+def summarize(previous_summary, turns, complete=None):
+    """Fold ``turns`` into ``previous_summary``.
+    
+    Uses the chat model when ``complete`` is given and falls back to plain
+    truncation if the call fails, so a summary is always produced.
+    """
+    max_tokens = settings.AI_ADVISOR_SUMMARY_TOKENS
+    text = '\n'.join(part for part in (previous_summary, format_turns(turns)) if part)
+    if complete is not None:
+        try:
+            return truncate_to_tokens(complete([
+                {"role": "system", "content": f"Summarize this conversation between a user and their financial advisor in at most {max_tokens} tokens. Keep figures, goals and decisions."},
+                {"role": "user", "content": text},
+            ]), max_tokens)
+        except Exception:
+            pass
+    return truncate_to_tokens(text, max_tokens)
+
+
+def build_messages(user, conversation_id, system_prompt, user_message, complete=None):
+    """Build the chat messages for one advisor call within the token budget"""
+    budget = settings.AI_ADVISOR_PROMPT_TOKEN_BUDGET
+    summary = ConversationSummary.objects.filter(conversation_id=conversation_id, user=user).first()
+    
+    turns = AIConversation.objects.filter(user=user, conversation_id=conversation_id)
+    if summary:
+        turns = turns.filter(created_at__gt=summary.summarized_until)
+    # Newest first; served by the (user, conversation_id, -created_at) index
+    recent = list(
+        turns.order_by('-created_at').only('user_message', 'ai_response', 'created_at')[:settings.AI_ADVISOR_HISTORY_TURNS + 1]
+    )
+    has_older = len(recent) > settings.AI_ADVISOR_HISTORY_TURNS
+    recent = recent[:settings.AI_ADVISOR_HISTORY_TURNS]
+    
+    available = budget - estimate_tokens(system_prompt) - estimate_tokens(user_message) - settings.AI_ADVISOR_SUMMARY_TOKENS
+    window = []
+    for turn in recent:
+        cost = estimate_tokens(turn.user_message) + estimate_tokens(turn.ai_response)
+        if cost > available:
+            has_older = True
+            break
+        available -= cost
+        window.append(turn)
+    
+    if has_older:
+        # Fold everything older than the window into the summary, exactly once
+        oldest_kept = window[-1].created_at if window else None
+        evicted = turns.order_by('created_at')
+        if oldest_kept:
+            evicted = evicted.filter(created_at__lt=oldest_kept)
+        evicted = list(evicted.only('user_message', 'ai_response', 'created_at'))
+        if evicted:
+            if summary is None:
+                summary = ConversationSummary(user=user, conversation_id=conversation_id)
+            summary.summary = summarize(summary.summary, evicted, complete)
+            summary.summarized_until = evicted[-1].created_at
+            summary.turn_count += len(evicted)
+            summary.save()
+    
+    if summary and summary.summary:
+        system_prompt = f"{system_prompt}\n\nSummary of the earlier conversation:\n{summary.summary}"
+    messages = [{"role": "system", "content": system_prompt}]
+    for turn in reversed(window):
+        messages.append({"role": "user", "content": turn.user_message})
+        messages.append({"role": "assistant", "content": turn.ai_response})
+    messages.append({"role": "user", "content": user_message})
+    return messages
@@ -0,0 +1,46 @@
+"""Duplicate transaction detection by fingerprint.
+
+A transaction's fingerprint hashes its date, amount, currency and normalized
+description; it is stored on the row and indexed with the user. An import
+loads the fingerprints already recorded over its date range in one query and
+matches every row against them in memory. Existing rows are counted, so
+re-importing a statement that legitimately has two identical coffees flags
+both, while a third one is still new.
+"""
+import hashlib
+import re
+from collections import Counter
+
+from .money import to_minor
+
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(description):
+    """Lowercase ``description`` and collapse punctuation and whitespace"""
+    return NON_WORD.sub(' ', (description or '').lower()).strip()
+
+
+def fingerprint(date, amount, currency, description):
+    key = f'{date}|{to_minor(amount)}|{currency}|{normalize(description)}'
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def find_duplicates(user, transactions):
+    """Flags marking which of ``transactions`` (with fingerprints set) are already recorded for ``user``"""
+    from .models import Transaction
+    if not transactions:
+        return []
+    dates = [t.date for t in transactions]
+    existing = Counter(
+        Transaction.objects.filter(user=user, date__range=(min(dates), max(dates)))
+        .values_list('fingerprint', flat=True)
+        .iterator(chunk_size=10000)
+    )
+    flags = []
+    for t in transactions:
+        duplicate = existing[t.fingerprint] > 0
+        if duplicate:
+            existing[t.fingerprint] -= 1
+        flags.append(duplicate)
+    return flags
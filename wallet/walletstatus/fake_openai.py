@@ -0,0 +1,54 @@
+"""Minimal stand-in for the OpenAI chat completions API, for local load tests"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_server(host='127.0.0.1', port=0, delay=0.5, per_token_delay=0.0, reply='This is a canned financial tip.'):
+    """Build a threaded HTTP server answering POST */chat/completions.
+    
+    Each answer waits ``delay`` seconds plus ``per_token_delay`` per prompt
+    token (estimated at four characters each), mimicking a real model whose
+    latency grows with prompt size.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404)
+                return
+            prompt_tokens = sum(len(m.get('content') or '') for m in request.get('messages', [])) // 4
+            time.sleep(delay + prompt_tokens * per_token_delay)
+            body = json.dumps({
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': reply},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': 0, 'total_tokens': prompt_tokens},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def start_in_thread(**kwargs):
+    """Start a fake server in a daemon thread and return it; the base URL is server.base_url"""
+    server = make_server(**kwargs)
+    host, port = server.server_address[:2]
+    server.base_url = f'http://{host}:{port}/v1/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
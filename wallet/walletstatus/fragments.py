@@ -0,0 +1,49 @@
+"""Version stamps for the cached dashboard panels.
+
+Each panel fragment is cached per user under a key built from the versions of
+the data it renders. Signals bump the per-user stamp of a panel when its rows
+change, so a stale fragment is never served; shared inputs (categories, FX
+rates, the job board) contribute their own global stamps.
+"""
+import uuid
+from datetime import date
+
+from django.core.cache import cache
+
+from .fx import rates_version, home_currency
+from .registry import categories
+
+VERSION_CACHE_KEY = 'walletstatus:fragment_version:{}:{}'
+SHARED = 'shared'
+CACHED_PANELS = ('budgets', 'goals', 'jobs')
+
+
+def version(panel, user_id=SHARED):
+    key = VERSION_CACHE_KEY.format(panel, user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump(panel, user_id=SHARED):
+    """Publish a new version so cached fragments of ``panel`` are re-rendered"""
+    cache.set(VERSION_CACHE_KEY.format(panel, user_id), uuid.uuid4().hex, None)
+
+
+def panel_version(panel, user_id):
+    """Cache-key part for one dashboard panel of ``user_id``"""
+    if panel == 'jobs':
+        # The job board is shared; the user's applications mark what they already applied to
+        parts = [version('jobs'), version('applications', user_id)]
+    else:
+        parts = [version(panel, user_id)]
+    if panel == 'budgets':
+        parts.append(rates_version())
+    parts += [categories.version, home_currency(user_id), date.today().isoformat()]
+    return '.'.join(parts)
+
+
+def panel_versions(user_id):
+    return {panel: panel_version(panel, user_id) for panel in CACHED_PANELS}
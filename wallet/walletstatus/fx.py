@@ -0,0 +1,151 @@
+"""Currency conversion from the local ExchangeRate table.
+
+Each currency's rate history is loaded once into sorted NumPy arrays, so a
+whole aggregate can be converted with one ``searchsorted`` per currency
+instead of a lookup per row. Scalar (date, pair) lookups go through an LRU.
+Both caches are keyed on a version stamp in the Django cache, bumped when
+rates are loaded, so every worker picks up new rates.
+"""
+import logging
+import uuid
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .lazy import LazyModule
+from .models import ExchangeRate, UserProfile
+
+np = LazyModule('numpy')
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = 'USD'
+VERSION_CACHE_KEY = 'walletstatus:fx_version'
+HOME_CURRENCY_CACHE_KEY = 'walletstatus:home_currency:{}'
+
+CURRENCY_CHOICES = [
+    ('USD', 'USD - US Dollar'),
+    ('EUR', 'EUR - Euro'),
+    ('GBP', 'GBP - British Pound'),
+    ('CAD', 'CAD - Canadian Dollar'),
+    ('AUD', 'AUD - Australian Dollar'),
+]
+
+SYMBOLS = {
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'CAD': 'CA$',
+    'AUD': 'A$',
+}
+
+
+def symbol(currency):
+    return SYMBOLS.get(currency, f'{currency} ')
+
+
+def rates_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def invalidate_rates():
+    """Publish a new rates version so every worker reloads its series"""
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+@lru_cache(maxsize=64)
+def _series(currency, version):
+    """(date ordinals, per-USD rates) for ``currency``, sorted by date"""
+    rows = list(ExchangeRate.objects.filter(currency=currency).order_by('date').values_list('date', 'per_usd'))
+    if not rows:
+        return None
+    return (
+        np.array([d.toordinal() for d, _ in rows], dtype=np.int64),
+        np.array([float(r) for _, r in rows], dtype=np.float64),
+    )
+
+
+def per_usd(currency, ordinals):
+    """Per-USD rates of ``currency`` for an array of date ordinals.
+    
+    Uses the latest rate on or before each date (the earliest known rate for
+    dates before the table starts). Unknown currencies convert 1:1 with a
+    warning rather than failing the page.
+    """
+    if currency == BASE_CURRENCY:
+        return np.ones(len(ordinals))
+    series = _series(currency, rates_version())
+    if series is None:
+        logger.warning('No exchange rates loaded for %s; treating it as 1:1 with %s', currency, BASE_CURRENCY)
+        return np.ones(len(ordinals))
+    dates, rates = series
+    index = np.clip(np.searchsorted(dates, ordinals, side='right') - 1, 0, len(dates) - 1)
+    return rates[index]
+
+
+@lru_cache(maxsize=4096)
+def _rate(on_date, from_currency, to_currency, version):
+    ordinal = np.array([on_date.toordinal()])
+    return float(per_usd(to_currency, ordinal)[0] / per_usd(from_currency, ordinal)[0])
+
+
+def rate(on_date, from_currency, to_currency):
+    """Multiplier converting ``from_currency`` amounts into ``to_currency`` on ``on_date``"""
+    if from_currency == to_currency:
+        return 1.0
+    return _rate(on_date, from_currency, to_currency, rates_version())
+
+
+def convert(amount, from_currency, to_currency, on_date=None):
+    """Convert one Decimal amount, rounded to cents"""
+    multiplier = rate(on_date or date.today(), from_currency, to_currency)
+    return (Decimal(amount) * Decimal(repr(multiplier))).quantize(Decimal('0.01'))
+
+
+def convert_minor(amounts, currencies, dates, to_currency):
+    """Vectorized conversion of minor-unit amounts into ``to_currency``.
+    
+    ``amounts``, ``currencies`` and ``dates`` are parallel sequences; returns
+    an int64 array of converted minor units.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    currencies = np.asarray(currencies)
+    converted = amounts.copy()
+    foreign = [c for c in np.unique(currencies) if c != to_currency] if len(currencies) else []
+    if foreign:
+        ordinals = np.array([d.toordinal() for d in dates], dtype=np.int64)
+        target = per_usd(to_currency, ordinals)
+        for currency in foreign:
+            mask = currencies == currency
+            converted[mask] *= target[mask] / per_usd(currency, ordinals[mask])
+    return np.rint(converted).astype(np.int64)
+
+
+def convert_rows(rows, to_currency, fields, currency_key='currency', date_key='date'):
+    """Convert the minor-unit ``fields`` of aggregate rows in place and return the rows"""
+    rows = list(rows)
+    if not rows:
+        return rows
+    currencies = [row[currency_key] for row in rows]
+    dates = [row[date_key] for row in rows]
+    for field in fields:
+        values = convert_minor([row[field] for row in rows], currencies, dates, to_currency)
+        for row, value in zip(rows, values.tolist()):
+            row[field] = value
+    return rows
+
+
+def home_currency(user_id):
+    """The user's profile currency, cached; invalidated when the profile is saved"""
+    return cache.get_or_set(
+        HOME_CURRENCY_CACHE_KEY.format(user_id),
+        lambda: UserProfile.objects.filter(user_id=user_id).values_list('currency', flat=True).first() or settings.DEFAULT_CURRENCY,
+        300,
+    )
@@ -0,0 +1,93 @@
+"""Daily spending bins for the year-at-a-glance calendar.
+
+A user's transactions are binned by day from one GROUP BY (currency, date)
+query, converted to the home currency, into per-year arrays indexed by day
+of year: expenses and income in cents and the number of transactions. Years
+are cached under a per-user version bumped whenever the user's transactions
+change, so a multi-year calendar is one cache read plus at most one query
+for the years that are missing.
+"""
+import calendar
+import uuid
+from datetime import date
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .fx import convert_rows, home_currency, rates_version
+from .models import Transaction
+from .money import minor_sum
+
+CACHE_KEY = 'walletstatus:heatmap:{}:{}'
+VERSION_CACHE_KEY = 'walletstatus:heatmap_version:{}'
+CACHE_TIMEOUT = 24 * 60 * 60
+MAX_YEARS = 10
+SERIES = ('expenses_minor', 'income_minor', 'count')
+
+
+def version(user_id):
+    value = cache.get(VERSION_CACHE_KEY.format(user_id))
+    if value is None:
+        cache.add(VERSION_CACHE_KEY.format(user_id), uuid.uuid4().hex, None)
+        value = cache.get(VERSION_CACHE_KEY.format(user_id))
+    return value
+
+
+def invalidate(user_id):
+    cache.set(VERSION_CACHE_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def compute_bins(user_id, currency, years):
+    """{year: {series: [value per day of year]}} for ``years`` from one grouped query"""
+    bins = {
+        year: {series: [0] * (366 if calendar.isleap(year) else 365) for series in SERIES}
+        for year in years
+    }
+    in_years = reduce(or_, (Q(date__range=(date(year, 1, 1), date(year, 12, 31))) for year in years))
+    rows = convert_rows(Transaction.objects.filter(in_years, user_id=user_id).values('currency', 'date').annotate(
+        expenses_minor=minor_sum(transaction_type='expense'),
+        income_minor=minor_sum(transaction_type='income'),
+        count=Count('pk'),
+    ).order_by(), currency, ['expenses_minor', 'income_minor'])
+    for row in rows:
+        day = row['date'].timetuple().tm_yday - 1
+        year = bins[row['date'].year]
+        for series in SERIES:
+            year[series][day] += round(row[series])
+    return bins
+
+
+def year_bins(user_id, currency, years):
+    """Daily bins of ``years``, from the cache where possible"""
+    prefix = f'{user_id}:{version(user_id)}:{currency}:{rates_version()}'
+    keys = {year: CACHE_KEY.format(prefix, year) for year in years}
+    cached = cache.get_many(list(keys.values()))
+    bins = {year: cached[key] for year, key in keys.items() if key in cached}
+    missing = [year for year in years if year not in bins]
+    if missing:
+        computed = compute_bins(user_id, currency, missing)
+        cache.set_many({keys[year]: computed[year] for year in missing}, CACHE_TIMEOUT)
+        bins.update(computed)
+    return bins
+
+
+def spending_calendar(user_id, start, end):
+    """Daily totals from ``start`` to ``end`` (inclusive), one entry per year.
+
+    Each year's arrays start at day of year ``first_day`` (1 = January 1st);
+    amounts are in cents of ``currency``.
+    """
+    currency = home_currency(user_id)
+    bins = year_bins(user_id, currency, list(range(start.year, end.year + 1)))
+    years = []
+    for year, series in sorted(bins.items()):
+        first = start.timetuple().tm_yday if year == start.year else 1
+        last = end.timetuple().tm_yday if year == end.year else len(series['count'])
+        years.append({
+            'year': year,
+            'first_day': first,
+            **{name: values[first - 1:last] for name, values in series.items()},
+        })
+    return {'currency': currency, 'start': start.isoformat(), 'end': end.isoformat(), 'years': years}
@@ -0,0 +1,24 @@
+"""Deferred imports of heavy libraries.
+
+NumPy and Pillow together add well over 100 ms to every process that loads
+the app (signal handlers import the modules using them), although most
+requests and management commands never touch them. A module-level
+``np = LazyModule('numpy')`` reads like the usual import but only imports
+the library on first attribute access.
+"""
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module, imported on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+    
+    def __repr__(self):
+        return f'<lazy module {self._name!r}>'
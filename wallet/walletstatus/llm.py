@@ -0,0 +1,25 @@
+"""OpenAI client for the advisor, created on first use.
+
+Importing ``openai`` takes most of a second (it loads hundreds of generated
+type modules), so it is only imported when a completion is first requested:
+web workers and management commands that never call the model skip it. One
+client is kept per (OPENAI_API_KEY, OPENAI_BASE_URL), so overriding those
+settings takes effect without touching the library's module-level globals.
+"""
+import threading
+
+from django.conf import settings
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client():
+    """The shared OpenAI client for the current settings"""
+    key = (settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                import openai
+                _clients[key] = openai.OpenAI(api_key=key[0], base_url=key[1])
+    return _clients[key]
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.retention import archive_expired
+
+
+class Command(BaseCommand):
+    help = 'Move AI conversations past their retention period into compressed archive rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.AI_CONVERSATION_ARCHIVE_CHUNK_SIZE,
+                            help='Conversations archived per transaction')
+        parser.add_argument('--compression', choices=['gzip', 'zstd'], default=settings.AI_CONVERSATION_ARCHIVE_COMPRESSION)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        if options['compression'] == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise CommandError('zstd compression needs the zstandard package; use --compression gzip.')
+        
+        conversations, turns = archive_expired(
+            chunk_size=options['chunk_size'],
+            compression=options['compression'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {conversations} conversations ({turns} turns)'))
@@ -0,0 +1,30 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.anomalies import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the running spending statistics used to flag unusual expenses from recorded transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', metavar='USERNAME',
+                            help='Only rebuild this user (repeatable); default is everyone')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Statistics rows per insert')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            users = dict(User.objects.filter(username__in=options['usernames']).values_list('username', 'pk'))
+            unknown = sorted(set(options['usernames']) - set(users))
+            if unknown:
+                raise CommandError(f"Unknown user(s): {', '.join(unknown)}")
+            user_ids = list(users.values())
+
+        started = time.perf_counter()
+        stats, expenses = backfill(user_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {stats} statistic(s) from {expenses} expense(s) in {time.perf_counter() - started:.2f}s'
+        ))
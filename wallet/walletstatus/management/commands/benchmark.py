@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.benchmarks import BENCHMARKS, run
+
+
+class Command(BaseCommand):
+    help = 'Run the wallet performance benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all)')
+        parser.add_argument('--rows', type=int, default=5000, help='Rows of synthetic data to use')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(sorted(BENCHMARKS))}")
+        
+        for name in names:
+            results = run(name, rows=options['rows'])
+            self.stdout.write(self.style.SUCCESS(name))
+            for key, value in results.items():
+                self.stdout.write(f'  {key}: {value}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from walletstatus.fake_openai import make_server
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake OpenAI chat completions endpoint for local load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0.5, help='Seconds to wait before answering')
+
+    def handle(self, *args, **options):
+        server = make_server(port=options['port'], delay=options['delay'])
+        self.stdout.write(f"Fake OpenAI listening on http://127.0.0.1:{options['port']}/v1/ "
+                          f"(set OPENAI_BASE_URL to this)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,51 @@
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.statements import FORMATS, generate, last_month
+
+
+class Command(BaseCommand):
+    help = "Write monthly statements for every user whose transactions changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to report as YYYY-MM (default: last month)')
+        parser.add_argument('--format', action='append', dest='formats', choices=FORMATS,
+                            help='Repeatable; default is every format')
+        parser.add_argument('--user', action='append', dest='usernames', metavar='USERNAME',
+                            help='Only these users (repeatable); default is everyone')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: STATEMENT_WORKERS; 0 runs in-process)')
+        parser.add_argument('--chunk-size', type=int, help='Users per task (default: STATEMENT_CHUNK_SIZE)')
+        parser.add_argument('--force', action='store_true', help='Rewrite statements even if nothing changed')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError('--month must look like YYYY-MM.')
+        else:
+            month = last_month()
+
+        user_ids = None
+        if options['usernames']:
+            users = dict(User.objects.filter(username__in=options['usernames']).values_list('username', 'pk'))
+            unknown = sorted(set(options['usernames']) - set(users))
+            if unknown:
+                raise CommandError(f"Unknown user(s): {', '.join(unknown)}")
+            user_ids = sorted(users.values())
+
+        started = time.perf_counter()
+        written, skipped = generate(
+            month,
+            formats=options['formats'] or FORMATS,
+            user_ids=user_ids,
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{month:%Y-%m}: wrote {written} statement(s), skipped {skipped} user(s) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,51 @@
+import csv
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.fx import invalidate_rates
+from walletstatus.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a CSV file or URL with columns date,currency,per_usd'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Path or http(s) URL of the CSV (e.g. a local rates service)')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        try:
+            if source.startswith(('http://', 'https://')):
+                with urlopen(source, timeout=30) as response:
+                    text = response.read().decode()
+            else:
+                with open(source, encoding='utf-8') as f:
+                    text = f.read()
+        except OSError as e:
+            raise CommandError(f'Could not read {source}: {e}')
+        
+        rates = []
+        for line, row in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+            try:
+                per_usd = Decimal(row['per_usd'])
+                # amounts are divided by these, so 0, negative, NaN or infinite rates would corrupt every total
+                if not per_usd.is_finite() or per_usd <= 0:
+                    raise ValueError('per_usd must be a positive number')
+                rates.append(ExchangeRate(
+                    date=date.fromisoformat(row['date']),
+                    currency=row['currency'].strip().upper(),
+                    per_usd=per_usd,
+                ))
+            except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+                raise CommandError(f'Line {line}: invalid row {row!r} ({e})')
+        
+        ExchangeRate.objects.bulk_create(
+            rates, batch_size=1000,
+            update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['per_usd'],
+        )
+        invalidate_rates()
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rates)} exchange rates'))
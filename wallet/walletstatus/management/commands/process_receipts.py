@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from walletstatus.receipts import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Generate EXIF-free copies and thumbnails for uploaded receipts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Worker threads (default: RECEIPT_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        try:
+            run_worker(workers=options['workers'], poll_interval=options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus import shards
+from walletstatus.models import ShardPlacement
+
+
+class Command(BaseCommand):
+    help = "Move users' transactions to the database the hash ring assigns them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ring',
+            help='Comma-separated databases to balance onto (default: TRANSACTION_SHARDS). Users moved '
+                 'off the current ring are pinned until TRANSACTION_SHARDS is switched to the new one.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report which users would move')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        nodes = options['ring'].split(',') if options['ring'] else settings.TRANSACTION_SHARDS
+        unknown = [node for node in nodes if node not in shards.aliases()]
+        if unknown:
+            raise CommandError(f"Unknown database(s): {', '.join(unknown)}. Configured: {', '.join(shards.aliases())}")
+        ring = shards.HashRing(nodes)
+
+        moves = [
+            (user_id, alias, ring.node_for(user_id))
+            for alias, user_ids in shards.locate_users().items()
+            for user_id in sorted(user_ids)
+            if ring.node_for(user_id) != alias
+        ]
+        rows = 0
+        for user_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f'user {user_id}: {source} -> {target}')
+                continue
+            rows += shards.move_user(user_id, source, target, batch_size=options['batch_size'])
+
+        # pins left over from an earlier run that the current ring now agrees with
+        current = shards.ring()
+        released = 0
+        if not options['dry_run']:
+            for user_id, alias in ShardPlacement.objects.values_list('user_id', 'alias'):
+                if current.node_for(user_id) == alias:
+                    shards.pin(user_id, None)
+                    released += 1
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(moves)} user(s), {rows} transaction(s); released {released} pin(s)'
+        ))
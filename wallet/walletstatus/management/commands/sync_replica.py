@@ -0,0 +1,29 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file (stand-in for replication)'
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica configured; set DATABASE_REPLICA_NAME.')
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if 'sqlite3' not in primary['ENGINE']:
+            raise CommandError('Only SQLite replicas are synced here; use database-level replication otherwise.')
+        
+        # names may be file: URIs, as Django's in-memory test databases are
+        source = sqlite3.connect(str(primary['NAME']), uri=True)
+        target = sqlite3.connect(str(replica['NAME']), uri=True)
+        try:
+            # The online backup API takes a consistent snapshot without blocking writers for long
+            source.backup(target, pages=1024)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Replica {replica['NAME']} synced from {primary['NAME']}"))
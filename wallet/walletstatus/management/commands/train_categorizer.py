@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from walletstatus.categorizer import Categorizer
+
+
+class Command(BaseCommand):
+    help = "Train the category suggestion model on every user's categorized transactions"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        trainer = Categorizer()
+        model = trainer.train_global()
+        trainer.save(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained on {int(model.docs.sum())} transaction(s) in {time.perf_counter() - started:.2f}s; '
+            f'saved to {settings.CATEGORIZER_MODEL_PATH}'
+        ))
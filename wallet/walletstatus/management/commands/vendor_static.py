@@ -0,0 +1,38 @@
+import re
+from pathlib import Path
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from walletstatus.vendor import ASSETS
+
+# Source maps are not vendored, and the manifest storage rejects references to missing files
+SOURCE_MAP_COMMENT = re.compile(rb'\n?/[/*]# sourceMappingURL=[^\n]*')
+
+
+class Command(BaseCommand):
+    help = 'Download the pinned Bootstrap, Font Awesome and Chart.js builds into static/vendor/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download files that are already present')
+
+    def handle(self, *args, **options):
+        vendor_dir = Path(settings.STATICFILES_DIRS[0]) / 'vendor'
+        fetched = 0
+        for relative, url in ASSETS.items():
+            target = vendor_dir / relative
+            if target.exists() and not options['force']:
+                continue
+            try:
+                with urlopen(url, timeout=30) as response:
+                    data = response.read()
+            except OSError as e:
+                raise CommandError(f'Could not download {url}: {e}')
+            if target.suffix in ('.css', '.js'):
+                data = SOURCE_MAP_COMMENT.sub(b'', data)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            fetched += 1
+            self.stdout.write(f'{relative} ({len(data)} bytes)')
+        self.stdout.write(self.style.SUCCESS(f'Vendored {fetched} of {len(ASSETS)} assets into {vendor_dir}'))
@@ -0,0 +1,82 @@
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .profiles import aget_profile, get_profile
+from .routers import replica_configured
+
+STICKY_COOKIE = 'wallet_primary_until'
+
+
+class ReplicaStickinessMiddleware:
+    """Decide per request whether replica reads are allowed.
+    
+    Unsafe methods always use the primary and start a stickiness window
+    (settings.REPLICA_STICKY_SECONDS) recorded in a cookie; requests inside
+    that window keep reading from the primary.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, is_write = self.route(request)
+        return self.pin(self.get_response(request), started, is_write)
+    
+    async def __acall__(self, request):
+        started, is_write = self.route(request)
+        return self.pin(await self.get_response(request), started, is_write)
+    
+    def route(self, request):
+        now = time.time()
+        try:
+            sticky_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            sticky_until = 0
+        is_write = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        request.use_primary = is_write or sticky_until > now or not replica_configured()
+        return now, is_write
+    
+    def pin(self, response, now, is_write):
+        if is_write and replica_configured():
+            sticky_seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, str(now + sticky_seconds), max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+def load_profile(request):
+    return get_profile(request.user.pk) if request.user.is_authenticated else None
+
+
+async def aload_profile(request):
+    user = await request.auser()
+    return await aget_profile(user.pk) if user.is_authenticated else None
+
+
+class UserProfileMiddleware:
+    """Attach the signed-in user's cached profile as ``request.profile``.
+    
+    It is loaded on first access; async views use ``await request.aprofile()``.
+    Must come after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(partial(load_profile, request))
+        request.aprofile = partial(aload_profile, request)
+        return self.get_response(request)
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0003_advisorjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.UUIDField()),
+                ('summary', models.TextField(blank=True)),
+                ('summarized_until', models.DateTimeField(help_text='created_at of the newest turn folded into the summary')),
+                ('turn_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='aiconversation',
+            index=models.Index(fields=['user', 'conversation_id', '-created_at'], name='walletstatu_user_id_93dc47_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationsummary',
+            unique_together={('user', 'conversation_id')},
+        ),
+    ]
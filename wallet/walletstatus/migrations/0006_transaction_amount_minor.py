@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:31
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+
+def backfill_amount_minor(apps, schema_editor):
+    Transaction = apps.get_model('walletstatus', 'Transaction')
+    Transaction.objects.update(amount_minor=Cast(Round(F('amount') * 100), BigIntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0005_conversationarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_amount_minor, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:32
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_currency(apps, schema_editor):
+    Transaction = apps.get_model('walletstatus', 'Transaction')
+    UserProfile = apps.get_model('walletstatus', 'UserProfile')
+    profiles = UserProfile.objects.filter(user_id=OuterRef('user_id')).values('currency')[:1]
+    Transaction.objects.filter(user__userprofile__isnull=False).update(currency=Subquery(profiles))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0006_transaction_amount_minor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='currency',
+            field=models.CharField(default='USD', max_length=3),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(max_length=3)),
+                ('per_usd', models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+            options={
+                'ordering': ['currency', 'date'],
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_currency, migrations.RunPython.noop),
+    ]
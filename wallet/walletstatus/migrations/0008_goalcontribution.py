@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def opening_balances(apps, schema_editor):
+    """Seed the ledger so existing current_amount values equal the sum of contributions"""
+    SavingsGoal = apps.get_model('walletstatus', 'SavingsGoal')
+    GoalContribution = apps.get_model('walletstatus', 'GoalContribution')
+    GoalContribution.objects.bulk_create(
+        GoalContribution(goal=goal, amount=goal.current_amount, date=goal.created_at.date(), note='Opening balance')
+        for goal in SavingsGoal.objects.filter(current_amount__gt=0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0007_multi_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoalContribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date', models.DateField()),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('goal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='walletstatus.savingsgoal')),
+            ],
+            options={
+                'ordering': ['date', 'pk'],
+                'indexes': [models.Index(fields=['goal', 'date'], name='walletstatu_goal_id_fc83e3_idx')],
+            },
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0009_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='category_auto',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:51
+
+import hashlib
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import migrations, models
+
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def fingerprint(date, amount, currency, description):
+    """walletstatus.duplicates.fingerprint as of this migration, frozen so later changes cannot alter it"""
+    cents = int((Decimal(amount) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    normalized = NON_WORD.sub(' ', (description or '').lower()).strip()
+    key = f'{date}|{cents}|{currency}|{normalized}'
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def backfill_fingerprint(apps, schema_editor):
+    Transaction = apps.get_model('walletstatus', 'Transaction')
+    batch = []
+    for t in Transaction.objects.only('date', 'amount', 'currency', 'description').iterator(chunk_size=2000):
+        t.fingerprint = fingerprint(t.date, t.amount, t.currency, t.description)
+        batch.append(t)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0010_transaction_category_auto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(backfill_fingerprint, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'fingerprint'], name='walletstatu_user_id_c0622e_idx'),
+        ),
+    ]
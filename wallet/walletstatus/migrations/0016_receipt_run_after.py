@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletstatus', '0015_idempotencykey_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Value, Window
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from functools import cached_property
 import uuid
 
+from .duplicates import fingerprint
+from .money import to_minor, from_minor, minor_sum, percentage
+from .shards import ShardedQuerySet
+
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = [
         ('student', 'Student'),
@@ -51,6 +59,63 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_category_type_display()})"
 
+class Receipt(models.Model):
+    """Receipt image stored once per content hash, processed by `manage.py process_receipts`"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
+    sha256 = models.CharField(max_length=64, unique=True)
+    # raw upload as received; deleted once the EXIF-free copy and thumbnails exist
+    upload = models.FileField(max_length=255, blank=True)
+    image = models.FileField(max_length=255, blank=True)
+    # {max edge in px: storage name}
+    thumbnails = models.JSONField(default=dict, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    upload_bytes = models.PositiveIntegerField(default=0)
+    stored_bytes = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # a pending receipt is not claimed before this, so failed attempts back off
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.get_status_display()})"
+    
+    @property
+    def thumbnail_url(self):
+        """URL of the smallest thumbnail, or None until the receipt is processed"""
+        if not self.thumbnails:
+            return None
+        return self.image.storage.url(self.thumbnails[min(self.thumbnails, key=int)])
+
+class TransactionQuerySet(ShardedQuerySet):
+    def update(self, **kwargs):
+        """Bulk update that keeps amount_minor in step with amount.
+
+        Like every queryset update it skips save(), so the fingerprint is not
+        recomputed; an amount given as an expression is refused, since its
+        cents cannot be worked out here.
+        """
+        if 'amount' in kwargs and 'amount_minor' not in kwargs:
+            if hasattr(kwargs['amount'], 'resolve_expression'):
+                raise ValueError('update(amount=<expression>) needs a matching amount_minor')
+            kwargs['amount_minor'] = to_minor(kwargs['amount'])
+            kwargs['amount'] = from_minor(kwargs['amount_minor'])
+        return super().update(**kwargs)
+    update.alters_data = True
+
 class Transaction(models.Model):
     TRANSACTION_TYPE_CHOICES = [
         ('income', 'Income'),
@@ -58,16 +123,28 @@ class Transaction(models.Model):
         ('transfer', 'Transfer'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Rows may live on a shard (walletstatus.shards) while users, categories and
+    # receipts stay on default, so these relations have no database constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     transaction_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # amount in cents, kept in sync by save() and update(); aggregate this instead of amount
+    amount_minor = models.BigIntegerField(default=0, editable=False)
+    currency = models.CharField(max_length=3, default='USD')
+    # hash of date, amount, currency and normalized description, kept in sync on save
+    fingerprint = models.CharField(max_length=16, blank=True, editable=False)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPE_CHOICES)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
+    # category filled in by the categorizer rather than chosen by the user; not trained on
+    category_auto = models.BooleanField(default=False)
     description = models.CharField(max_length=255)
     date = models.DateField()
     location = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
     receipt_image = models.ImageField(upload_to='receipts/', null=True, blank=True)
+    receipt = models.ForeignKey(
+        Receipt, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions', db_constraint=False
+    )
     is_recurring = models.BooleanField(default=False)
     recurring_frequency = models.CharField(
         max_length=20, 
@@ -82,11 +159,29 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = TransactionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [models.Index(fields=['user', 'fingerprint'])]
     
     def __str__(self):
         return f"{self.user.username} - {self.amount} ({self.get_transaction_type_display()})"
+    
+    def save(self, *args, **kwargs):
+        self.amount_minor = to_minor(self.amount)
+        # store the amount rounded the same way, not as the column would round it
+        self.amount = from_minor(self.amount_minor)
+        self.fingerprint = fingerprint(self.date, self.amount, self.currency, self.description)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'amount' in update_fields:
+                update_fields.add('amount_minor')
+            if update_fields & {'date', 'amount', 'currency', 'description'}:
+                update_fields.add('fingerprint')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
 class Budget(models.Model):
     BUDGET_PERIOD_CHOICES = [
@@ -118,25 +213,30 @@ class Budget(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.category.name} Budget ({self.period})"
     
-    def get_spent_amount(self):
-        """Calculate total spent in this budget period"""
-        transactions = Transaction.objects.filter(
-            user=self.user,
-            category=self.category,
+    @cached_property
+    def spent_minor(self):
+        """Total spent in this budget period, in cents of the user's home currency"""
+        from .fx import convert_rows, home_currency
+        rows = convert_rows(Transaction.objects.filter(
+            user_id=self.user_id,
+            category_id=self.category_id,
             transaction_type='expense',
             date__gte=self.start_date,
             date__lte=self.end_date
-        )
-        return sum(t.amount for t in transactions)
+        ).values('currency', 'date').annotate(total=minor_sum()).order_by(), home_currency(self.user_id), ['total'])
+        return sum(row['total'] for row in rows)
+    
+    def get_spent_amount(self):
+        """Calculate total spent in this budget period"""
+        return from_minor(self.spent_minor)
     
     def get_remaining_amount(self):
         """Calculate remaining budget amount"""
-        return self.amount - self.get_spent_amount()
+        return from_minor(to_minor(self.amount) - self.spent_minor)
     
     def get_usage_percentage(self):
         """Calculate budget usage percentage"""
-        spent = self.get_spent_amount()
-        return round((spent / self.amount) * 100, 2) if self.amount > 0 else 0
+        return percentage(self.spent_minor, to_minor(self.amount))
 
 class SavingsGoal(models.Model):
     GOAL_STATUS_CHOICES = [
@@ -169,16 +269,60 @@ class SavingsGoal(models.Model):
     
     def get_progress_percentage(self):
         """Calculate goal completion percentage"""
-        return round((self.current_amount / self.target_amount) * 100, 2) if self.target_amount > 0 else 0
+        return percentage(to_minor(self.current_amount), to_minor(self.target_amount))
     
     def get_monthly_target(self):
         """Calculate monthly savings needed to reach goal"""
+        from .projections import get_projections
+        projection = get_projections(self.user_id).get(self.pk)
+        if projection is not None:
+            return projection['monthly_target']
         from datetime import date
         today = date.today()
         months_remaining = (self.target_date.year - today.year) * 12 + (self.target_date.month - today.month)
         remaining_amount = self.target_amount - self.current_amount
         return remaining_amount / months_remaining if months_remaining > 0 else remaining_amount
 
+    def add_contribution(self, amount, date=None, note=''):
+        """Record a contribution and bump current_amount atomically in the database"""
+        amount = Decimal(amount)
+        with transaction.atomic():
+            contribution = GoalContribution.objects.create(
+                goal=self, amount=amount, date=date or timezone.localdate(), note=note
+            )
+            SavingsGoal.objects.filter(pk=self.pk).update(
+                current_amount=F('current_amount') + amount, updated_at=timezone.now()
+            )
+            SavingsGoal.objects.filter(
+                pk=self.pk, status='active', current_amount__gte=F('target_amount')
+            ).update(status='completed')
+        self.refresh_from_db(fields=['current_amount', 'status', 'updated_at'])
+        return contribution
+    
+    def progress_series(self):
+        """[(date, cumulative amount)] of contributions, from one window-function query"""
+        rows = self.contributions.annotate(
+            cumulative=Window(Sum('amount'), order_by=[F('date').asc(), F('pk').asc()])
+        ).values_list('date', 'cumulative')
+        series = {}
+        for day, cumulative in rows:
+            series[day] = cumulative  # the last contribution of a day carries its running total
+        return list(series.items())
+
+class GoalContribution(models.Model):
+    goal = models.ForeignKey(SavingsGoal, on_delete=models.CASCADE, related_name='contributions')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateField()
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['date', 'pk']
+        indexes = [models.Index(fields=['goal', 'date'])]
+    
+    def __str__(self):
+        return f"{self.goal.name} + {self.amount} on {self.date}"
+
 class JobOpportunity(models.Model):
     EMPLOYMENT_TYPE_CHOICES = [
         ('full_time', 'Full Time'),
@@ -259,11 +403,192 @@ class AIConversation(models.Model):
     conversation_type = models.CharField(max_length=30, choices=CONVERSATION_TYPE_CHOICES, default='general')
     user_message = models.TextField()
     ai_response = models.TextField()
-    context_data = models.JSONField(default=dict, blank=True)  # Store relevant financial data
+    # financial context that changed since the previous live turn (see walletstatus.retention)
+    context_data = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'conversation_id', '-created_at'])]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_conversation_type_display()} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+class IdempotencyKey(models.Model):
+    """Stored response for a client-supplied Idempotency-Key so retried writes are not duplicated"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # None while the request that claimed the key is still writing its rows
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['user', 'key']
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.key}"
+
+class ConversationSummary(models.Model):
+    """Rolling summary of the turns of a conversation that fell out of the prompt window"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    conversation_id = models.UUIDField()
+    summary = models.TextField(blank=True)
+    summarized_until = models.DateTimeField(help_text="created_at of the newest turn folded into the summary")
+    turn_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'conversation_id']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.conversation_id} ({self.turn_count} turns)"
+
+class AdvisorJob(models.Model):
+    """Queued AI advisor request, processed by `manage.py run_advisor_worker`"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    job_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    conversation_id = models.UUIDField(default=uuid.uuid4)
+    conversation_type = models.CharField(max_length=30, choices=AIConversation.CONVERSATION_TYPE_CHOICES, default='general')
+    user_message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    ai_response = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.get_status_display()} ({self.job_id})"
+
+class ConversationArchive(models.Model):
+    """Compressed JSONL of an archived conversation, see walletstatus/retention.py"""
+    COMPRESSION_CHOICES = [
+        ('gzip', 'gzip'),
+        ('zstd', 'Zstandard'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    conversation_id = models.UUIDField(db_index=True)
+    turn_count = models.PositiveIntegerField()
+    first_message_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+    compression = models.CharField(max_length=10, choices=COMPRESSION_CHOICES, default='gzip')
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_message_at']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.conversation_id} ({self.turn_count} turns)"
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` per 1 USD on ``date``; any pair is derived through USD"""
+    date = models.DateField()
+    currency = models.CharField(max_length=3)
+    per_usd = models.DecimalField(max_digits=18, decimal_places=8)
+    
+    class Meta:
+        unique_together = ['currency', 'date']
+        ordering = ['currency', 'date']
+    
+    def __str__(self):
+        return f"{self.date} 1 USD = {self.per_usd} {self.currency}"
+
+class ShardPlacement(models.Model):
+    """A user whose transactions sit on ``alias`` rather than where the hash ring puts them"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    alias = models.CharField(max_length=100)
+    moved_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
+
+class SpendingStats(models.Model):
+    """Running statistics of a user's expenses in one category and currency, in cents.
+
+    Kept up to date as transactions are saved (walletstatus/anomalies.py):
+    Welford's count, mean and sum of squared deviations from the mean, plus
+    an exponentially weighted moving average of recent expenses.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    currency = models.CharField(max_length=3)
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    ewma = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            # one row per key, uncategorized expenses included
+            models.UniqueConstraint(
+                F('user'), Coalesce(F('category'), Value(0)), F('currency'), name='unique_spending_stats_key',
+            ),
+        ]
+        verbose_name_plural = "Spending stats"
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.category_id or 'uncategorized'} {self.currency} ({self.count})"
+
+class SpendingAnomaly(models.Model):
+    """An expense far above what the user usually spends in its category"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # the transaction may live on a shard, so it is referenced by its UUID
+    transaction_id = models.UUIDField(unique=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    description = models.CharField(max_length=255)
+    amount_minor = models.BigIntegerField()
+    currency = models.CharField(max_length=3)
+    expected_minor = models.BigIntegerField(help_text="Recent average expense in the category, in cents")
+    score = models.FloatField(help_text="Standard deviations above the recent average")
+    date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date', '-created_at']
+        indexes = [models.Index(fields=['user', '-date'])]
+        verbose_name_plural = "Spending anomalies"
+    
+    @property
+    def amount(self):
+        return from_minor(self.amount_minor)
+    
+    @property
+    def expected(self):
+        return from_minor(self.expected_minor)
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.description} {self.amount} {self.currency} ({self.score:.1f} sd)"
+
+class Statement(models.Model):
+    """A user's monthly statement, written by ``manage.py generate_statements`` (walletstatus/statements.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    month = models.DateField(help_text="First day of the month")
+    # hash of the month's grouped totals; a run skips the user while it is unchanged
+    signature = models.CharField(max_length=32)
+    transaction_count = models.PositiveIntegerField(default=0)
+    csv_file = models.FileField(upload_to='statements/', blank=True)
+    pdf_file = models.FileField(upload_to='statements/', blank=True)
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'month']
+        ordering = ['-month']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.month:%Y-%m}"
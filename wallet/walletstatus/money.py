@@ -0,0 +1,36 @@
+"""Money arithmetic in integer minor units (cents).
+
+Amounts are summed in SQL as integers and only turned back into Decimal at
+the display boundary, avoiding per-value Decimal/float conversions in hot
+aggregation paths.
+"""
+from decimal import Decimal, ROUND_HALF_UP, ROUND_HALF_EVEN
+
+from django.db.models import Sum, Q
+from django.db.models.functions import Coalesce
+
+MINOR_UNITS = 100
+CENT = Decimal('0.01')
+
+
+def to_minor(amount):
+    """Decimal (or str/int) amount -> integer cents"""
+    return int((Decimal(amount) * MINOR_UNITS).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor):
+    """Integer cents -> Decimal with two places, for display"""
+    return (Decimal(minor or 0) / MINOR_UNITS).quantize(CENT)
+
+
+def minor_sum(field='amount_minor', **filters):
+    """SQL aggregate summing a minor-unit column, 0 instead of NULL, optionally filtered"""
+    condition = Q(**filters) if filters else None
+    return Coalesce(Sum(field, filter=condition), 0)
+
+
+def percentage(part_minor, whole_minor):
+    """part / whole * 100 rounded to two places, 0 when whole is not positive"""
+    if whole_minor <= 0:
+        return 0
+    return (Decimal(part_minor * 100) / Decimal(whole_minor)).quantize(CENT, rounding=ROUND_HALF_EVEN)
@@ -0,0 +1,36 @@
+"""Per-request access to the signed-in user's UserProfile, cached.
+
+Profiles are created by a post_save signal on User, and for users older
+than the signal by migration 0017, so loading one is a plain read.
+``UserProfileMiddleware`` exposes ``request.profile`` (and ``await
+request.aprofile()`` for async views), loaded on first access from the Django
+cache and dropped from it whenever the profile is saved. Another worker only
+sees that drop through a shared cache, so without ``CACHE_URL`` the profile
+is not cached (``PROFILE_CACHE_TIMEOUT`` 0).
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserProfile
+
+PROFILE_CACHE_KEY = 'walletstatus:profile:{}'
+
+
+def get_profile(user_id):
+    """The UserProfile of ``user_id``, from the cache when possible"""
+    key = PROFILE_CACHE_KEY.format(user_id)
+    profile = cache.get(key)
+    if profile is None:
+        profile = UserProfile.objects.get(user_id=user_id)
+        if settings.PROFILE_CACHE_TIMEOUT:
+            cache.set(key, profile, settings.PROFILE_CACHE_TIMEOUT)
+    return profile
+
+
+async def aget_profile(user_id):
+    return await sync_to_async(get_profile)(user_id)
+
+
+def invalidate(user_id):
+    cache.delete(PROFILE_CACHE_KEY.format(user_id))
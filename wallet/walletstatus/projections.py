@@ -0,0 +1,116 @@
+"""Batch projections for a user's savings goals.
+
+All of a user's goals are projected together from one aggregate over recent
+transactions: the average monthly net income is allocated to active goals in
+priority order (then by target date), giving each goal its required monthly
+contribution, projected completion date and whether it is feasible. Results
+are cached per user, home currency and exchange-rate version, and dropped
+when a Transaction or SavingsGoal changes.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .fx import CURRENCY_CHOICES, convert_rows, home_currency, rates_version
+from .lazy import LazyModule
+from .models import Transaction, SavingsGoal
+from .money import to_minor, from_minor, minor_sum
+
+np = LazyModule('numpy')
+
+CACHE_KEY = 'walletstatus:goal_projections:{}:{}:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + (end.month - start.month)
+
+
+def add_months(start, months):
+    """``start`` moved forward by a (possibly fractional) number of months"""
+    return start + timedelta(days=round(float(months) * 30.4375))
+
+
+def average_monthly_net(user_id, today):
+    """Average monthly net income (cents, home currency) over the lookback window"""
+    months = settings.SAVINGS_PROJECTION_LOOKBACK_MONTHS
+    start = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+    rows = convert_rows(Transaction.objects.filter(
+        user_id=user_id,
+        date__gte=start,
+        date__lt=today.replace(day=1)
+    ).values('currency', 'date').annotate(
+        income=minor_sum(transaction_type='income'),
+        expenses=minor_sum(transaction_type='expense'),
+    ).order_by(), home_currency(user_id), ['income', 'expenses'])
+    return sum(row['income'] - row['expenses'] for row in rows) / months
+
+
+def compute_projections(user_id, today=None):
+    """Project every active goal of ``user_id``; returns {goal_id: projection dict}"""
+    today = today or date.today()
+    goals = list(SavingsGoal.objects.filter(user_id=user_id, status='active').order_by(
+        '-priority', 'target_date', 'pk'
+    ).values('pk', 'target_amount', 'current_amount', 'target_date'))
+    if not goals:
+        return {}
+    
+    remaining = np.maximum(
+        np.array([to_minor(g['target_amount']) - to_minor(g['current_amount']) for g in goals], dtype=np.float64), 0
+    )
+    months_left = np.array([months_between(today, g['target_date']) for g in goals], dtype=np.float64)
+    # Same rule as SavingsGoal.get_monthly_target: everything is due now once the target month has passed
+    required = np.where(months_left > 0, remaining / np.maximum(months_left, 1), remaining)
+    
+    # Allocate the monthly surplus in priority order; goals are already sorted
+    available = max(average_monthly_net(user_id, today), 0)
+    funded_before = np.concatenate(([0], np.cumsum(required)[:-1]))
+    allocated = np.clip(available - funded_before, 0, required)
+    feasible = allocated >= required - 0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        months_to_complete = np.where(allocated > 0, remaining / allocated, np.inf)
+    
+    projections = {}
+    for i, goal in enumerate(goals):
+        if remaining[i] == 0:
+            completion = today
+        elif np.isfinite(months_to_complete[i]):
+            completion = add_months(today, months_to_complete[i])
+        else:
+            completion = None
+        projections[goal['pk']] = {
+            'monthly_target': from_minor(int(round(required[i]))),
+            'allocated_monthly': from_minor(int(round(allocated[i]))),
+            'projected_completion': completion,
+            'feasible': bool(feasible[i]),
+        }
+    return projections
+
+
+def get_projections(user_id):
+    """Cached projections for all of a user's active goals"""
+    key = CACHE_KEY.format(user_id, home_currency(user_id), rates_version())
+    projections = cache.get(key)
+    if projections is None:
+        projections = compute_projections(user_id)
+        cache.set(key, projections, CACHE_TIMEOUT)
+    return projections
+
+
+def invalidate(user_id):
+    # entries of older rate versions are never read again; those of every currency may be
+    version = rates_version()
+    cache.delete_many([CACHE_KEY.format(user_id, currency, version) for currency, _ in CURRENCY_CHOICES])
+
+
+def attach(goals):
+    """Set ``goal.projection`` on each goal (None for inactive goals)"""
+    by_user = {}
+    for goal in goals:
+        if goal.user_id not in by_user:
+            by_user[goal.user_id] = get_projections(goal.user_id)
+        goal.projection = by_user[goal.user_id].get(goal.pk)
+    return goals
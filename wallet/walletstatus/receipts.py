@@ -0,0 +1,189 @@
+"""Receipt uploads and their background image processing.
+
+The request only hashes the upload (already spooled to a temporary file in
+chunks) and stores it once under its SHA-256, so identical receipts share one
+Receipt row and one set of files. A pool of worker threads then decodes each
+pending upload with Pillow, bakes in the EXIF orientation, and writes an
+EXIF-free downscaled copy plus one thumbnail per RECEIPT_THUMBNAIL_SIZES.
+Pillow releases the GIL while decoding, resizing and encoding, so threads
+share the CPU work. Lists link to thumbnails only. Uploads are checked with
+Pillow before they are stored, and failed attempts are retried with
+exponential backoff.
+"""
+import hashlib
+import io
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .lazy import LazyModule
+from .models import Receipt
+
+Image = LazyModule('PIL.Image')
+ImageOps = LazyModule('PIL.ImageOps')
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 256 * 1024
+# formats phones and scanners produce; anything else is refused rather than handed to a rarer decoder
+ACCEPTED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF'}
+
+
+class InvalidReceipt(ValueError):
+    pass
+
+
+def content_name(sha256, suffix):
+    """Storage name of a content-addressed receipt file"""
+    return f'receipts/{sha256[:2]}/{sha256}{suffix}'
+
+
+def store_upload(upload):
+    """Store an uploaded receipt once per content hash and return its Receipt"""
+    if upload.size > settings.RECEIPT_MAX_UPLOAD_BYTES:
+        raise InvalidReceipt(f'Receipts are limited to {settings.RECEIPT_MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+    # the client's content type proves nothing; let Pillow read the header and check the file's structure
+    try:
+        with Image.open(upload) as image:
+            image_format = image.format
+            image.verify()
+    except (Image.DecompressionBombError, SyntaxError, OSError, ValueError):
+        raise InvalidReceipt('Receipts must be images')
+    if image_format not in ACCEPTED_FORMATS:
+        raise InvalidReceipt('Receipts must be JPEG, PNG, WebP, GIF, BMP or TIFF images')
+
+    digest = hashlib.sha256()
+    for chunk in upload.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    receipt = Receipt.objects.filter(sha256=sha256).first()
+    if receipt is not None:
+        return receipt
+    upload.seek(0)
+    name = default_storage.save(content_name(sha256, '.upload'), upload)
+    try:
+        return Receipt.objects.create(sha256=sha256, upload=name, upload_bytes=upload.size)
+    except IntegrityError:
+        # the same receipt was uploaded concurrently; keep the first copy
+        default_storage.delete(name)
+        return Receipt.objects.get(sha256=sha256)
+
+
+def save_jpeg(image, name):
+    """Encode ``image`` as a JPEG without metadata under ``name``; returns (name, bytes)"""
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=settings.RECEIPT_JPEG_QUALITY, optimize=True, progressive=True)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue())), buffer.tell()
+
+
+def render(receipt):
+    """Write the EXIF-free copy and thumbnails of a receipt's upload"""
+    max_dimension = settings.RECEIPT_MAX_DIMENSION
+    with default_storage.open(receipt.upload.name) as f:
+        image = Image.open(f)
+        # JPEGs can be decoded straight at a reduced scale
+        image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+    image = image.convert('RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    receipt.width, receipt.height = image.size
+    receipt.image.name, stored_bytes = save_jpeg(image, content_name(receipt.sha256, '.jpg'))
+    receipt.thumbnails = {}
+    for size in sorted(settings.RECEIPT_THUMBNAIL_SIZES, reverse=True):
+        # each size is resized from the previous, larger one
+        image.thumbnail((size, size), Image.LANCZOS)
+        receipt.thumbnails[str(size)], size_bytes = save_jpeg(image, content_name(receipt.sha256, f'_{size}.jpg'))
+        stored_bytes += size_bytes
+    return stored_bytes
+
+
+def claim_next():
+    """Atomically claim the oldest pending receipt, or return None.
+
+    Receipts left 'processing' past RECEIPT_LEASE seconds belong to a worker
+    that died and are claimed again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RECEIPT_LEASE)
+    runnable = Receipt.objects.filter(
+        Q(status='pending', run_after__lte=now) | Q(status='processing', updated_at__lt=stale)
+    )
+    for receipt in runnable.order_by('created_at')[:5]:
+        claimed = Receipt.objects.filter(
+            pk=receipt.pk, status=receipt.status, updated_at=receipt.updated_at
+        ).update(status='processing', attempts=receipt.attempts + 1, updated_at=now)
+        if claimed:
+            receipt.status = 'processing'
+            receipt.attempts += 1
+            receipt.updated_at = now
+            return receipt
+    return None
+
+
+def process(receipt):
+    """Render one claimed receipt, retrying transient failures up to RECEIPT_MAX_ATTEMPTS with backoff"""
+    try:
+        receipt.stored_bytes = render(receipt)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, SyntaxError) as e:
+        receipt.status = 'failed'
+        receipt.error = f'Not a usable image: {e}'
+    except Exception as e:
+        logger.warning('Receipt %s attempt %s failed: %s', receipt.pk, receipt.attempts, e)
+        receipt.error = str(e)
+        if receipt.attempts >= settings.RECEIPT_MAX_ATTEMPTS:
+            receipt.status = 'failed'
+        else:
+            delay = settings.RECEIPT_RETRY_BACKOFF * (2 ** (receipt.attempts - 1))
+            receipt.status = 'pending'
+            receipt.run_after = timezone.now() + timedelta(seconds=delay * random.uniform(1, 1.5))
+    else:
+        default_storage.delete(receipt.upload.name)
+        receipt.upload.name = ''
+        receipt.status = 'ready'
+        receipt.error = ''
+    receipt.save()
+    return receipt
+
+
+def run_worker(workers=None, poll_interval=1.0, once=False):
+    """Process receipts on ``workers`` threads until interrupted (or the queue is empty when ``once``)"""
+    workers = workers or settings.RECEIPT_WORKERS
+    stop = threading.Event()
+
+    def work():
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                receipt = claim_next()
+                if receipt is not None:
+                    process(receipt)
+                elif once:
+                    return
+                else:
+                    stop.wait(poll_interval)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='receipts') as pool:
+        futures = [pool.submit(work) for _ in range(workers)]
+        try:
+            while not all(future.done() for future in futures):
+                time.sleep(0.2)
+        finally:
+            stop.set()
+        for future in futures:
+            future.result()
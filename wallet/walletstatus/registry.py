@@ -0,0 +1,82 @@
+"""In-process registry of Category rows.
+
+Categories are a small, rarely changing table, so each worker loads them once
+and serves id -> category lookups from memory. A version stamp kept in the
+Django cache is bumped whenever a category changes; workers compare it on
+access and reload when it differs. Point CACHES at a shared backend (Redis,
+Memcached) so the version is seen by every worker process.
+"""
+import threading
+import uuid
+
+from django.core.cache import cache
+
+VERSION_CACHE_KEY = 'walletstatus:category_registry_version'
+
+
+class CategoryRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_id = {}
+        self._ordered = []
+
+    def _shared_version(self):
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_CACHE_KEY)
+        return version
+
+    def _load(self):
+        version = self._shared_version()
+        if version != self._version or version is None:
+            with self._lock:
+                if version != self._version or version is None:
+                    from .models import Category
+                    categories = list(Category.objects.all())
+                    self._by_id = {category.id: category for category in categories}
+                    self._ordered = categories
+                    self._version = version
+        return self._by_id
+
+    @property
+    def version(self):
+        """The shared version stamp, for keys of anything rendered from categories"""
+        return self._shared_version()
+
+    def invalidate(self):
+        """Publish a new version so every worker reloads on its next access"""
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        self._version = None
+
+    def all(self):
+        """All categories ordered by name"""
+        self._load()
+        return list(self._ordered)
+
+    def filter(self, category_type=None):
+        """Categories of one type (or all), ordered by type then name"""
+        self._load()
+        categories = [c for c in self._ordered if category_type is None or c.category_type == category_type]
+        return sorted(categories, key=lambda c: (c.category_type, c.name))
+
+    def get(self, category_id):
+        """Return the category for ``category_id`` or None"""
+        try:
+            return self._load().get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def ids(self):
+        return set(self._load())
+
+    def attach(self, objects):
+        """Populate ``obj.category`` from the registry instead of joining Category"""
+        by_id = self._load()
+        for obj in objects:
+            obj.category = by_id.get(obj.category_id)
+        return objects
+
+
+categories = CategoryRegistry()
@@ -0,0 +1,193 @@
+"""Retention and archival of AIConversation rows.
+
+Conversations whose newest turn is older than the retention period for their
+type are moved, a chunk at a time, into ConversationArchive rows holding the
+turns as compressed JSONL. context_data is delta-encoded against the previous
+turn, since consecutive turns mostly repeat the same profile snapshot; live
+rows already store it that way (see ``context_delta``), and ``full_contexts``
+rebuilds the snapshots. Archived turns stay readable through ``load_turns``.
+"""
+import gzip
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AIConversation, ConversationArchive
+
+REMOVED_KEYS = '__removed__'
+
+
+def compress(data, method):
+    if method == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=9)
+
+
+def decompress(data, method):
+    if method == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def retention_days(conversation_type):
+    policy = settings.AI_CONVERSATION_RETENTION_DAYS
+    return policy.get(conversation_type, policy['default'])
+
+
+def context_delta(previous, context):
+    """The entries of ``context`` that differ from ``previous``, plus the keys it no longer has"""
+    delta = {key: value for key, value in context.items() if previous.get(key) != value or key not in previous}
+    removed = [key for key in previous if key not in context]
+    if removed:
+        delta[REMOVED_KEYS] = removed
+    return delta
+
+
+def apply_delta(context, delta):
+    """Inverse of context_delta: a new dict with ``delta`` applied to ``context``"""
+    removed = delta.get(REMOVED_KEYS, [])
+    context = {key: value for key, value in context.items() if key not in removed}
+    context.update({key: value for key, value in delta.items() if key != REMOVED_KEYS})
+    return context
+
+
+def full_contexts(deltas):
+    """The full context_data of consecutive live turns (oldest first) from their stored deltas"""
+    contexts, context = [], {}
+    for delta in deltas:
+        context = apply_delta(context, delta or {})
+        contexts.append(context)
+    return contexts
+
+
+def conversation_context(user_id, conversation_id):
+    """Full context_data of the newest live turn of a conversation, {} if it has none"""
+    contexts = full_contexts(AIConversation.objects.filter(
+        user_id=user_id, conversation_id=conversation_id,
+    ).order_by('created_at').values_list('context_data', flat=True))
+    return contexts[-1] if contexts else {}
+
+
+def encode_turns(turns):
+    """Serialize turns (oldest first, with full context_data) to JSONL with delta-encoded context_data"""
+    lines = []
+    previous = {}
+    for turn in turns:
+        context = turn.context_data or {}
+        delta = context_delta(previous, context)
+        lines.append(json.dumps({
+            'conversation_type': turn.conversation_type,
+            'user_message': turn.user_message,
+            'ai_response': turn.ai_response,
+            'created_at': turn.created_at.isoformat(),
+            'context_delta': delta,
+        }, separators=(',', ':')))
+        previous = context
+    return '\n'.join(lines).encode()
+
+
+def decode_turns(payload):
+    """Inverse of encode_turns: list of turn dicts with full context_data"""
+    turns = []
+    context = {}
+    for line in payload.decode().splitlines():
+        turn = json.loads(line)
+        context = apply_delta(context, turn.pop('context_delta'))
+        turn['context_data'] = context
+        turn['created_at'] = parse_datetime(turn['created_at'])
+        turns.append(turn)
+    return turns
+
+
+def find_expired(now=None):
+    """(user_id, conversation_id) pairs whose newest turn is past retention for every type they contain"""
+    now = now or timezone.now()
+    policy = settings.AI_CONVERSATION_RETENTION_DAYS
+    earliest_cutoff = now - timedelta(days=min(policy.values()))
+    
+    # Conversations idle for at least the shortest retention period...
+    candidates = {
+        (row['user_id'], row['conversation_id']): row['last']
+        for row in AIConversation.objects.values('user_id', 'conversation_id').annotate(
+            last=Max('created_at')
+        ).filter(last__lt=earliest_cutoff).order_by()
+    }
+    # ...must also be past the retention period of every type of turn they hold
+    longest_retention = {}
+    for row in AIConversation.objects.values('user_id', 'conversation_id', 'conversation_type').annotate(
+        last=Max('created_at')
+    ).filter(last__lt=earliest_cutoff).order_by():
+        key = (row['user_id'], row['conversation_id'])
+        longest_retention[key] = max(longest_retention.get(key, 0), retention_days(row['conversation_type']))
+    
+    return [
+        key for key, last in candidates.items()
+        if last < now - timedelta(days=longest_retention.get(key, policy['default']))
+    ]
+
+
+def archive_chunk(keys, compression):
+    """Archive the conversations in ``keys`` and delete their live rows; returns the turn count"""
+    conversation_ids = [conversation_id for _, conversation_id in keys]
+    turns = AIConversation.objects.filter(conversation_id__in=conversation_ids).order_by('conversation_id', 'created_at')
+    grouped = {}
+    for turn in turns:
+        grouped.setdefault((turn.user_id, turn.conversation_id), []).append(turn)
+    
+    keys = set(keys)
+    for items in grouped.values():
+        for turn, context in zip(items, full_contexts(turn.context_data for turn in items)):
+            turn.context_data = context
+    archives = [
+        ConversationArchive(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            turn_count=len(items),
+            first_message_at=items[0].created_at,
+            last_message_at=items[-1].created_at,
+            compression=compression,
+            payload=compress(encode_turns(items), compression),
+        )
+        for (user_id, conversation_id), items in grouped.items()
+        if (user_id, conversation_id) in keys
+    ]
+    pks = [turn.pk for key, items in grouped.items() if key in keys for turn in items]
+    with db_transaction.atomic():
+        ConversationArchive.objects.bulk_create(archives)
+        AIConversation.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def archive_expired(chunk_size=None, compression=None, now=None, dry_run=False):
+    """Archive every expired conversation; returns (conversations, turns)"""
+    chunk_size = chunk_size or settings.AI_CONVERSATION_ARCHIVE_CHUNK_SIZE
+    compression = compression or settings.AI_CONVERSATION_ARCHIVE_COMPRESSION
+    keys = find_expired(now)
+    if dry_run:
+        return len(keys), AIConversation.objects.filter(conversation_id__in=[c for _, c in keys]).count()
+    
+    turns = 0
+    for start in range(0, len(keys), chunk_size):
+        turns += archive_chunk(keys[start:start + chunk_size], compression)
+    return len(keys), turns
+
+
+def load_turns(user, conversation_id):
+    """All turns of a conversation, archived and live, oldest first"""
+    turns = []
+    for archive in ConversationArchive.objects.filter(user=user, conversation_id=conversation_id).order_by('first_message_at'):
+        turns.extend(decode_turns(decompress(bytes(archive.payload), archive.compression)))
+    live = list(AIConversation.objects.filter(user=user, conversation_id=conversation_id).order_by('created_at').values(
+        'conversation_type', 'user_message', 'ai_response', 'created_at', 'context_data',
+    ))
+    for turn, context in zip(live, full_contexts(turn['context_data'] for turn in live)):
+        turn['context_data'] = context
+    turns.extend(live)
+    return turns
@@ -0,0 +1,70 @@
+"""Routing of read-only views to a reporting replica.
+
+Reads go to the ``replica`` alias only while a view wrapped in
+``read_from_replica`` is running, so ordinary views and every write keep
+using ``default``. After a user writes, ``ReplicaStickinessMiddleware`` pins
+their requests to the primary for a short window so they always see their
+own changes.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+_use_replica = ContextVar('walletstatus_use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class use_replica:
+    """Context manager routing reads inside the block to the replica"""
+    def __enter__(self):
+        self._token = _use_replica.set(replica_configured())
+        return self
+    
+    def __exit__(self, *exc_info):
+        _use_replica.reset(self._token)
+
+
+def read_from_replica(view_func):
+    """Serve the view's reads from the replica unless the request is pinned to the primary"""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if getattr(request, 'use_primary', True):
+                return await view_func(request, *args, **kwargs)
+            with use_replica():
+                return await view_func(request, *args, **kwargs)
+        return async_wrapper
+    
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if getattr(request, 'use_primary', True):
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_ALIAS
+        return None
+    
+    def db_for_write(self, model, **hints):
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so relations across them are fine
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema through replication, not migrations
+        return db != REPLICA_ALIAS
+
@@ -0,0 +1,22 @@
+from rest_framework import serializers
+
+from .fx import CURRENCY_CHOICES
+from .models import Transaction
+
+
+class TransactionWriteSerializer(serializers.Serializer):
+    """Validate one incoming transaction row for the bulk write API"""
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    currency = serializers.ChoiceField(choices=CURRENCY_CHOICES, required=False, default=None)
+    transaction_type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPE_CHOICES)
+    category = serializers.IntegerField(required=False, allow_null=True, default=None)
+    description = serializers.CharField(max_length=255)
+    date = serializers.DateField()
+    location = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    
+    def validate_category(self, value):
+        """Check the category against the preloaded id map instead of querying per row"""
+        if value is not None and value not in self.context['category_ids']:
+            raise serializers.ValidationError('Unknown category.')
+        return value
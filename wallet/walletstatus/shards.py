@@ -0,0 +1,437 @@
+"""Partitioning of Transaction rows across several databases by user.
+
+Each user's transactions live in one database, picked by a consistent-hash
+ring over TRANSACTION_SHARDS (DATABASE_SHARDS adds ``shard0``, ``shard1``, ...
+next to ``default``), so adding a shard only moves the users whose ring
+position it takes over. ``ShardPlacement`` rows override the ring for users
+that sit elsewhere while `manage.py rebalance_shards` moves them.
+
+``ShardedQuerySet`` sends a query filtered to one user (``user=...`` or
+``user_id=...`` keyword) to that user's shard; writes of an instance follow
+its ``user_id``. Anything else stays on ``default`` unless the queryset is
+made with ``across_shards()``, which fans reads, counts, aggregates, updates
+and deletes out to every database in parallel and merges the results. Ids
+are drawn from a separate range on each shard, so a pk is unique everywhere.
+
+With no shards configured every query goes to ``default`` as before.
+"""
+import hashlib
+import threading
+from bisect import bisect
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, models, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.query import FlatValuesListIterable, ModelIterable
+
+from .routers import ReadReplicaRouter
+
+SHARDED_MODELS = {'walletstatus.transaction'}
+PLACEMENT_CACHE_KEY = 'walletstatus:shard:{}'
+VIRTUAL_NODES = 64
+# each database allocates transaction ids from its own block of this size
+ID_BLOCK = 1 << 40
+USER_LOOKUPS = {
+    'user', 'user_id', 'user__pk', 'user__id',
+    'user__exact', 'user_id__exact', 'user__pk__exact', 'user__id__exact',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.SHARD_ALIASES)
+
+
+def aliases():
+    """Every database that may hold transactions"""
+    return [DEFAULT_DB_ALIAS, *settings.SHARD_ALIASES]
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of user ids onto database aliases"""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((_hash(f'{node}#{i}'), node) for node in nodes for i in range(virtual_nodes))
+        self._hashes = [h for h, node in points]
+        self._nodes = [node for h, node in points]
+
+    def node_for(self, user_id):
+        index = bisect(self._hashes, _hash(str(user_id))) % len(self._hashes)
+        return self._nodes[index]
+
+
+@lru_cache(maxsize=8)
+def _ring(nodes):
+    return HashRing(nodes)
+
+
+def ring():
+    return _ring(tuple(settings.TRANSACTION_SHARDS))
+
+
+def placement(user_id):
+    """The database ``user_id`` was pinned to while being moved, or None to follow the ring"""
+    from .models import ShardPlacement
+    key = PLACEMENT_CACHE_KEY.format(user_id)
+    timeout = settings.SHARD_PLACEMENT_CACHE_TIMEOUT
+    # a per-process cache would keep routing to the old shard after another process moves the user
+    alias = cache.get(key) if timeout else None
+    if alias is None:
+        alias = ShardPlacement.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id
+        ).values_list('alias', flat=True).first() or ''
+        if timeout:
+            cache.set(key, alias, timeout)
+    return alias or None
+
+
+def shard_for(user_id):
+    """The database holding the transactions of ``user_id``"""
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    return placement(user_id) or ring().node_for(user_id)
+
+
+def id_base(alias):
+    return aliases().index(alias) * ID_BLOCK
+
+
+def reserve_ids(alias):
+    """Start the transaction id sequence of ``alias`` at its own block"""
+    from .models import Transaction
+    base = id_base(alias)
+    table = Transaction._meta.db_table
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, base])
+            elif row[0] < base:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [base, table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f'SELECT last_value FROM {sequence}')
+            if cursor.fetchone()[0] < base:
+                cursor.execute('SELECT setval(%s, %s)', [sequence, base])
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.SHARD_WORKERS, thread_name_prefix='shards')
+    return _executor
+
+
+def _managed(func, alias):
+    close_old_connections()
+    try:
+        return func(alias)
+    finally:
+        close_old_connections()
+
+
+def scatter(func, databases=None):
+    """``func(alias)`` for every database (or ``databases``), run in parallel; results in alias order.
+    
+    Each call runs on a pool thread with its own connections, so it neither
+    sees nor joins the caller's open transaction (and on SQLite waits for its
+    write lock).
+    """
+    databases = list(databases or aliases())
+    if len(databases) == 1 or not settings.SHARD_WORKERS:
+        return [func(alias) for alias in databases]
+    return list(executor().map(lambda alias: _managed(func, alias), databases))
+
+
+def user_lookup(lookups):
+    """The user id a filter's keyword ``lookups`` pin the query to, if any"""
+    for key in USER_LOOKUPS.intersection(lookups):
+        value = lookups[key]
+        return getattr(value, 'pk', value)
+    return None
+
+
+def _sort_key(value):
+    # NULLs sort first ascending, as on SQLite
+    return (value is not None, value)
+
+
+def _descending(term):
+    return term.startswith('-') if isinstance(term, str) else getattr(term, 'descending', False)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet of a model partitioned by user; see the module docstring"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scatter = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._scatter = self._scatter
+        return clone
+
+    def _for_user(self, user_id):
+        clone = self._chain()
+        # _clone shares the hints dict, so replace it rather than update it
+        clone._hints = {**clone._hints, 'user_id': user_id}
+        return clone
+
+    def _scatters(self):
+        return self._scatter and self._db is None and 'user_id' not in self._hints and enabled()
+
+    def across_shards(self):
+        """Run this query on every database holding rows and merge the results"""
+        clone = self._chain()
+        clone._scatter = True
+        return clone
+
+    def filter(self, *args, **kwargs):
+        clone = super().filter(*args, **kwargs)
+        user_id = user_lookup(kwargs)
+        return clone._for_user(user_id) if user_id is not None else clone
+
+    def create(self, **kwargs):
+        user_id = user_lookup(kwargs)
+        queryset = self._for_user(user_id) if user_id is not None and self._db is None else self
+        return super(ShardedQuerySet, queryset).create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is not None or not enabled():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups, placed = {}, {}
+        for obj in objs:
+            if obj.user_id not in placed:
+                placed[obj.user_id] = shard_for(obj.user_id)
+            groups.setdefault(placed[obj.user_id], []).append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if self._db is not None or not enabled():
+            return super().bulk_update(objs, fields, batch_size)
+        groups, placed = {}, {}
+        for obj in objs:
+            if not obj._state.db and obj.user_id not in placed:
+                placed[obj.user_id] = shard_for(obj.user_id)
+            groups.setdefault(obj._state.db or placed[obj.user_id], []).append(obj)
+        return sum(self.using(alias).bulk_update(group, fields, batch_size) for alias, group in groups.items())
+    bulk_update.alters_data = True
+
+    def _ordering_keys(self):
+        """(attname, descending) pairs to merge shard results by, as far as the ordering is on local fields"""
+        ordering = self.query.order_by or (self.query.default_ordering and self.model._meta.ordering) or ()
+        keys = []
+        for term in ordering:
+            name = term.lstrip('-') if isinstance(term, str) else getattr(getattr(term, 'expression', None), 'name', None)
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            try:
+                attname = getattr(self.model._meta.get_field(name), 'attname', None)
+            except FieldDoesNotExist:
+                attname = None
+            if attname is None:
+                break
+            keys.append((attname, _descending(term)))
+        return keys
+
+    def _merge(self, results):
+        rows = [row for result in results for row in result]
+        if self._iterable_class is ModelIterable:
+            for attname, descending in reversed(self._ordering_keys()):
+                rows.sort(key=lambda row: _sort_key(getattr(row, attname)), reverse=descending)
+        elif self._iterable_class is FlatValuesListIterable:
+            # distinct values for admin list filters and date drill-downs
+            if self.query.distinct:
+                rows = list(dict.fromkeys(rows))
+            if self.query.order_by:
+                rows.sort(key=_sort_key, reverse=_descending(self.query.order_by[0]))
+        return rows
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._scatters():
+            low, high = self.query.low_mark, self.query.high_mark
+
+            def fetch(alias):
+                queryset = self.using(alias)
+                queryset._prefetch_related_lookups = ()
+                queryset.query.clear_limits()
+                if high is not None:
+                    queryset.query.set_limits(high=high)
+                return list(queryset)
+
+            self._result_cache = self._merge(scatter(fetch))[low:high]
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=None):
+        if not self._scatters():
+            return super().iterator(chunk_size)
+        # one database after the other, in no overall order
+        return (row for alias in aliases() for row in self.using(alias).iterator(chunk_size))
+
+    def count(self):
+        if self._result_cache is not None or not self._scatters():
+            return super().count()
+        low, high = self.query.low_mark, self.query.high_mark
+        unsliced = self._chain()
+        unsliced.query.clear_limits()
+        total = max(sum(scatter(lambda alias: unsliced.using(alias).count())) - low, 0)
+        return total if high is None else min(total, high - low)
+
+    def exists(self):
+        if self._result_cache is not None or not self._scatters():
+            return super().exists()
+        return any(scatter(lambda alias: self.using(alias).exists()))
+
+    def aggregate(self, *args, **kwargs):
+        if not self._scatters():
+            return super().aggregate(*args, **kwargs)
+        expressions = {**{arg.default_alias: arg for arg in args}, **kwargs}
+        for name, expression in expressions.items():
+            if not isinstance(expression, (Sum, Count, Min, Max)) or getattr(expression, 'distinct', False):
+                raise NotImplementedError(f'{name} cannot be combined across shards')
+        results = scatter(lambda alias: self.using(alias).aggregate(*args, **kwargs))
+        combined = {}
+        for name, expression in expressions.items():
+            values = [result[name] for result in results if result[name] is not None]
+            if isinstance(expression, Min):
+                combined[name] = min(values, default=None)
+            elif isinstance(expression, Max):
+                combined[name] = max(values, default=None)
+            else:
+                combined[name] = sum(values) if values else None
+        return combined
+
+    def update(self, **kwargs):
+        if not self._scatters():
+            return super().update(**kwargs)
+        return sum(scatter(lambda alias: self.using(alias).update(**kwargs)))
+    update.alters_data = True
+
+    def delete(self):
+        if not self._scatters():
+            return super().delete()
+        deleted, per_model = 0, Counter()
+        for count, counts in scatter(lambda alias: self.using(alias).delete()):
+            deleted += count
+            per_model.update(counts)
+        return deleted, dict(per_model)
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class ShardRouter:
+    """Route sharded models to the user's database; must come before ReadReplicaRouter"""
+
+    def _shard(self, model, hints, write=False):
+        instance = hints.get('instance')
+        if isinstance(instance, model):
+            # assigning a related object stamps _state.db with its database, so writes go by user
+            return shard_for(instance.user_id) if write or not instance._state.db else instance._state.db
+        if 'user_id' in hints:
+            return shard_for(hints['user_id'])
+        return None
+
+    def _related(self, model, hints):
+        # rows loaded from a shard point at users, categories and receipts kept on default
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.SHARD_ALIASES:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not enabled():
+            return None
+        if is_sharded(model):
+            return self._shard(model, hints)
+        if self._related(model, hints):
+            return ReadReplicaRouter().db_for_read(model) or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not enabled():
+            return None
+        if is_sharded(model):
+            return self._shard(model, hints, write=True)
+        return self._related(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1) or is_sharded(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # shards get the schema but not data migrations, which would write through the router
+        if db in settings.SHARD_ALIASES:
+            return model_name is not None
+        return None
+
+
+def locate_users():
+    """{alias: set of user ids with transactions there}, read from every database in parallel"""
+    from .models import Transaction
+    return dict(zip(aliases(), scatter(
+        lambda alias: set(Transaction.objects.using(alias).order_by().values_list('user_id', flat=True).distinct())
+    )))
+
+
+def pin(user_id, alias):
+    """Route ``user_id`` to ``alias`` regardless of the ring (None to follow the ring again)"""
+    from .models import ShardPlacement
+    if alias is None:
+        ShardPlacement.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).delete()
+    else:
+        ShardPlacement.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'alias': alias})
+    transaction.on_commit(lambda: cache.delete(PLACEMENT_CACHE_KEY.format(user_id)), using=DEFAULT_DB_ALIAS)
+
+
+def move_user(user_id, source, target, batch_size=1000):
+    """Copy the transactions of ``user_id`` from ``source`` to ``target``, route to it, drop the originals.
+
+    The copies get ids from the target's block; ``transaction_id`` is kept,
+    which also makes a repeated move skip rows that were already copied. The
+    source stays locked for writes (BEGIN IMMEDIATE on SQLite) while the user
+    is moved; a write that was routed before the switch lands on the source
+    and is picked up by the next run.
+    """
+    from .models import Transaction
+    copied = 0
+    with transaction.atomic(using=source):
+        rows = Transaction.objects.using(source).filter(user_id=user_id).order_by('pk')
+        with transaction.atomic(using=target):
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                row.pk = None
+                batch.append(row)
+                if len(batch) == batch_size:
+                    Transaction.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+                    copied += len(batch)
+                    batch = []
+            Transaction.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+        pin(user_id, None if ring().node_for(user_id) == target else target)
+        rows.delete()
+    return copied
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .fx import HOME_CURRENCY_CACHE_KEY, invalidate_rates
+from .models import (
+    Category, UserProfile, ExchangeRate, Receipt, Statement, Transaction, Budget, SavingsGoal, GoalContribution,
+    JobOpportunity, UserJobApplication,
+)
+from . import anomalies, fragments, heatmap, profiles, projections, shards
+from .categorizer import categorizer
+from .registry import categories
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_registry(sender, **kwargs):
+    """Bump the shared category version whenever a category changes"""
+    categories.invalidate()
+
+
+@receiver(post_save, sender=User)
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """Every user gets a profile when created, so views never have to make one"""
+    if created and not raw:
+        UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_home_currency(sender, instance, **kwargs):
+    cache.delete(HOME_CURRENCY_CACHE_KEY.format(instance.user_id))
+    profiles.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+@receiver([post_save, post_delete], sender=SavingsGoal)
+def invalidate_goal_projections(sender, instance, **kwargs):
+    projections.invalidate(instance.user_id)
+    fragments.bump('budgets' if sender is Transaction else 'goals', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def invalidate_heatmap(sender, instance, **kwargs):
+    heatmap.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def refresh_categorizer(sender, instance, created=False, **kwargs):
+    if created:
+        categorizer.note_added(instance.user_id)
+    else:
+        categorizer.invalidate(instance.user_id)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_stored_transaction(sender, instance, raw=False, **kwargs):
+    """Keep the row an edit overwrites, to take it back out of the spending statistics"""
+    instance._stored = None if raw or instance._state.adding else anomalies.stored(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def update_spending_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_stored', None)
+    if stored is not None:
+        if anomalies.counted(stored) == anomalies.counted(instance):
+            return
+        anomalies.forget([stored])
+    anomalies.observe([instance])
+
+
+@receiver(post_delete, sender=Transaction)
+def forget_spending_stats(sender, instance, **kwargs):
+    anomalies.forget([instance])
+
+
+@receiver(post_save, sender=SavingsGoal)
+def record_opening_balance(sender, instance, created, raw=False, **kwargs):
+    """A goal created with money already saved (e.g. in the admin) starts its ledger with that amount"""
+    if created and not raw and instance.current_amount > 0:
+        GoalContribution.objects.create(
+            goal=instance, amount=instance.current_amount, date=timezone.localdate(instance.created_at),
+            note='Opening balance',
+        )
+
+
+@receiver([post_save, post_delete], sender=GoalContribution)
+def invalidate_goal_projections_for_contribution(sender, instance, **kwargs):
+    projections.invalidate(instance.goal.user_id)
+    fragments.bump('goals', instance.goal.user_id)
+
+
+@receiver([post_save, post_delete], sender=Budget)
+def invalidate_budget_fragments(sender, instance, **kwargs):
+    fragments.bump('budgets', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=JobOpportunity)
+def invalidate_job_fragments(sender, **kwargs):
+    fragments.bump('jobs')
+
+
+@receiver([post_save, post_delete], sender=UserJobApplication)
+def invalidate_application_fragments(sender, instance, **kwargs):
+    fragments.bump('applications', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def invalidate_exchange_rates(sender, **kwargs):
+    invalidate_rates()
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_transactions(sender, instance, **kwargs):
+    """CASCADE only reaches rows on the default database; delete the user's shard rows too"""
+    if shards.enabled():
+        Transaction.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Receipt)
+def clear_sharded_references(sender, instance, **kwargs):
+    """SET_NULL only reaches rows on the default database; clear references on the shards too"""
+    field = 'category' if sender is Category else 'receipt'
+    # on this thread: the delete holds the default database's write lock
+    for alias in settings.SHARD_ALIASES:
+        Transaction.objects.using(alias).filter(**{field: instance}).update(**{field: None})
+
+
+@receiver(pre_delete, sender=Category)
+def uncategorize_spending_stats(sender, instance, **kwargs):
+    """The category's transactions become uncategorized; so do their statistics"""
+    anomalies.uncategorize(instance)
+
+
+@receiver(post_delete, sender=Statement)
+def delete_statement_files(sender, instance, **kwargs):
+    for file in (instance.csv_file, instance.pdf_file):
+        if file.name:
+            file.storage.delete(file.name)
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    if sender.name == 'walletstatus' and using in settings.SHARD_ALIASES:
+        shards.reserve_ids(using)
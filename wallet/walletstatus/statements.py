@@ -0,0 +1,247 @@
+"""Monthly statements, generated in batches by ``manage.py generate_statements``.
+
+Users are split into chunks and each chunk is one task for a process pool.
+A task reads the month for its whole chunk with one grouped query (totals
+by user, category, currency and type, with row counts and the latest edit)
+and hashes each user's groups into a signature. Users whose signature
+matches their last statement are skipped; the transactions of the rest are
+loaded with one more query and written to ``MEDIA_ROOT`` as CSV and/or PDF.
+Amounts are totalled per currency, as recorded, so no exchange rates are
+involved.
+"""
+import csv
+import hashlib
+import io
+import secrets
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction as db_transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .money import from_minor
+from .registry import categories
+
+FORMATS = ('csv', 'pdf')
+LINE_FIELDS = ('user_id', 'date', 'description', 'category_id', 'transaction_type', 'amount_minor', 'currency')
+
+
+def month_bounds(month):
+    """First and last day of the month ``month`` falls in"""
+    first = month.replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def last_month(today=None):
+    return ((today or date.today()).replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def month_groups(user_ids, month):
+    """{user_id: [grouped totals]} for the month, from one query over every user in ``user_ids``"""
+    from .models import Transaction
+    groups = defaultdict(list)
+    rows = Transaction.objects.across_shards().filter(
+        user_id__in=user_ids, date__range=month_bounds(month),
+    ).values('user_id', 'category_id', 'currency', 'transaction_type').annotate(
+        total_minor=Sum('amount_minor'), count=Count('pk'), last_updated=Max('updated_at'),
+    ).order_by()
+    for row in rows:
+        groups[row.pop('user_id')].append(row)
+    return groups
+
+
+def signature(groups):
+    key = sorted(
+        (g['category_id'] or 0, g['currency'], g['transaction_type'], g['total_minor'], g['count'], str(g['last_updated']))
+        for g in groups
+    )
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+def summarize(groups):
+    """Per-currency income, expenses and net, and per-category expenses, in cents"""
+    totals = defaultdict(lambda: {'income': 0, 'expense': 0})
+    spending = defaultdict(int)
+    for g in groups:
+        if g['transaction_type'] in ('income', 'expense'):
+            totals[g['currency']][g['transaction_type']] += g['total_minor']
+        if g['transaction_type'] == 'expense':
+            category = categories.get(g['category_id'])
+            spending[(category.name if category else 'Uncategorized', g['currency'])] += g['total_minor']
+    return (
+        [(currency, t['income'], t['expense'], t['income'] - t['expense']) for currency, t in sorted(totals.items())],
+        sorted(spending.items(), key=lambda item: (item[0][1], -item[1])),
+    )
+
+
+def money(minor):
+    return f'{from_minor(minor):,.2f}'
+
+
+def render_csv(username, month, groups, lines):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Date', 'Description', 'Category', 'Type', 'Amount', 'Currency'])
+    for line in lines:
+        category = categories.get(line['category_id'])
+        writer.writerow([
+            line['date'].isoformat(), line['description'], category.name if category else '',
+            line['transaction_type'], from_minor(line['amount_minor']), line['currency'],
+        ])
+    totals, _ = summarize(groups)
+    writer.writerow([])
+    writer.writerow(['Currency', 'Income', 'Expenses', 'Net'])
+    for currency, income, expenses, net in totals:
+        writer.writerow([currency, from_minor(income), from_minor(expenses), from_minor(net)])
+    return buffer.getvalue().encode()
+
+
+def render_pdf(username, month, groups, lines):
+    totals, spending = summarize(groups)
+    text = [f'Statement for {username}', f'{month:%B %Y}', '']
+    text.append(f"{'Currency':<10}{'Income':>16}{'Expenses':>16}{'Net':>16}")
+    text += [f'{c:<10}{money(i):>16}{money(e):>16}{money(n):>16}' for c, i, e, n in totals]
+    text += ['', 'Spending by category']
+    text += [f'{name[:40]:<42}{money(total):>16} {currency}' for (name, currency), total in spending]
+    text += ['', f"{'Date':<12}{'Description':<38}{'Type':<10}{'Amount':>14} Cur"]
+    for line in lines:
+        sign = '-' if line['transaction_type'] == 'expense' else ''
+        text.append(
+            f"{line['date'].isoformat():<12}{line['description'][:36]:<38}{line['transaction_type']:<10}"
+            f"{sign + money(line['amount_minor']):>14} {line['currency']}"
+        )
+    return pdf_document(text)
+
+
+def pdf_document(text, lines_per_page=64):
+    """A minimal PDF showing ``text`` lines in 9pt Courier on A4 pages"""
+    def escape(line):
+        line = line.encode('latin-1', 'replace').decode('latin-1')
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    pages = [text[i:i + lines_per_page] for i in range(0, len(text), lines_per_page)] or [[]]
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % (4 + 2 * i) for i in range(len(pages))), len(pages),
+        ),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>',
+    ]
+    for i, page in enumerate(pages):
+        stream = 'BT /F1 9 Tf 12 TL 40 800 Td\n' + ''.join(f'({escape(line)}) Tj T*\n' for line in page) + 'ET'
+        stream = stream.encode('latin-1')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (5 + 2 * i)
+        )
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+RENDERERS = {'csv': render_csv, 'pdf': render_pdf}
+
+
+def generate_chunk(user_ids, month, formats=FORMATS, force=False):
+    """Write the month's statements of ``user_ids`` that are missing or out of date; returns (written, skipped)"""
+    from django.contrib.auth.models import User
+    from .models import Statement, Transaction
+    groups = month_groups(user_ids, month)
+    existing = {s.user_id: s for s in Statement.objects.filter(user_id__in=user_ids, month=month)}
+    stale = {}
+    for user_id in user_ids:
+        statement = existing.get(user_id)
+        if statement is None and user_id not in groups:
+            continue
+        current = signature(groups.get(user_id, []))
+        if (
+            not force and statement is not None and statement.signature == current
+            and all(getattr(statement, f'{fmt}_file') for fmt in formats)
+        ):
+            continue
+        stale[user_id] = current
+    if not stale:
+        return 0, len(user_ids)
+
+    lines = defaultdict(list)
+    for line in Transaction.objects.across_shards().filter(
+        user_id__in=list(stale), date__range=month_bounds(month),
+    ).order_by('date', 'created_at').values(*LINE_FIELDS):
+        lines[line['user_id']].append(line)
+    usernames = dict(User.objects.filter(pk__in=stale).values_list('pk', 'username'))
+
+    written, obsolete = [], []
+    now = timezone.now()
+    for user_id, current in stale.items():
+        if user_id not in usernames:
+            # deleted since the grouped query
+            continue
+        statement = existing.get(user_id) or Statement(user_id=user_id, month=month)
+        token = secrets.token_hex(8)  # files are served from MEDIA_URL, so their names must not be guessable
+        for fmt in FORMATS:
+            file = getattr(statement, f'{fmt}_file')
+            if file.name:
+                obsolete.append(file.name)
+            if fmt in formats:
+                content = RENDERERS[fmt](usernames[user_id], month, groups.get(user_id, []), lines[user_id])
+                file.save(f'{user_id}-{month:%Y-%m}-{token}.{fmt}', ContentFile(content), save=False)
+            else:
+                # written from older data; drop it rather than serve it
+                file.name = ''
+        statement.signature = current
+        statement.transaction_count = len(lines[user_id])
+        statement.generated_at = now
+        written.append(statement)
+
+    with db_transaction.atomic():
+        Statement.objects.bulk_create([s for s in written if s.pk is None])
+        Statement.objects.bulk_update(
+            [s for s in written if s.pk is not None],
+            ['signature', 'transaction_count', 'csv_file', 'pdf_file', 'generated_at'],
+        )
+    for name in obsolete:
+        default_storage.delete(name)
+    return len(written), len(user_ids) - len(written)
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def generate(month, formats=FORMATS, user_ids=None, chunk_size=None, workers=None, force=False):
+    """Bring the month's statements of ``user_ids`` (default everyone) up to date.
+
+    Chunks of users run on a pool of ``workers`` processes (default
+    ``STATEMENT_WORKERS``; 0 runs them in this process). Returns (written, skipped).
+    """
+    from django.contrib.auth.models import User
+    if user_ids is None:
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    chunk_size = chunk_size or settings.STATEMENT_CHUNK_SIZE
+    workers = settings.STATEMENT_WORKERS if workers is None else workers
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    task = partial(generate_chunk, month=month, formats=tuple(formats), force=force)
+    if not workers or len(chunks) <= 1:
+        results = [task(chunk) for chunk in chunks]
+    else:
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker) as pool:
+            results = list(pool.map(task, chunks))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
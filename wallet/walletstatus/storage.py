@@ -0,0 +1,48 @@
+"""Static files storage with hashed names and precompressed variants.
+
+``collectstatic`` writes every asset under a content-hashed name (so it can be
+cached forever) and, for text assets, ``.gz`` and optionally ``.br`` siblings
+next to the hashed file. ``views.static_asset`` picks the variant the client
+accepts; a front-end server can serve the same files directly.
+"""
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf', '.json', '.txt', '.html')
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def compress(data, method):
+    if method == 'br':
+        import brotli
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.write_variants(hashed_name)
+
+    def write_variants(self, name):
+        """Write a compressed copy of ``name`` per configured method, when it is smaller"""
+        with self.open(name) as f:
+            data = f.read()
+        for method in settings.STATIC_PRECOMPRESSION:
+            compressed = compress(data, method)
+            variant = name + SUFFIXES[method]
+            if self.exists(variant):
+                self.delete(variant)
+            if len(compressed) < len(data):
+                self._save(variant, ContentFile(compressed))
@@ -1,5 +1,7 @@
 from django import template
 
+from ..fx import symbol
+
 register = template.Library()
 
 @register.filter
@@ -8,4 +10,8 @@ def split(value, delimiter=','):
 
 @register.filter
 def strip(value):
-    return value.strip() 
\ No newline at end of file
+    return value.strip()
+
+@register.filter
+def currency_symbol(code):
+    return symbol(code)
@@ -0,0 +1,10 @@
+from django import template
+
+from ..vendor import asset_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_asset(path):
+    return asset_url(path)
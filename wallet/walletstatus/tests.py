@@ -1,3 +1,1096 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from . import (
+    advisor, anomalies, api, fx, profiles, projections, receipts, retention, shards, statements, throttling, views,
+)
+from .categorizer import Categorizer
+from .duplicates import find_duplicates, fingerprint, normalize
+from .middleware import STICKY_COOKIE
+from .models import (
+    AdvisorJob, AIConversation, Budget, Category, ExchangeRate, IdempotencyKey, JobOpportunity, Receipt, SavingsGoal,
+    ShardPlacement, SpendingAnomaly, SpendingStats, Statement, Transaction, UserJobApplication, UserProfile,
+)
+from .money import from_minor, minor_sum, to_minor
+from .routers import REPLICA_ALIAS, use_replica
+from .throttling import acquire_slot, release_slot
+
+
+class MinorUnitTests(TestCase):
+    """Cent totals must match summing the Decimal amounts"""
+
+    amounts = ['12.34', '0.01', '-5.50', '999.99', '-0.99', '0.10', '1234.56']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('money', password='pass')
+        cls.category = Category.objects.create(name='Groceries', category_type='expense')
+        for amount in cls.amounts:
+            Transaction.objects.create(
+                user=cls.user, amount=Decimal(amount), transaction_type='expense', category=cls.category,
+                description=f'Spent {amount}', date=date(2025, 3, 15),
+            )
+
+    def test_to_minor_rounds_half_cents_away_from_zero(self):
+        self.assertEqual(to_minor('0.005'), 1)
+        self.assertEqual(to_minor('0.015'), 2)
+        self.assertEqual(to_minor('-0.005'), -1)
+        self.assertEqual(to_minor('-2.345'), -235)
+        self.assertEqual(to_minor('0.0049'), 0)
+
+    def test_from_minor_round_trips(self):
+        for amount in self.amounts + ['0.00', '-0.01']:
+            self.assertEqual(from_minor(to_minor(amount)), Decimal(amount))
+        self.assertEqual(from_minor(None), Decimal('0.00'))
+
+    def test_minor_sum_matches_decimal_sum(self):
+        expected = sum(Decimal(amount) for amount in self.amounts)
+        total = Transaction.objects.filter(user=self.user).aggregate(total=minor_sum())['total']
+        self.assertEqual(from_minor(total), expected)
+
+    def test_minor_sum_filters_and_defaults_to_zero(self):
+        negative = Transaction.objects.filter(user=self.user).aggregate(total=minor_sum(amount_minor__lt=0))['total']
+        self.assertEqual(from_minor(negative), Decimal('-6.49'))
+        none = Transaction.objects.filter(user=self.user, date__year=2000).aggregate(total=minor_sum())['total']
+        self.assertEqual(none, 0)
+
+    def test_half_cent_amounts_are_stored_consistently(self):
+        transaction = Transaction.objects.create(
+            user=self.user, amount=Decimal('0.005'), transaction_type='income',
+            description='Rounding', date=date(2025, 3, 16),
+        )
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.amount_minor, to_minor(transaction.amount))
+
+    def test_budget_spent_matches_decimal_sum(self):
+        budget = Budget.objects.create(
+            user=self.user, category=self.category, amount=Decimal('100.00'),
+            start_date=date(2025, 3, 1), end_date=date(2025, 3, 31),
+        )
+        expected = sum(Decimal(amount) for amount in self.amounts)
+        self.assertEqual(budget.get_spent_amount(), expected)
+        self.assertEqual(budget.get_remaining_amount(), Decimal('100.00') - expected)
+
+    def test_queryset_update_keeps_amount_minor(self):
+        Transaction.objects.filter(user=self.user, amount=Decimal('0.01')).update(amount=Decimal('-7.25'))
+        self.assertEqual(Transaction.objects.get(user=self.user, amount=Decimal('-7.25')).amount_minor, -725)
+        with self.assertRaises(ValueError):
+            Transaction.objects.filter(user=self.user).update(amount=F('amount') * 2)
+
+
+class BulkTransactionApiTests(APITestCase):
+
+    rows = [
+        {'amount': '12.50', 'transaction_type': 'expense', 'description': 'Groceries', 'date': '2025-03-01'},
+        {'amount': '900.00', 'transaction_type': 'income', 'description': 'Pay', 'date': '2025-03-02'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer', password='pass')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def post(self, rows=None, key=None, query=''):
+        extra = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(reverse('api_bulk_transactions') + query, rows or self.rows, format='json', **extra)
+
+    def test_first_request_stores_its_response_with_the_key(self):
+        response = self.post(key='import-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(IdempotencyKey.objects.get(user=self.user, key='import-1').response, response.json())
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post(key='import-1')
+        retry = self.post([{**self.rows[0], 'description': 'Something else'}], key='import-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    def test_request_in_flight_gets_409(self):
+        IdempotencyKey.objects.create(user=self.user, key='import-1', response=None)
+        response = self.post(key='import-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_claim_of_a_dead_request_is_taken_over(self):
+        claim = IdempotencyKey.objects.create(user=self.user, key='import-1', response=None)
+        stale = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TIMEOUT + 1)
+        IdempotencyKey.objects.filter(pk=claim.pk).update(created_at=stale)
+        response = self.post(key='import-1')
+        self.assertEqual(response.status_code, 201)
+        claim.refresh_from_db()
+        self.assertEqual(claim.response, response.json())
+        self.assertGreater(claim.created_at, stale)
+
+    def test_failed_insert_releases_the_key(self):
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.post(key='import-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(key='import-1').status_code, 201)
+
+    def test_response_is_stored_inside_the_insert_transaction(self):
+        def fail_after_storing(user, rows, before_commit=None, **kwargs):
+            with db_transaction.atomic():
+                before_commit([])
+                self.assertIsNotNone(IdempotencyKey.objects.get(key='import-1').response)
+                raise RuntimeError('commit failed')
+
+        with mock.patch.object(api, 'bulk_create_transactions', side_effect=fail_after_storing):
+            with self.assertRaises(RuntimeError):
+                self.post(key='import-1')
+        # a retry inserts the rows instead of replaying a response for rows that were never committed
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(key='import-1').status_code, 201)
+
+
+
+class SavingsGoalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('saver', password='pass')
+
+    def create_goal(self, current_amount='0.00'):
+        return SavingsGoal.objects.create(
+            user=self.user, name='Laptop', target_amount=Decimal('1000.00'),
+            current_amount=Decimal(current_amount), target_date=date(2030, 1, 1),
+        )
+
+    def test_contributions_must_be_finite_and_positive(self):
+        goal = self.create_goal()
+        self.client.force_login(self.user)
+        for amount in ['NaN', 'sNaN', 'Infinity', '-Infinity', 'abc', '', '-5', '0']:
+            response = self.client.post(reverse('contribute_to_goal', args=[goal.pk]), {'amount': amount})
+            self.assertRedirects(response, reverse('savings_goals'), fetch_redirect_response=False)
+        self.client.post(reverse('contribute_to_goal', args=[goal.pk]), {'amount': '12.50'})
+        goal.refresh_from_db()
+        self.assertEqual(goal.current_amount, Decimal('12.50'))
+        self.assertEqual(list(goal.contributions.values_list('amount', flat=True)), [Decimal('12.50')])
+
+    def test_goal_created_with_savings_opens_its_ledger(self):
+        goal = self.create_goal('250.00')
+        goal.add_contribution('50.00')
+        self.assertEqual(goal.current_amount, Decimal('300.00'))
+        self.assertEqual(sum(goal.contributions.values_list('amount', flat=True)), goal.current_amount)
+        self.assertFalse(self.create_goal().contributions.exists())
+
+    def test_projections_are_cached_per_home_currency(self):
+        self.create_goal()
+        with mock.patch.object(projections, 'compute_projections', wraps=projections.compute_projections) as compute:
+            projections.get_projections(self.user.pk)
+            projections.get_projections(self.user.pk)
+            self.assertEqual(compute.call_count, 1)
+            profile = self.user.userprofile
+            profile.currency = 'EUR'
+            profile.save()
+            projections.get_projections(self.user.pk)
+            self.assertEqual(compute.call_count, 2)
+
+
+class AdvisorViewTests(TestCase):
+
+    def test_body_must_be_an_object_with_a_message(self):
+        self.client.force_login(User.objects.create_user('asker', password='pass'))
+        for body in ['[1, 2]', '"hello"', '42', 'null', '{"message": 5}', '{"message": ""}', '{']:
+            with self.subTest(body=body), override_settings(THROTTLES={'ai_advisor': {
+                **settings.THROTTLES['ai_advisor'], 'capacity': 100,
+            }}):
+                response = self.client.post(reverse('ai_advisor'), body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+
+class AdvisorQueueTests(TestCase):
+
+    def test_claims_can_be_limited_to_some_users(self):
+        mine, theirs = (User.objects.create_user(name, password='pass') for name in ('mine', 'theirs'))
+        theirs_job = advisor.enqueue(theirs, 'Queued first')
+        advisor.enqueue(mine, 'Queued second')
+        self.assertEqual(advisor.claim_next_job([mine.pk]).user, mine)
+        self.assertIsNone(advisor.claim_next_job([mine.pk]))
+        self.assertEqual(advisor.claim_next_job().pk, theirs_job.pk)
+
+    def test_model_calls_wait_for_a_free_slot(self):
+        user = User.objects.create_user('busy', password='pass')
+        self.addCleanup(cache.delete, 'walletstatus:throttle:ai_advisor:calls:global')
+        self.addCleanup(throttling.forget_user, 'ai_advisor', user.pk)
+        advisor.enqueue(user, 'How much can I spend?')
+        with mock.patch.object(advisor, 'get_completion', return_value='Less.') as complete:
+            with throttling.call_slots('ai_advisor', user.pk) as held:
+                self.assertTrue(held)
+                self.assertTrue(cache.get('walletstatus:throttle:ai_advisor:calls:global'))
+                job = advisor.process_job(advisor.claim_next_job())
+                self.assertEqual((job.status, job.attempts), ('pending', 0))
+                self.assertGreater(job.run_after, timezone.now())
+                complete.assert_not_called()
+            AdvisorJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            job = advisor.process_job(advisor.claim_next_job())
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(throttling.get_metrics('ai_advisor')['calls_in_flight'], 0)
+
+
+class AdvisorContextTests(TestCase):
+
+    def ask(self, user, message, conversation_id=None):
+        job = advisor.enqueue(user, message, conversation_id=conversation_id)
+        job.attempts = 1
+        with mock.patch.object(advisor, 'get_completion', return_value='Save more.'):
+            advisor.process_job(job)
+        return job.conversation_id
+
+    def test_live_turns_store_changes_and_read_back_in_full(self):
+        user = User.objects.create_user('advised', password='pass')
+        conversation_id = self.ask(user, 'First question')
+        self.ask(user, 'Second question', conversation_id)
+        UserProfile.objects.filter(user=user).update(currency='EUR')
+        profiles.invalidate(user.pk)
+        self.ask(user, 'Third question', conversation_id)
+
+        stored = list(AIConversation.objects.filter(conversation_id=conversation_id).order_by('created_at')
+                      .values_list('context_data', flat=True))
+        self.assertEqual(stored[0]['currency'], 'USD')
+        self.assertEqual(stored[1], {})
+        self.assertEqual(stored[2], {'currency': 'EUR'})
+
+        expected = [{**stored[0]}, {**stored[0]}, {**stored[0], 'currency': 'EUR'}]
+        turns = retention.load_turns(user, conversation_id)
+        self.assertEqual([turn['context_data'] for turn in turns], expected)
+
+        archived = retention.archive_chunk([(user.pk, conversation_id)], 'gzip')
+        self.assertEqual(archived, 3)
+        turns = retention.load_turns(user, conversation_id)
+        self.assertEqual([turn['context_data'] for turn in turns], expected)
+
+class ProfileTests(TestCase):
+
+    def test_migration_creates_missing_profiles(self):
+        backfill = import_module('walletstatus.migrations.0017_create_missing_profiles')
+        user = User.objects.create_user('legacy', password='pass')
+        kept = User.objects.create_user('current', password='pass').userprofile
+        UserProfile.objects.filter(user=user).delete()
+        with self.assertRaises(UserProfile.DoesNotExist):
+            profiles.get_profile(user.pk)
+
+        backfill.create_missing_profiles(django_apps, None)
+        self.assertEqual(profiles.get_profile(user.pk).user_type, 'other')
+        self.assertEqual(UserProfile.objects.get(user__username='current').pk, kept.pk)
+
+
+class DashboardViewTests(TransactionTestCase):
+    """The async views read on pool threads, which only see committed rows"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='pass')
+        UserProfile.objects.filter(user=self.user).update(user_type='student')
+        today = date.today()
+        groceries = Category.objects.create(name='Groceries', category_type='expense')
+        Transaction.objects.create(
+            user=self.user, amount=Decimal('1500.00'), transaction_type='income', description='Stipend', date=today,
+        )
+        Transaction.objects.create(
+            user=self.user, amount=Decimal('42.50'), transaction_type='expense', description='Weekly shop',
+            category=groceries, date=today,
+        )
+        Budget.objects.create(
+            user=self.user, category=groceries, amount=Decimal('200.00'),
+            start_date=today.replace(day=1), end_date=today + timedelta(days=30),
+        )
+        SavingsGoal.objects.create(
+            user=self.user, name='New laptop', target_amount=Decimal('900.00'), target_date=today + timedelta(days=90),
+        )
+        JobOpportunity.objects.create(
+            title='Remote tutor', company='Acme', description='', requirements='',
+            employment_type='part_time', experience_level='entry', is_remote=True, is_student_friendly=True,
+            application_url='https://example.com/apply', posted_date=today,
+        )
+        self.client.force_login(self.user)
+
+    def test_dashboard_renders_every_panel(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['monthly_income'], Decimal('1500.00'))
+        self.assertEqual(response.context['net_income'], Decimal('1457.50'))
+        for text in ['Weekly shop', 'Groceries', 'New laptop', 'Remote tutor']:
+            self.assertContains(response, text)
+
+    def test_panels_render_on_their_own(self):
+        expected = {
+            'transactions': 'Weekly shop', 'budgets': 'Groceries', 'goals': 'New laptop', 'jobs': 'Remote tutor',
+        }
+        for panel, text in expected.items():
+            with self.subTest(panel=panel):
+                response = self.client.get(reverse('dashboard_panel', args=[panel]))
+                self.assertContains(response, text)
+                self.assertTemplateUsed(response, f'partials/dashboard_{panel}.html')
+        self.assertEqual(self.client.get(reverse('dashboard_panel', args=['unknown'])).status_code, 404)
+
+    def test_analytics_groups_expenses_by_category(self):
+        # the history covers the months before this one
+        last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        Transaction.objects.create(
+            user=self.user, amount=Decimal('250.00'), transaction_type='income', description='Refund', date=last_month,
+        )
+        response = self.client.get(reverse('analytics'))
+        self.assertEqual(response.status_code, 200)
+        [spending] = response.context['monthly_expenses_by_category']
+        self.assertEqual((spending['category__name'], spending['total']), ('Groceries', Decimal('42.50')))
+        self.assertContains(response, 'Groceries')
+        history = json.loads(response.context['monthly_data'])
+        self.assertEqual(
+            history[-1], {'month': f'{last_month:%Y-%m}', 'income': 250.0, 'expenses': 0.0, 'net': 250.0},
+        )
+
+
+class JobApplicationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', password='pass')
+        UserProfile.objects.filter(user=cls.user).update(user_type='student')
+        cls.job = JobOpportunity.objects.create(
+            title='Remote tutor', company='Acme', description='', requirements='',
+            employment_type='part_time', experience_level='entry', is_remote=True, is_student_friendly=True,
+            application_url='https://example.com/apply', posted_date=date.today(),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_partial_apply_returns_the_panel_without_queueing_messages(self):
+        response = self.client.post(reverse('apply_to_job', args=[self.job.pk]), HTTP_HX_REQUEST='true')
+        self.assertContains(response, 'Applied')
+        self.assertEqual(list(get_messages(response.wsgi_request)), [])
+        self.assertTrue(UserJobApplication.objects.filter(user=self.user, job=self.job).exists())
+
+    def test_full_apply_redirects_with_a_message(self):
+        response = self.client.post(reverse('apply_to_job', args=[self.job.pk]))
+        self.assertRedirects(response, reverse('job_opportunities'), fetch_redirect_response=False)
+        self.assertEqual(len(get_messages(response.wsgi_request)), 1)
+
+
+class ReceiptTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def png(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_uploads_are_checked_by_content_not_declared_type(self):
+        for data, content_type in [
+            (b'<script>alert(1)</script>', 'image/png'),
+            (self.png()[:60], 'image/png'),
+            (b'%PDF-1.4 not an image', 'image/jpeg'),
+        ]:
+            with self.subTest(data=data[:12]), self.assertRaises(receipts.InvalidReceipt):
+                receipts.store_upload(SimpleUploadedFile('receipt.png', data, content_type))
+        self.assertFalse(Receipt.objects.exists())
+
+        receipt = receipts.store_upload(SimpleUploadedFile('receipt.bin', self.png(), 'application/octet-stream'))
+        self.assertEqual(receipt.status, 'pending')
+        self.assertEqual(receipt.upload_bytes, len(self.png()))
+
+    def test_transient_failures_back_off(self):
+        receipt = receipts.store_upload(SimpleUploadedFile('receipt.png', self.png(), 'image/png'))
+        claimed = receipts.claim_next()
+        self.assertEqual(claimed.pk, receipt.pk)
+        with mock.patch.object(receipts, 'render', side_effect=OSError('storage unavailable')):
+            receipts.process(claimed)
+        receipt.refresh_from_db()
+        self.assertEqual((receipt.status, receipt.attempts), ('pending', 1))
+        self.assertGreater(receipt.run_after, timezone.now())
+        self.assertIsNone(receipts.claim_next())
+
+        Receipt.objects.filter(pk=receipt.pk).update(run_after=timezone.now())
+        receipts.process(receipts.claim_next())
+        receipt.refresh_from_db()
+        self.assertEqual((receipt.status, receipt.attempts), ('ready', 2))
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reporting views read a second SQLite file, synced from the primary by sync_replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        # connections.settings is settings.DATABASES, so this also makes replica_configured() true;
+        # the alias is added after the runner has set up its databases, which would try to create it
+        settings.DATABASES[REPLICA_ALIAS] = {
+            **settings.DATABASES['default'], 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+        }
+        cls.databases = {*cls.databases, REPLICA_ALIAS}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del settings.DATABASES[REPLICA_ALIAS]
+        cls.databases = cls.databases - {REPLICA_ALIAS}
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pass')
+        self.client.force_login(self.user)
+        self.record('Before sync')
+        call_command('sync_replica', stdout=io.StringIO())
+
+    def record(self, description):
+        return Transaction.objects.create(
+            user=self.user, amount=Decimal('4.20'), transaction_type='expense',
+            description=description, date=date.today(),
+        )
+
+    def panel(self):
+        response = self.client.get(reverse('dashboard_panel', args=['transactions']))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_reads_inside_use_replica_go_to_the_replica_file(self):
+        self.record('After sync')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        with use_replica():
+            self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+            self.assertEqual(router.db_for_write(Transaction), 'default')
+
+    def test_reporting_view_reads_the_replica(self):
+        self.record('After sync')
+        content = self.panel()
+        self.assertIn('Before sync', content)
+        self.assertNotIn('After sync', content)
+
+    def test_write_pins_reads_to_the_primary(self):
+        response = self.client.post(reverse('add_transaction'), {
+            'amount': '7.50', 'currency': 'USD', 'transaction_type': 'expense',
+            'description': 'Just added', 'date': date.today().isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertIn('Just added', self.panel())
+
+        # once the window has passed, reads go back to the replica
+        self.client.cookies[STICKY_COOKIE] = str(time.time() - 1)
+        self.assertNotIn('Just added', self.panel())
+
+    def test_sync_replica_copies_the_primary(self):
+        self.record('After sync')
+        call_command('sync_replica', stdout=io.StringIO())
+        with use_replica():
+            self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertIn('After sync', self.panel())
+
+    def test_sync_replica_needs_a_replica(self):
+        replica = settings.DATABASES.pop(REPLICA_ALIAS)
+        try:
+            with self.assertRaises(CommandError):
+                call_command('sync_replica')
+        finally:
+            settings.DATABASES[REPLICA_ALIAS] = replica
+
+
+SHARDS = ['shard0', 'shard1']
+
+
+@override_settings(SHARD_ALIASES=SHARDS, TRANSACTION_SHARDS=SHARDS)
+class ShardingTests(TransactionTestCase):
+    """Transactions partitioned over two more SQLite files, queried from pool threads"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        # added after the runner has set up its databases, as for the replica above
+        cls.databases = {*cls.databases, *SHARDS}
+        for alias in SHARDS:
+            settings.DATABASES[alias] = {
+                **settings.DATABASES['default'], 'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3'),
+                # pool threads let go of the files after each query
+                'CONN_MAX_AGE': 0,
+            }
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del settings.DATABASES[alias]
+        cls.databases = cls.databases - set(SHARDS)
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        # the first user the ring puts on each shard
+        self.users = {}
+        while len(self.users) < len(SHARDS):
+            user = User.objects.create_user(f'user{User.objects.count()}', password='pass')
+            self.users.setdefault(shards.shard_for(user.pk), user)
+
+    def record(self, user, amount, day=1, **fields):
+        fields.setdefault('description', f'Spent {amount}')
+        return Transaction.objects.create(
+            user=user, amount=Decimal(amount), transaction_type='expense', date=date(2025, 3, day), **fields,
+        )
+
+    def stored(self, alias, user_id):
+        return set(Transaction.objects.using(alias).filter(user_id=user_id).values_list('transaction_id', flat=True))
+
+    def test_queries_and_saves_follow_the_user(self):
+        for alias, user in self.users.items():
+            self.assertEqual(Transaction.objects.filter(user=user).db, alias)
+            self.assertEqual(Transaction.objects.filter(user_id=user.pk).db, alias)
+            row = Transaction(user=user, amount=Decimal('3.00'), transaction_type='expense',
+                              description='Bus', date=date(2025, 3, 1))
+            row.save()
+            self.assertEqual(row._state.db, alias)
+            row.description = 'Train'
+            row.save()
+            self.assertEqual(self.stored(alias, user.pk), {row.transaction_id})
+            self.assertEqual(list(Transaction.objects.filter(user=user).values_list('description', flat=True)),
+                             ['Train'])
+        self.assertFalse(Transaction.objects.using('default').exists())
+
+    def test_across_shards_matches_a_single_database(self):
+        amounts = ['5.00', '12.50', '3.25', '40.00', '7.75', '19.99']
+        users = list(self.users.values())
+        for day, amount in enumerate(amounts, start=1):
+            self.record(users[day % 2], amount, day=day)
+        for alias, user in self.users.items():
+            self.assertEqual(len(self.stored(alias, user.pk)), 3)
+
+        everything = Transaction.objects.across_shards()
+        self.assertEqual(everything.count(), 6)
+        self.assertEqual(everything.filter(amount__gt=10).count(), 3)
+        self.assertTrue(everything.filter(amount=Decimal('3.25')).exists())
+        self.assertEqual(everything.aggregate(
+            total=Sum('amount_minor'), rows=Count('id'), low=Min('amount'), last=Max('date'),
+        ), {'total': 8849, 'rows': 6, 'low': Decimal('3.25'), 'last': date(2025, 3, 6)})
+        with self.assertRaises(NotImplementedError):
+            everything.aggregate(Count('user', distinct=True))
+
+        # default ordering is newest first
+        self.assertEqual([row.date.day for row in everything.all()], [6, 5, 4, 3, 2, 1])
+        largest = sorted((Decimal(amount) for amount in amounts), reverse=True)
+        by_amount = everything.order_by('-amount')
+        self.assertEqual([row.amount for row in by_amount], largest)
+        self.assertEqual([row.amount for row in by_amount[1:4]], largest[1:4])
+        self.assertEqual(everything.order_by('-amount')[1:4].count(), 3)
+        self.assertEqual(everything[4:].count(), 2)
+        self.assertEqual(list(everything.order_by('amount').values_list('amount', flat=True)[:2]), largest[:-3:-1])
+        self.assertEqual(list(everything.values_list('currency', flat=True).distinct()), ['USD'])
+
+        # without across_shards() a query that names no user stays on default
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_each_database_draws_ids_from_its_own_block(self):
+        for alias, user in self.users.items():
+            first = self.record(user, '1.00')
+            shards.reserve_ids(alias)
+            second = self.record(user, '2.00')
+            base = shards.id_base(alias)
+            self.assertGreater(first.pk, base)
+            self.assertLess(second.pk, base + shards.ID_BLOCK)
+            self.assertGreater(second.pk, first.pk)
+        self.assertEqual(len(set(Transaction.objects.across_shards().values_list('pk', flat=True))), 4)
+
+    def test_move_can_be_rerun_after_a_crash(self):
+        user = self.users['shard0']
+        expected = {self.record(user, amount).transaction_id for amount in ['1.00', '2.00', '3.00']}
+        with mock.patch.object(shards, 'pin', side_effect=RuntimeError('worker died')):
+            with self.assertRaises(RuntimeError):
+                shards.move_user(user.pk, 'shard0', 'shard1', batch_size=2)
+        # copied, but neither routed to the copies nor dropped
+        self.assertEqual(self.stored('shard1', user.pk), expected)
+        self.assertEqual(self.stored('shard0', user.pk), expected)
+        self.assertEqual(shards.shard_for(user.pk), 'shard0')
+
+        shards.move_user(user.pk, 'shard0', 'shard1', batch_size=2)
+        self.assertEqual(self.stored('shard1', user.pk), expected)
+        self.assertEqual(self.stored('shard0', user.pk), set())
+        self.assertEqual(ShardPlacement.objects.get(user=user).alias, 'shard1')
+        self.assertEqual(shards.shard_for(user.pk), 'shard1')
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 3)
+
+        # moving back to where the ring puts the user drops the pin
+        shards.move_user(user.pk, 'shard1', 'shard0')
+        self.assertFalse(ShardPlacement.objects.exists())
+        self.assertEqual(self.stored('shard0', user.pk), expected)
+        self.assertEqual(self.stored('shard1', user.pk), set())
+
+    def test_rebalance_finishes_an_interrupted_run(self):
+        user = self.users['shard0']
+        shards.pin(user.pk, 'shard1')
+        expected = {self.record(user, amount).transaction_id for amount in ['1.00', '2.00']}
+        self.assertEqual(self.stored('shard1', user.pk), expected)
+
+        with mock.patch.object(shards, 'pin', side_effect=RuntimeError('worker died')):
+            with self.assertRaises(RuntimeError):
+                call_command('rebalance_shards', stdout=io.StringIO())
+        self.assertEqual(self.stored('shard0', user.pk), expected)
+        self.assertEqual(shards.shard_for(user.pk), 'shard1')
+
+        out = io.StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 1 user(s)', out.getvalue())
+        self.assertEqual(self.stored('shard0', user.pk), expected)
+        self.assertEqual(self.stored('shard1', user.pk), set())
+        self.assertFalse(ShardPlacement.objects.exists())
+
+        out = io.StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 0 user(s), 0 transaction(s); released 0 pin(s)', out.getvalue())
+
+    def test_deletes_reach_every_shard(self):
+        category = Category.objects.create(name='Food', category_type='expense')
+        receipt = Receipt.objects.create(sha256='0' * 64)
+        for user in self.users.values():
+            self.record(user, '9.99', category=category, receipt=receipt)
+            self.record(user, '1.99', category=category)
+        everything = Transaction.objects.across_shards()
+
+        category.delete()
+        self.assertEqual(everything.filter(category__isnull=True).count(), 4)
+        receipt.delete()
+        self.assertEqual(everything.filter(receipt__isnull=True).count(), 4)
+
+        leaving, staying = self.users['shard0'], self.users['shard1']
+        leaving_id = leaving.pk
+        leaving.delete()
+        self.assertEqual(self.stored('shard0', leaving_id), set())
+        self.assertEqual(set(everything.values_list('user_id', flat=True)), {staying.pk})
+
+    def test_admin_search_by_username_still_spans_every_shard(self):
+        owner, other = self.users['shard0'], self.users['shard1']
+        self.record(owner, '4.00', description='Groceries')
+        self.record(other, '6.00', description=f'Paid {owner.username} back')
+        self.record(other, '8.00', description='Cinema')
+
+        request = RequestFactory().get('/admin/walletstatus/transaction/')
+        request.user = User.objects.create_superuser('admin', password='pass')
+        model_admin = site._registry[Transaction]
+        matches, _ = model_admin.get_search_results(request, model_admin.get_queryset(request), owner.username)
+        self.assertEqual(sorted(row.description for row in matches), ['Groceries', f'Paid {owner.username} back'])
+        self.assertEqual({row._state.db for row in matches}, set(SHARDS))
+        self.assertEqual(matches.count(), 2)
+
+
+class DuplicateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('careful', password='pass')
+
+    def record(self, description='Coffee', amount='3.50', day=1):
+        return Transaction.objects.create(
+            user=self.user, amount=Decimal(amount), transaction_type='expense', description=description,
+            date=date(2025, 3, day),
+        )
+
+    def test_fingerprint_normalization(self):
+        day = date(2025, 3, 1)
+        same = fingerprint(day, Decimal('12.50'), 'USD', 'coffee starbucks')
+        for when, amount, description in [
+            ('2025-03-01', '12.5', 'Coffee @ Starbucks!!'),
+            (day, Decimal('12.495'), '  COFFEE\tstarbucks '),
+            (day, 12.5, 'coffee-starbucks'),
+        ]:
+            with self.subTest(date=when, amount=amount, description=description):
+                self.assertEqual(fingerprint(when, amount, 'USD', description), same)
+        self.assertNotEqual(fingerprint(day, '12.51', 'USD', 'coffee starbucks'), same)
+        self.assertNotEqual(fingerprint(day, '12.50', 'EUR', 'coffee starbucks'), same)
+        self.assertNotEqual(fingerprint(date(2025, 3, 2), '12.50', 'USD', 'coffee starbucks'), same)
+        self.assertNotEqual(fingerprint(day, '12.50', 'USD', 'coffee starbucks 2'), same)
+        self.assertEqual(normalize(None), '')
+        self.assertEqual(normalize('Café #12'), 'caf 12')
+        self.assertEqual(self.record('Coffee!').fingerprint, fingerprint(date(2025, 3, 1), '3.50', 'USD', 'coffee'))
+
+    def test_recorded_rows_are_counted(self):
+        self.record()
+        self.record()
+        rows = [Transaction(user=self.user, fingerprint=fingerprint(date(2025, 3, 1), '3.50', 'USD', 'coffee'),
+                            date=date(2025, 3, 1)) for _ in range(3)]
+        rows.append(Transaction(user=self.user, fingerprint=fingerprint(date(2025, 3, 2), '3.50', 'USD', 'coffee'),
+                                date=date(2025, 3, 2)))
+        self.assertEqual(find_duplicates(self.user, rows), [True, True, False, False])
+        self.assertEqual(find_duplicates(self.user, []), [])
+
+    def test_add_transaction_asks_before_recording_a_repeat(self):
+        self.record()
+        self.client.force_login(self.user)
+        form = {
+            'amount': '3.5', 'currency': 'USD', 'transaction_type': 'expense', 'description': 'coffee.',
+            'date': '2025-03-01',
+        }
+        response = self.client.post(reverse('add_transaction'), form)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'allow_duplicate')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+
+        response = self.client.post(reverse('add_transaction'), {**form, 'allow_duplicate': '1'})
+        self.assertRedirects(response, reverse('transactions'), fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_import_skips_recorded_rows_unless_allowed(self):
+        self.record()
+        self.client.force_login(self.user)
+        rows = [
+            {'amount': '3.50', 'transaction_type': 'expense', 'description': 'COFFEE', 'date': '2025-03-01'},
+            {'amount': '3.50', 'transaction_type': 'expense', 'description': 'Coffee', 'date': '2025-03-01'},
+        ]
+        url = reverse('api_bulk_transactions')
+        response = self.client.post(url, rows, content_type='application/json')
+        self.assertEqual((response.json()['created'], response.json()['skipped_duplicates']), (1, 1))
+        response = self.client.post(url, rows, content_type='application/json')
+        self.assertEqual((response.json()['created'], response.json()['skipped_duplicates']), (0, 2))
+        response = self.client.post(f'{url}?allow_duplicates=true', rows, content_type='application/json')
+        self.assertEqual((response.json()['created'], response.json()['skipped_duplicates']), (2, 0))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 4)
+
+
+class SpendingStatsTests(TestCase):
+
+    series = [1200, 950, 1310, 800, 1720, 1000, 1105]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('spender', password='pass')
+        cls.category = Category.objects.create(name='Groceries', category_type='expense')
+
+    def record(self, amount_minor, day=1, **fields):
+        return Transaction.objects.create(
+            user=self.user, amount=from_minor(amount_minor), transaction_type='expense', category=self.category,
+            description=f'Groceries {amount_minor}', date=date(2025, 3, day), **fields,
+        )
+
+    def stats(self):
+        return SpendingStats.objects.get(user=self.user, category=self.category, currency='USD')
+
+    def assertMatches(self, stats, values):
+        self.assertEqual(stats.count, len(values))
+        self.assertAlmostEqual(stats.mean, np.mean(values))
+        self.assertAlmostEqual(stats.m2 / (stats.count - 1), np.var(values, ddof=1), places=4)
+
+    def test_running_updates_match_numpy(self):
+        stats = SpendingStats(count=0, mean=0, m2=0, ewma=0)
+        ewma = self.series[0]
+        for value in self.series:
+            anomalies.add(stats, value)
+            ewma = settings.ANOMALY_EWMA_ALPHA * value + (1 - settings.ANOMALY_EWMA_ALPHA) * ewma
+        self.assertMatches(stats, self.series)
+        self.assertAlmostEqual(stats.ewma, ewma)
+
+        anomalies.remove(stats, self.series[2])
+        self.assertMatches(stats, self.series[:2] + self.series[3:])
+
+        first, second = SpendingStats(count=0, mean=0, m2=0, ewma=0), SpendingStats(count=0, mean=0, m2=0, ewma=0)
+        for value in self.series[:3]:
+            anomalies.add(first, value)
+        for value in self.series[3:]:
+            anomalies.add(second, value)
+        anomalies.merge(first, second)
+        self.assertMatches(first, self.series)
+
+    def test_backfill_matches_the_streaming_statistics(self):
+        for day, value in enumerate(self.series, start=1):
+            self.record(value, day)
+        streamed = self.stats()
+        self.assertMatches(streamed, self.series)
+        self.assertEqual(anomalies.backfill([self.user.pk]), (1, len(self.series)))
+        rebuilt = self.stats()
+        self.assertMatches(rebuilt, self.series)
+        self.assertAlmostEqual(rebuilt.ewma, streamed.ewma)
+
+    def test_flags_expenses_past_the_threshold_once_there_is_history(self):
+        # far above, but too little history to tell
+        self.record(1000, 1)
+        self.record(9000, 2)
+        self.assertFalse(SpendingAnomaly.objects.exists())
+        SpendingStats.objects.all().delete()
+
+        for day in range(1, settings.ANOMALY_MIN_COUNT + 1):
+            self.record(1000, day)
+        # identical amounts: the spread is taken as 10% of the mean, so +9% is ordinary and +40% is not
+        self.record(1090, 10)
+        self.assertFalse(SpendingAnomaly.objects.exists())
+        flagged = self.record(1400, 11)
+        anomaly = SpendingAnomaly.objects.get()
+        self.assertEqual(anomaly.transaction_id, flagged.transaction_id)
+        self.assertGreater(anomaly.score, settings.ANOMALY_Z_THRESHOLD)
+
+    def test_edits_and_deletes_take_the_old_amount_back_out(self):
+        rows = [self.record(value, day) for day, value in enumerate(self.series, start=1)]
+        values = list(self.series)
+
+        rows[1].amount = from_minor(2000)
+        rows[1].save()
+        values[1] = 2000
+        self.assertMatches(self.stats(), values)
+
+        before = self.stats()
+        rows[2].description = 'Renamed'
+        rows[2].save()
+        self.assertEqual((self.stats().count, self.stats().mean, self.stats().m2), (before.count, before.mean, before.m2))
+
+        rows[3].transaction_type = 'income'
+        rows[3].save()
+        del values[3]
+        self.assertMatches(self.stats(), values)
+
+        rows[4].delete()
+        values.remove(self.series[4])
+        self.assertMatches(self.stats(), values)
+
+    def test_deleting_a_flagged_expense_drops_its_flag(self):
+        for day in range(1, settings.ANOMALY_MIN_COUNT + 1):
+            self.record(1000, day)
+        flagged = self.record(5000, 10)
+        self.assertTrue(SpendingAnomaly.objects.filter(transaction_id=flagged.transaction_id).exists())
+        flagged.delete()
+        self.assertFalse(SpendingAnomaly.objects.exists())
+        self.assertMatches(self.stats(), [1000] * settings.ANOMALY_MIN_COUNT)
+
+
+class StatementTests(TestCase):
+
+    march = date(2025, 3, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reporter', password='pass')
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def record(self, description, day=5, user=None):
+        return Transaction.objects.create(
+            user=user or self.user, amount=Decimal('25.00'), transaction_type='expense', description=description,
+            date=self.march.replace(day=day),
+        )
+
+    def generate(self):
+        return statements.generate(self.march, user_ids=[self.user.pk], workers=0)
+
+    def csv(self):
+        with Statement.objects.get(user=self.user, month=self.march).csv_file.open('rb') as f:
+            return f.read().decode()
+
+    def test_rerun_skips_unchanged_months(self):
+        row = self.record('Books')
+        out = io.StringIO()
+        call_command('generate_statements', '--month', '2025-03', '--workers', '0', '--user', 'reporter', stdout=out)
+        self.assertIn('wrote 1 statement(s), skipped 0', out.getvalue())
+        self.assertIn('Books', self.csv())
+        self.assertEqual(self.generate(), (0, 1))
+
+        first = Statement.objects.get(user=self.user).csv_file.name
+        row.description = 'Textbooks'
+        row.save()
+        self.assertEqual(self.generate(), (1, 0))
+        self.assertIn('Textbooks', self.csv())
+        self.assertFalse(default_storage.exists(first))
+
+    def test_month_emptied_by_deletes_is_regenerated(self):
+        row = self.record('Books')
+        self.generate()
+        row.delete()
+        self.assertEqual(self.generate(), (1, 0))
+        statement = Statement.objects.get(user=self.user)
+        self.assertEqual(statement.transaction_count, 0)
+        self.assertNotIn('Books', self.csv())
+
+    def test_users_deleted_during_a_run_are_skipped(self):
+        self.record('Books')
+        # rows of a user deleted after the grouped query read them
+        Transaction.objects.bulk_create([Transaction(
+            user_id=self.user.pk + 1000, amount=Decimal('1.00'), amount_minor=100, transaction_type='expense',
+            description='Orphan', date=self.march,
+        )])
+        self.assertEqual(statements.generate_chunk([self.user.pk, self.user.pk + 1000], self.march), (1, 1))
+        self.assertEqual(Statement.objects.get().user, self.user)
+
+    def test_download_is_limited_to_the_owner(self):
+        self.record('Books')
+        self.generate()
+        url = reverse('statement_download', args=[2025, 3, 'csv'])
+        self.client.force_login(User.objects.create_user('snoop', password='pass'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Books', b''.join(response.streaming_content))
+        response.close()
+        self.assertEqual(self.client.get(reverse('statement_download', args=[2025, 3, 'xlsx'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('statement_download', args=[2025, 4, 'csv'])).status_code, 404)
+
+
+class CategorizerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.food = Category.objects.create(name='Food', category_type='expense')
+        cls.transport = Category.objects.create(name='Transport', category_type='expense')
+        cls.salary = Category.objects.create(name='Salary', category_type='income')
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.newcomer = User.objects.create_user('newcomer', password='pass')
+        history = [
+            ('Starbucks coffee', cls.food), ('Whole foods market', cls.food), ('Corner cafe coffee', cls.food),
+            ('Uber trip', cls.transport), ('Metro card reload', cls.transport), ('Uber ride home', cls.transport),
+            ('Monthly salary', cls.salary),
+        ]
+        for description, category in history:
+            Transaction.objects.create(
+                user=cls.owner, amount=Decimal('10.00'), transaction_type=category.category_type,
+                category=category, description=description, date=date(2025, 3, 1),
+            )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'categorizer.npz')
+        paths = override_settings(CATEGORIZER_MODEL_PATH=self.path, CATEGORIZER_GLOBAL_REFRESH=0)
+        paths.enable()
+        self.addCleanup(paths.disable)
+        # a worker that has not seen any model yet
+        self.categorizer = Categorizer()
+        for module in (api, views):
+            patcher = mock.patch.object(module, 'categorizer', self.categorizer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_own_history_is_used_until_the_global_model_is_trained(self):
+        self.assertEqual(self.categorizer.suggest(self.owner.pk, 'coffee', '', 'expense')[0], self.food.pk)
+        self.assertEqual(self.categorizer.suggest(self.newcomer.pk, 'coffee', '', 'expense'), (None, 0.0))
+
+    def test_global_model_is_trained_offline_and_loaded_on_change(self):
+        call_command('train_categorizer', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(self.path))
+        self.client.force_login(self.newcomer)
+        with mock.patch.object(Categorizer, 'train_global', side_effect=AssertionError('trained on a request')):
+            response = self.client.get(reverse('suggest_category'), {
+                'description': 'Uber to the airport', 'transaction_type': 'expense',
+            })
+            self.assertEqual(response.json()['category_id'], self.transport.pk)
+            self.assertEqual(self.categorizer.suggest(self.newcomer.pk, 'monthly salary', '', 'income')[0],
+                             self.salary.pk)
+
+    def test_suggestions_keep_to_the_transaction_type(self):
+        self.assertEqual(self.categorizer.suggest(self.owner.pk, 'monthly coffee', '', 'income')[0], self.salary.pk)
+        self.assertNotEqual(self.categorizer.suggest(self.owner.pk, 'monthly salary', '', 'expense')[0],
+                            self.salary.pk)
+
+    def test_import_fills_confident_categories_and_does_not_train_on_them(self):
+        call_command('train_categorizer', stdout=io.StringIO())
+        self.client.force_login(self.newcomer)
+        response = self.client.post(reverse('api_bulk_transactions'), [
+            {'amount': '4.50', 'transaction_type': 'expense', 'description': 'Starbucks coffee', 'date': '2025-03-02'},
+            {'amount': '9.00', 'transaction_type': 'expense', 'description': 'Uber trip', 'date': '2025-03-02',
+             'category': self.food.pk},
+            {'amount': '1.00', 'transaction_type': 'expense', 'description': 'Something else', 'date': '2025-03-02'},
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        rows = {row.description: row for row in Transaction.objects.filter(user=self.newcomer)}
+        self.assertEqual((rows['Starbucks coffee'].category_id, rows['Starbucks coffee'].category_auto),
+                         (self.food.pk, True))
+        self.assertEqual((rows['Uber trip'].category_id, rows['Uber trip'].category_auto), (self.food.pk, False))
+        self.assertEqual((rows['Something else'].category_id, rows['Something else'].category_auto), (None, False))
+        # the owner's seven rows and the one chosen by hand
+        self.assertEqual(Categorizer().train_global().docs.sum(), 8)
+
+
+class ExchangeRateTests(TestCase):
+
+    def load(self, text):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'rates.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        call_command('load_fx_rates', path, stdout=io.StringIO())
+
+    def test_loads_the_sample_rates(self):
+        call_command('load_fx_rates', os.path.join(settings.BASE_DIR, 'walletstatus', 'fixtures', 'fx_rates_sample.csv'),
+                     stdout=io.StringIO())
+        self.assertTrue(ExchangeRate.objects.filter(currency='EUR').exists())
+        self.assertFalse(ExchangeRate.objects.filter(per_usd__lte=0).exists())
+
+    def test_rejects_rates_that_are_not_positive_numbers(self):
+        for value in ['0', '-1.25', 'NaN', 'sNaN', 'Infinity', '-Infinity', 'abc', '']:
+            with self.subTest(value=value), self.assertRaisesMessage(CommandError, 'Line 3'):
+                self.load(f'date,currency,per_usd\n2025-01-01,EUR,0.9\n2025-01-02,EUR,{value}\n')
+        with self.assertRaisesMessage(CommandError, 'Line 2'):
+            self.load('date,currency,per_usd\n2025-01-01,EUR\n')
+        self.assertFalse(ExchangeRate.objects.exists())
+
+    def test_convert_minor(self):
+        self.load('date,currency,per_usd\n2025-01-01,EUR,0.9\n2025-01-10,EUR,0.8\n')
+        self.assertEqual(fx.convert_minor([1234], ['EUR'], [date(2025, 1, 5)], 'EUR').tolist(), [1234])
+        # no rate on the 5th: the latest one before it applies
+        self.assertEqual(fx.convert_minor(
+            [1000, 1000, 1000], ['USD', 'USD', 'EUR'], [date(2025, 1, 5), date(2025, 1, 10), date(2025, 1, 12)], 'EUR',
+        ).tolist(), [900, 800, 1000])
+        self.assertEqual(fx.convert_minor([1000], ['EUR'], [date(2025, 1, 12)], 'USD').tolist(), [1250])
+        with self.assertLogs('walletstatus.fx', 'WARNING'):
+            self.assertEqual(fx.convert_minor([1000], ['XYZ'], [date(2025, 1, 5)], 'USD').tolist(), [1000])
+
+
+class ThrottlingTests(SimpleTestCase):
+
+    def test_slot_counter_lives_while_slots_are_taken(self):
+        key = 'walletstatus:throttle:tests:inflight'
+        self.addCleanup(cache.delete, key)
+        with mock.patch('time.time') as now:
+            now.return_value = 1000.0
+            self.assertTrue(acquire_slot(key, 2, ttl=10))
+            now.return_value = 1008.0
+            self.assertTrue(acquire_slot(key, 2, ttl=10))
+            # past the first acquire's expiry, with both slots still held
+            now.return_value = 1015.0
+            self.assertFalse(acquire_slot(key, 2, ttl=10))
+            release_slot(key)
+            self.assertTrue(acquire_slot(key, 2, ttl=10))
+            # a counter left by a dead worker still expires
+            now.return_value = 1030.0
+            self.assertIsNone(cache.get(key))
@@ -0,0 +1,160 @@
+"""Rate limiting and concurrency caps for expensive endpoints.
+
+State lives in the Django cache so limits hold across worker processes when
+CACHES points at a shared backend. The token bucket tolerates the small race
+between get and set; the concurrency slots rely on the atomic ``incr``.
+
+``throttle`` caps the requests a view is handling; work the view hands to a
+queue is capped where it runs, with ``call_slots``.
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+KEY_PREFIX = 'walletstatus:throttle'
+METRIC_NAMES = ('allowed', 'rate_limited', 'user_concurrency_limited', 'global_concurrency_limited')
+
+
+def _key(*parts):
+    return ':'.join((KEY_PREFIX,) + tuple(str(p) for p in parts))
+
+
+def take_token(key, capacity, refill_per_second, now=None):
+    """Take one token from the bucket at ``key``.
+    
+    Returns (allowed, retry_after_seconds).
+    """
+    now = time.time() if now is None else now
+    tokens, updated = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+    timeout = int(capacity / refill_per_second) + 1
+    if tokens >= 1:
+        cache.set(key, (tokens - 1, now), timeout)
+        return True, 0
+    cache.set(key, (tokens, now), timeout)
+    return False, (1 - tokens) / refill_per_second
+
+
+def acquire_slot(key, limit, ttl):
+    """Take one of ``limit`` concurrent slots; the counter expires ``ttl`` after the last acquire in case a worker dies"""
+    cache.add(key, 0, ttl)
+    try:
+        in_flight = cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, ttl)
+        in_flight = 1
+    else:
+        # incr keeps the expiry set by add, which would drop the count of a busy key mid-flight
+        cache.touch(key, ttl)
+    if in_flight > limit:
+        release_slot(key)
+        return False
+    return True
+
+
+def release_slot(key):
+    try:
+        cache.decr(key)
+    except ValueError:
+        pass
+
+
+@contextmanager
+def call_slots(scope, user_id):
+    """Hold one of the per-user and one of the global slots of settings.THROTTLES[scope] for the block.
+
+    These are counted apart from the view's slots, around the calls the
+    queued work makes. Yields False, holding neither, when either cap is reached.
+    """
+    config = settings.THROTTLES[scope]
+    user_slot = _key(scope, 'calls', 'user', user_id)
+    global_slot = _key(scope, 'calls', 'global')
+    if not acquire_slot(user_slot, config['max_concurrent_per_user'], config['slot_ttl']):
+        yield False
+        return
+    if not acquire_slot(global_slot, config['max_concurrent_global'], config['slot_ttl']):
+        release_slot(user_slot)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        release_slot(global_slot)
+        release_slot(user_slot)
+
+
+def forget_user(scope, user_id):
+    """Drop the token bucket and concurrency counters of ``user_id``"""
+    cache.delete_many([
+        _key(scope, 'bucket', user_id), _key(scope, 'inflight', 'user', user_id), _key(scope, 'calls', 'user', user_id),
+    ])
+
+
+def record(scope, metric):
+    key = _key(scope, 'metrics', metric)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_metrics(scope):
+    """Counters for monitoring: decisions so far plus current global in-flight requests and calls"""
+    metrics = {name: cache.get(_key(scope, 'metrics', name), 0) for name in METRIC_NAMES}
+    metrics['in_flight'] = max(cache.get(_key(scope, 'inflight', 'global'), 0), 0)
+    metrics['calls_in_flight'] = max(cache.get(_key(scope, 'calls', 'global'), 0), 0)
+    return metrics
+
+
+def too_many_requests(message, retry_after):
+    response = JsonResponse({'success': False, 'error': message}, status=429)
+    response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def throttle(scope):
+    """Apply settings.THROTTLES[scope] to POST requests of the decorated view.
+    
+    The config holds ``capacity`` and ``refill_per_second`` for the per-user
+    token bucket, ``max_concurrent_per_user`` and ``max_concurrent_global``
+    for the semaphores, and ``slot_ttl`` for their safety expiry.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST':
+                return view_func(request, *args, **kwargs)
+            
+            config = settings.THROTTLES[scope]
+            user_id = request.user.pk
+            
+            allowed, retry_after = take_token(
+                _key(scope, 'bucket', user_id), config['capacity'], config['refill_per_second']
+            )
+            if not allowed:
+                record(scope, 'rate_limited')
+                return too_many_requests('Too many requests, please slow down.', retry_after)
+            
+            user_slot = _key(scope, 'inflight', 'user', user_id)
+            global_slot = _key(scope, 'inflight', 'global')
+            if not acquire_slot(user_slot, config['max_concurrent_per_user'], config['slot_ttl']):
+                record(scope, 'user_concurrency_limited')
+                return too_many_requests('A previous request is still being processed.', 1)
+            if not acquire_slot(global_slot, config['max_concurrent_global'], config['slot_ttl']):
+                release_slot(user_slot)
+                record(scope, 'global_concurrency_limited')
+                return too_many_requests('The service is busy, please retry shortly.', 1)
+            
+            record(scope, 'allowed')
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                release_slot(global_slot)
+                release_slot(user_slot)
+        return wrapper
+    return decorator
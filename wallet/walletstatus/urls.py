@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api
 
 urlpatterns = [
     # Authentication
@@ -8,19 +8,24 @@ urlpatterns = [
     # Main dashboard
     path('', views.dashboard, name='dashboard'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/panels/<slug:panel>/', views.dashboard_panel, name='dashboard_panel'),
     
     # Profile management
     path('profile/', views.profile_setup, name='profile_setup'),
     
     # Transaction management
     path('transactions/', views.transactions, name='transactions'),
+    path('transactions/suggest-category/', views.suggest_category, name='suggest_category'),
     path('add-transaction/', views.add_transaction, name='add_transaction'),
+    path('api/transactions/bulk/', api.BulkTransactionView.as_view(), name='api_bulk_transactions'),
     
     # Budget management
     path('budgets/', views.budgets, name='budgets'),
     
     # Savings goals
     path('savings-goals/', views.savings_goals, name='savings_goals'),
+    path('savings-goals/<int:goal_id>/contribute/', views.contribute_to_goal, name='contribute_to_goal'),
+    path('savings-goals/<int:goal_id>/progress/', views.goal_progress, name='goal_progress'),
     
     # Job opportunities (for students)
     path('jobs/', views.job_opportunities, name='job_opportunities'),
@@ -29,9 +34,14 @@ urlpatterns = [
     
     # AI Financial Advisor
     path('ai-advisor/', views.ai_financial_advisor, name='ai_advisor'),
+    path('ai-advisor/result/<uuid:job_id>/', views.ai_advisor_result, name='ai_advisor_result'),
+    path('ai-advisor/history/<uuid:conversation_id>/', views.ai_advisor_history, name='ai_advisor_history'),
+    path('ai-advisor/metrics/', views.ai_advisor_metrics, name='ai_advisor_metrics'),
     
     # Analytics and reports
     path('analytics/', views.analytics, name='analytics'),
+    path('analytics/heatmap/', views.spending_heatmap, name='spending_heatmap'),
+    path('statements/<int:year>/<int:month>.<str:fmt>', views.statement_download, name='statement_download'),
 
     path('logout/', views.logged_out, name='logout'),  # Logout view
 ]
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""Pinned third-party front-end assets.
+
+``manage.py vendor_static`` downloads them into ``static/vendor/``, from
+where they are served like any other static file. Until it has been run,
+templates fall back to the same pinned builds on their CDNs.
+"""
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+CHART_JS = 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist'
+
+# Pinned third-party assets, by path under static/vendor/
+ASSETS = {
+    'bootstrap/css/bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'bootstrap/js/bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    'chartjs/chart.umd.js': f'{CHART_JS}/chart.umd.js',
+    **{
+        f'fontawesome/webfonts/{font}.{ext}': f'{FONT_AWESOME}/webfonts/{font}.{ext}'
+        for font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+        for ext in ('woff2', 'ttf')
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def vendored(path):
+    """Whether ``vendor_static`` has put ``path`` under static/vendor/"""
+    return finders.find(f'vendor/{path}') is not None
+
+
+def asset_url(path):
+    """The local copy of the pinned asset at ``path``, or its CDN URL until it is vendored"""
+    return static(f'vendor/{path}') if vendored(path) else ASSETS[path]
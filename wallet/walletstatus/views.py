@@ -1,28 +1,45 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.db.models import Sum, Q, Count
 from django.conf import settings
 from datetime import datetime, date, timedelta
+import asyncio
 import json
-import openai
-import requests
+import os
+import re
+import uuid
 from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+from django.views.static import serve
 
 from .models import (
-    UserProfile, Transaction, Category, Budget, SavingsGoal, 
-    JobOpportunity, UserJobApplication, AIConversation
+    Transaction, Budget, SavingsGoal, 
+    JobOpportunity, UserJobApplication, AIConversation, AdvisorJob, Statement
 )
-
-# Initialize OpenAI
-openai.api_key = settings.OPENAI_API_KEY
+from . import advisor, aio, anomalies, fragments, fx, heatmap, projections, receipts, statements
+from .categorizer import categorizer
+from .duplicates import fingerprint
+from .money import minor_sum, from_minor
+from .registry import categories as category_registry
+from .routers import read_from_replica
+from .retention import load_turns
+from .throttling import throttle, get_metrics
 
 def register(request):
     """User registration view"""
@@ -30,7 +47,6 @@ def register(request):
         form = UserCreationForm(request.POST)
         if form.is_valid():
             user = form.save()
-            UserProfile.objects.create(user=user)
             username = form.cleaned_data.get('username')
             messages.success(request, f'Account created for {username}!')
             return redirect('login')
@@ -38,44 +54,122 @@ def register(request):
         form = UserCreationForm()
     return render(request, 'registration/register.html', {'form': form})
 
-@login_required
-def dashboard(request):
-    """Enhanced dashboard with financial overview"""
-    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-    
-    # Financial overview calculations
+def monthly_totals(user, currency):
+    """This month's income and expenses of ``user`` in cents of ``currency``"""
     current_month = date.today().replace(day=1)
     next_month = (current_month + timedelta(days=32)).replace(day=1)
     
-    # Monthly income and expenses
-    monthly_income = Transaction.objects.filter(
-        user=request.user,
-        transaction_type='income',
-        date__gte=current_month,
-        date__lt=next_month
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_expenses = Transaction.objects.filter(
-        user=request.user,
-        transaction_type='expense',
+    # A single aggregate per (currency, day) converted in one vectorized pass
+    daily = fx.convert_rows(Transaction.objects.filter(
+        user=user,
         date__gte=current_month,
         date__lt=next_month
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    # Recent transactions
-    recent_transactions = Transaction.objects.filter(user=request.user)[:10]
+    ).values('currency', 'date').annotate(
+        income=minor_sum(transaction_type='income'),
+        expenses=minor_sum(transaction_type='expense'),
+    ).order_by(), currency, ['income', 'expenses'])
+    return {
+        'income': sum(row['income'] for row in daily),
+        'expenses': sum(row['expenses'] for row in daily),
+    }
+
+def panel_state(user_id, user_profile):
+    """Versions of the cached panels, and the panels whose fragment is missing.
+    
+    The fragment keys mirror the vary_on arguments of the panels' {% cache %} tags.
+    """
+    versions = fragments.panel_versions(user_id)
+    keys = {
+        panel: make_template_fragment_key(
+            f'dashboard_{panel}', [user_id, user_profile.user_type, version] if panel == 'jobs' else [user_id, version]
+        )
+        for panel, version in versions.items()
+    }
+    cached = cache.get_many(keys.values())
+    return versions, [panel for panel, key in keys.items() if key not in cached]
+
+def prefetch(context):
+    """Evaluate a panel's lazy querysets now instead of while its template renders"""
+    for value in context.values():
+        if isinstance(value, (QuerySet, SimpleLazyObject)):
+            len(value)
+    return context
+
+@login_required
+@read_from_replica
+async def dashboard(request):
+    """Enhanced dashboard with financial overview.
+    
+    The monthly totals, recent transactions and any panel whose cached
+    fragment is stale are independent, so they are read concurrently.
+    """
+    # the panel builders read request.user; reuse the user already loaded
+    request.user = user = await request.auser()
+    user_profile = await request.aprofile()
+    panel_versions, stale = await aio.read(panel_state, user.pk, user_profile)
     
-    # Active budgets with usage
-    active_budgets = Budget.objects.filter(
-        user=request.user, 
-        is_active=True,
-        start_date__lte=date.today(),
-        end_date__gte=date.today()
+    context = {
+        'user_profile': user_profile,
+        'panel_versions': panel_versions,
+        'fragment_timeout': settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT,
+    }
+    panels = {name: build_panel(request, user_profile) for name, build_panel in DASHBOARD_PANELS.items()}
+    totals, *_ = await asyncio.gather(
+        aio.read(monthly_totals, user, user_profile.currency),
+        aio.read(prefetch, panels['transactions']),
+        *[aio.read(prefetch, panels[panel]) for panel in stale],
+    )
+    for panel_context in panels.values():
+        context.update(panel_context)
+    context.update(
+        monthly_income=from_minor(totals['income']),
+        monthly_expenses=from_minor(totals['expenses']),
+        net_income=from_minor(totals['income'] - totals['expenses']),
     )
     
-    # Savings goals
-    savings_goals = SavingsGoal.objects.filter(user=request.user, status='active')
-    
+    return await sync_to_async(render)(request, 'dashboard.html', context)
+
+@login_required
+@read_from_replica
+def dashboard_panel(request, panel):
+    """A single dashboard panel, rendered with only its own queries"""
+    if panel not in DASHBOARD_PANELS:
+        raise Http404('Unknown panel')
+    return render_panel(request, panel)
+
+def render_panel(request, panel):
+    context = DASHBOARD_PANELS[panel](request, request.profile)
+    if panel in fragments.CACHED_PANELS:
+        context['panel_versions'] = {panel: fragments.panel_version(panel, request.user.pk)}
+        context['fragment_timeout'] = settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT
+    return render(request, f'partials/dashboard_{panel}.html', context)
+
+def is_partial(request):
+    """True for in-place refreshes, which only need the affected panel back"""
+    return request.headers.get('HX-Request') == 'true'
+
+def transactions_panel(request, user_profile):
+    return {
+        'recent_transactions': SimpleLazyObject(
+            lambda: anomalies.attach(category_registry.attach(list(Transaction.objects.filter(user=request.user)[:10])))
+        ),
+    }
+
+def budgets_panel(request, user_profile):
+    # Active budgets with usage; only loaded when the cached panel is stale
+    return {
+        'active_budgets': SimpleLazyObject(lambda: category_registry.attach(list(Budget.objects.filter(
+            user=request.user, 
+            is_active=True,
+            start_date__lte=date.today(),
+            end_date__gte=date.today()
+        )))),
+    }
+
+def goals_panel(request, user_profile):
+    return {'savings_goals': SavingsGoal.objects.filter(user=request.user, status='active')}
+
+def jobs_panel(request, user_profile):
     # Job recommendations for students
     job_recommendations = []
     if user_profile.user_type == 'student':
@@ -83,24 +177,26 @@ def dashboard(request):
             Q(is_student_friendly=True) | Q(experience_level='entry'),
             is_remote=True
         )[:5]
-    
-    context = {
+    return {
         'user_profile': user_profile,
-        'monthly_income': monthly_income,
-        'monthly_expenses': monthly_expenses,
-        'net_income': monthly_income - monthly_expenses,
-        'recent_transactions': recent_transactions,
-        'active_budgets': active_budgets,
-        'savings_goals': savings_goals,
         'job_recommendations': job_recommendations,
+        'applied_job_ids': SimpleLazyObject(lambda: set(
+            UserJobApplication.objects.filter(user=request.user).values_list('job_id', flat=True)
+        )),
     }
-    
-    return render(request, 'dashboard.html', context)
+
+# Dashboard panels by name, each with its own partial template (partials/dashboard_<name>.html)
+DASHBOARD_PANELS = {
+    'transactions': transactions_panel,
+    'budgets': budgets_panel,
+    'goals': goals_panel,
+    'jobs': jobs_panel,
+}
 
 @login_required
 def profile_setup(request):
     """User profile setup/edit"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.profile
     
     if request.method == 'POST':
         profile.user_type = request.POST.get('user_type', 'other')
@@ -121,12 +217,19 @@ def profile_setup(request):
 @login_required
 def add_transaction(request):
     """Add new transaction"""
-    categories = Category.objects.all().order_by('category_type', 'name')
+    context = {
+        'categories': category_registry.filter(),
+        'currencies': fx.CURRENCY_CHOICES,
+    }
     
     if request.method == 'POST':
+        currency = request.POST.get('currency')
+        if currency not in dict(fx.CURRENCY_CHOICES):
+            currency = fx.home_currency(request.user.pk)
         transaction = Transaction(
             user=request.user,
             amount=Decimal(request.POST.get('amount')),
+            currency=currency,
             transaction_type=request.POST.get('transaction_type'),
             description=request.POST.get('description'),
             date=request.POST.get('date'),
@@ -136,18 +239,47 @@ def add_transaction(request):
         
         category_id = request.POST.get('category')
         if category_id:
-            transaction.category = Category.objects.get(id=category_id)
+            transaction.category = category_registry.get(category_id)
+        
+        # catch double submits and re-entered transactions; the user can confirm a real repeat
+        if not request.POST.get('allow_duplicate'):
+            duplicate = Transaction.objects.filter(
+                user=request.user,
+                fingerprint=fingerprint(transaction.date, transaction.amount, currency, transaction.description),
+            ).first()
+            if duplicate is not None:
+                messages.warning(request, 'An identical transaction is already recorded for this date.')
+                return render(request, 'add_transaction.html', {**context, 'form': request.POST, 'duplicate_of': duplicate})
+        
+        if request.FILES.get('receipt'):
+            try:
+                transaction.receipt = receipts.store_upload(request.FILES['receipt'])
+            except receipts.InvalidReceipt as e:
+                messages.error(request, str(e))
+                return render(request, 'add_transaction.html', {**context, 'form': request.POST})
         
         transaction.save()
         messages.success(request, 'Transaction added successfully!')
         return redirect('transactions')
     
-    return render(request, 'add_transaction.html', {'categories': categories})
+    return render(request, 'add_transaction.html', context)
+
+@login_required
+def suggest_category(request):
+    """Suggest a category for the transaction being typed, from the in-memory categorizer"""
+    category_id, confidence = categorizer.suggest(
+        request.user.pk,
+        request.GET.get('description', ''),
+        request.GET.get('location', ''),
+        request.GET.get('transaction_type', ''),
+    )
+    return JsonResponse({'category_id': category_id, 'confidence': round(confidence, 3)})
 
 @login_required
 def transactions(request):
     """View all transactions with filtering"""
-    transaction_list = Transaction.objects.filter(user=request.user)
+    # prefetched rather than joined: receipts stay on default when transactions are sharded
+    transaction_list = Transaction.objects.filter(user=request.user).prefetch_related('receipt')
     
     # Apply filters
     transaction_type = request.GET.get('type')
@@ -168,12 +300,10 @@ def transactions(request):
     paginator = Paginator(transaction_list, 20)
     page_number = request.GET.get('page')
     transactions_page = paginator.get_page(page_number)
-    
-    categories = Category.objects.all()
+    category_registry.attach(transactions_page)
     
     context = {
         'transactions': transactions_page,
-        'categories': categories,
         'filters': {
             'type': transaction_type,
             'category': category_id,
@@ -181,19 +311,25 @@ def transactions(request):
             'date_to': date_to,
         }
     }
+    if is_partial(request):
+        return render(request, 'partials/transaction_list.html', context)
     
+    context['categories'] = category_registry.all()
     return render(request, 'transactions.html', context)
 
 @login_required
 def budgets(request):
     """Budget management"""
-    user_budgets = Budget.objects.filter(user=request.user)
-    categories = Category.objects.filter(category_type='expense')
+    user_budgets = category_registry.attach(list(Budget.objects.filter(user=request.user)))
+    categories = category_registry.filter('expense')
     
     if request.method == 'POST':
+        category = category_registry.get(request.POST.get('category'))
+        if category is None:
+            raise Http404('Category not found')
         budget = Budget(
             user=request.user,
-            category=Category.objects.get(id=request.POST.get('category')),
+            category=category,
             amount=Decimal(request.POST.get('amount')),
             period=request.POST.get('period'),
             start_date=request.POST.get('start_date'),
@@ -211,7 +347,7 @@ def budgets(request):
 @login_required
 def savings_goals(request):
     """Savings goals management"""
-    goals = SavingsGoal.objects.filter(user=request.user)
+    goals = projections.attach(list(SavingsGoal.objects.filter(user=request.user)))
     
     if request.method == 'POST':
         goal = SavingsGoal(
@@ -228,10 +364,39 @@ def savings_goals(request):
     
     return render(request, 'savings_goals.html', {'goals': goals})
 
+@login_required
+@require_http_methods(["POST"])
+def contribute_to_goal(request, goal_id):
+    """Add money to a savings goal through the contribution ledger"""
+    goal = get_object_or_404(SavingsGoal, id=goal_id, user=request.user)
+    try:
+        amount = Decimal(request.POST.get('amount', ''))
+        if not amount.is_finite():
+            raise ArithmeticError('NaN and Infinity are not amounts')
+    except ArithmeticError:
+        amount = Decimal('0')
+    if amount <= 0:
+        messages.error(request, 'Enter a positive contribution amount.')
+        return redirect('savings_goals')
+    
+    goal.add_contribution(amount, note=request.POST.get('note', ''))
+    messages.success(request, f'Added {amount} to {goal.name}!')
+    return redirect('savings_goals')
+
+@login_required
+def goal_progress(request, goal_id):
+    """Cumulative progress of a goal over time, for charts"""
+    goal = get_object_or_404(SavingsGoal, id=goal_id, user=request.user)
+    return JsonResponse({
+        'goal': goal.name,
+        'target_amount': float(goal.target_amount),
+        'series': [{'date': day.isoformat(), 'amount': float(total)} for day, total in goal.progress_series()],
+    })
+
 @login_required
 def job_opportunities(request):
     """Job opportunities for students"""
-    user_profile = get_object_or_404(UserProfile, user=request.user)
+    user_profile = request.profile
     
     # Base query for remote jobs
     jobs = JobOpportunity.objects.filter(is_remote=True)
@@ -277,6 +442,7 @@ def job_opportunities(request):
         'search_query': search_query,
         'employment_type': employment_type,
         'experience_level': experience_level,
+        'user_profile': user_profile,
         'is_student': user_profile.user_type == 'student',
     }
     
@@ -294,11 +460,14 @@ def apply_to_job(request, job_id):
         defaults={'status': 'interested'}
     )
     
+    if is_partial(request):
+        # the panel shows the job as applied; a queued message would only pop up on a later page
+        return render_panel(request, 'jobs')
+    
     if created:
         messages.success(request, f'Added {job.title} to your applications!')
     else:
         messages.info(request, 'You have already applied to this job.')
-    
     return redirect('job_opportunities')
 
 @login_required
@@ -310,137 +479,186 @@ def my_applications(request):
 
 @csrf_exempt
 @login_required
+@throttle('ai_advisor')
 def ai_financial_advisor(request):
-    """AI-powered financial advisor using OpenAI"""
+    """AI-powered financial advisor; POST queues the question for the advisor worker"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            user_message = data.get('message', '')
-            conversation_type = data.get('type', 'general')
-            
-            # Gather user's financial context
-            user_profile = UserProfile.objects.get(user=request.user)
-            
-            # Get recent financial data for context
-            recent_transactions = Transaction.objects.filter(user=request.user)[:10]
-            active_budgets = Budget.objects.filter(user=request.user, is_active=True)
-            savings_goals = SavingsGoal.objects.filter(user=request.user, status='active')
-            
-            # Prepare context for AI
-            financial_context = {
-                'user_type': user_profile.user_type,
-                'monthly_income': float(user_profile.monthly_income),
-                'currency': user_profile.currency,
-                'savings_percentage': user_profile.preferred_savings_percentage,
-                'recent_transactions_count': recent_transactions.count(),
-                'active_budgets_count': active_budgets.count(),
-                'savings_goals_count': savings_goals.count(),
-            }
-            
-            # Create AI prompt
-            system_prompt = f"""You are a helpful financial advisor AI. The user is a {user_profile.get_user_type_display()} 
-            with a monthly income of {user_profile.monthly_income} {user_profile.currency}. 
-            They prefer to save {user_profile.preferred_savings_percentage}% of their income.
-            
-            They have {recent_transactions.count()} recent transactions, {active_budgets.count()} active budgets, 
-            and {savings_goals.count()} savings goals.
-            
-            Provide practical, personalized financial advice. Be concise but helpful. 
-            If they're a student, also consider recommending ways to increase income through part-time work or skills development."""
-            
-            # Call OpenAI API
-            response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-            # Save conversation
-            conversation = AIConversation.objects.create(
-                user=request.user,
-                conversation_type=conversation_type,
-                user_message=user_message,
-                ai_response=ai_response,
-                context_data=financial_context
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'response': ai_response,
-                'conversation_id': str(conversation.conversation_id)
-            })
-            
-        except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'error': f'Error getting AI response: {str(e)}'
-            })
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON body.'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Expected a JSON object.'}, status=400)
+        user_message = data.get('message', '')
+        if not user_message or not isinstance(user_message, str):
+            return JsonResponse({'success': False, 'error': 'Message is required.'}, status=400)
+        
+        conversation_id = data.get('conversation_id')
+        if conversation_id:
+            try:
+                conversation_id = uuid.UUID(str(conversation_id))
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'Invalid conversation_id.'}, status=400)
+        
+        job = advisor.enqueue(request.user, user_message, data.get('type', 'general'), conversation_id)
+        
+        return JsonResponse({
+            'success': True,
+            'status': job.status,
+            'conversation_id': str(job.conversation_id),
+            'job_id': str(job.job_id),
+            'result_url': reverse('ai_advisor_result', args=[job.job_id]),
+        }, status=202)
     
     # GET request - show AI chat interface
     recent_conversations = AIConversation.objects.filter(user=request.user)[:10]
     return render(request, 'ai_advisor.html', {'recent_conversations': recent_conversations})
 
 @login_required
-def analytics(request):
-    """Financial analytics and insights"""
-    user = request.user
-    
-    # Monthly spending by category
-    current_month = date.today().replace(day=1)
-    next_month = (current_month + timedelta(days=32)).replace(day=1)
-    
-    monthly_expenses_by_category = Transaction.objects.filter(
+def ai_advisor_result(request, job_id):
+    """Poll the status of a queued advisor request"""
+    job = get_object_or_404(AdvisorJob, job_id=job_id, user=request.user)
+    return JsonResponse({
+        'success': job.status != 'failed',
+        'status': job.status,
+        'conversation_id': str(job.conversation_id),
+        'response': job.ai_response,
+        'error': job.error if job.status == 'failed' else '',
+    })
+
+@login_required
+def ai_advisor_history(request, conversation_id):
+    """Full history of a conversation, including turns moved to the archive"""
+    turns = load_turns(request.user, conversation_id)
+    if not turns:
+        raise Http404('Conversation not found')
+    return JsonResponse({
+        'conversation_id': str(conversation_id),
+        'turns': [
+            {
+                'conversation_type': turn['conversation_type'],
+                'user_message': turn['user_message'],
+                'ai_response': turn['ai_response'],
+                'created_at': turn['created_at'].isoformat(),
+            }
+            for turn in turns
+        ],
+    })
+
+@staff_member_required
+def ai_advisor_metrics(request):
+    """Throttling counters for monitoring"""
+    return JsonResponse(get_metrics('ai_advisor'))
+
+def category_spending(user, currency, start, end):
+    """Expenses of ``user`` between ``start`` and ``end`` per category, largest first"""
+    category_rows = fx.convert_rows(Transaction.objects.filter(
         user=user,
         transaction_type='expense',
-        date__gte=current_month,
-        date__lt=next_month
-    ).values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')
-    
-    # Income vs Expenses over time (last 6 months)
-    six_months_ago = current_month - timedelta(days=180)
+        date__gte=start,
+        date__lt=end
+    ).values('category_id', 'currency', 'date').annotate(
+        total_minor=minor_sum()
+    ).order_by(), currency, ['total_minor'])
+    category_totals = {}
+    for row in category_rows:
+        category_totals[row['category_id']] = category_totals.get(row['category_id'], 0) + row['total_minor']
+    spending = []
+    for category_id, total_minor in sorted(category_totals.items(), key=lambda item: -item[1]):
+        category = category_registry.get(category_id)
+        spending.append({
+            'category_id': category_id,
+            'category__name': category.name if category else None,
+            'total': from_minor(total_minor),
+        })
+    return spending
+
+def monthly_history(user, currency, start, end):
+    """Income, expenses and net per month from ``start`` up to ``end``"""
+    # One grouped query for the whole range instead of two aggregates per month;
+    # rows are per (currency, day) so they can be converted to the home currency
+    monthly_totals = {}
+    for row in fx.convert_rows(Transaction.objects.filter(
+        user=user,
+        date__gte=start,
+        date__lt=end
+    ).values('currency', 'date').annotate(
+        income=minor_sum(transaction_type='income'),
+        expenses=minor_sum(transaction_type='expense'),
+    ).order_by(), currency, ['income', 'expenses']):
+        month = monthly_totals.setdefault(row['date'].strftime('%Y-%m'), {'income': 0, 'expenses': 0})
+        month['income'] += row['income']
+        month['expenses'] += row['expenses']
     
     monthly_data = []
-    current_date = six_months_ago
-    while current_date < current_month:
-        next_date = (current_date + timedelta(days=32)).replace(day=1)
-        
-        income = Transaction.objects.filter(
-            user=user,
-            transaction_type='income',
-            date__gte=current_date,
-            date__lt=next_date
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        expenses = Transaction.objects.filter(
-            user=user,
-            transaction_type='expense',
-            date__gte=current_date,
-            date__lt=next_date
-        ).aggregate(total=Sum('amount'))['total'] or 0
+    current_date = start
+    while current_date < end:
+        month = current_date.strftime('%Y-%m')
+        income = monthly_totals.get(month, {}).get('income', 0)
+        expenses = monthly_totals.get(month, {}).get('expenses', 0)
         
         monthly_data.append({
-            'month': current_date.strftime('%Y-%m'),
-            'income': float(income),
-            'expenses': float(expenses),
-            'net': float(income - expenses)
+            'month': month,
+            'income': income / 100,
+            'expenses': expenses / 100,
+            'net': (income - expenses) / 100
         })
         
-        current_date = next_date
+        current_date = (current_date + timedelta(days=32)).replace(day=1)
+    return monthly_data
+
+@login_required
+@read_from_replica
+async def analytics(request):
+    """Financial analytics and insights"""
+    user = await request.auser()
+    current_month = date.today().replace(day=1)
+    next_month = (current_month + timedelta(days=32)).replace(day=1)
+    six_months_ago = current_month - timedelta(days=180)
+    
+    home = await aio.read(fx.home_currency, user.pk)
+    # Spending by category this month and income vs expenses over the last six months
+    monthly_expenses_by_category, monthly_data, recent_statements = await asyncio.gather(
+        aio.read(category_spending, user, home, current_month, next_month),
+        aio.read(monthly_history, user, home, six_months_ago, current_month),
+        aio.read(lambda: list(Statement.objects.filter(user=user)[:12])),
+    )
     
     context = {
         'monthly_expenses_by_category': monthly_expenses_by_category,
         'monthly_data': json.dumps(monthly_data),
+        'statements': recent_statements,
     }
     
-    return render(request, 'analytics.html', context)
+    return await sync_to_async(render)(request, 'analytics.html', context)
+
+@login_required
+@read_from_replica
+def spending_heatmap(request):
+    """Daily expenses, income and transaction counts between ?start= and ?end= (default: this year so far)"""
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else date.today()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end.replace(month=1, day=1)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates.'}, status=400)
+    if start > end or end.year - start.year >= heatmap.MAX_YEARS:
+        return JsonResponse({'error': f'start must come before end, at most {heatmap.MAX_YEARS} years apart.'}, status=400)
+    return JsonResponse(heatmap.spending_calendar(request.user.pk, start, end))
+
+@login_required
+def statement_download(request, year, month, fmt):
+    """The signed-in user's statement for a month, as written by ``manage.py generate_statements``"""
+    if fmt not in statements.FORMATS:
+        raise Http404('Unknown format')
+    try:
+        first = date(year, month, 1)
+    except ValueError:
+        raise Http404('No such month')
+    statement = get_object_or_404(Statement, user=request.user, month=first)
+    file = getattr(statement, f'{fmt}_file')
+    if not file:
+        raise Http404('Statement not generated in this format')
+    return FileResponse(file.open('rb'), as_attachment=True, filename=f'statement-{first:%Y-%m}.{fmt}')
 
 def fetch_remote_jobs():
     """Background task to fetch remote jobs from job APIs"""
@@ -503,4 +721,24 @@ def logged_out(request):
     """Handle user logout"""
     logout(request)
     messages.success(request, 'You have been logged out successfully.')
-    return redirect('login')
\ No newline at end of file
+    return redirect('login')
+
+
+HASHED_STATIC_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+def static_asset(request, path):
+    """Serve a collected static file, preferring a precompressed variant"""
+    accepted = request.headers.get('Accept-Encoding', '')
+    name = path
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        # safe_join rejects paths outside STATIC_ROOT (400 Bad Request)
+        if encoding in accepted and os.path.isfile(safe_join(settings.STATIC_ROOT, path + suffix)):
+            name = path + suffix
+            break
+    response = serve(request, name, document_root=settings.STATIC_ROOT)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if HASHED_STATIC_NAME.search(path):
+        # Content-hashed names never change, so clients may keep them for good
+        patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+    return response